@@ -0,0 +1,99 @@
+"""
+Previous album scoring of enrich_with_spotify_data, applied movie by movie, kept as a reference for the equivalence
+test and the benchmark of find_best_matching_album_ids, and the synthetic fixture of album searches they run on (see
+benchmarks.bench_album_scoring for how it is generated)
+"""
+import gzip
+import json
+from os.path import dirname, join
+
+import pandas as pd
+from rapidfuzz import fuzz
+
+from enrich_with_spotify_data import (NEGATIVE_INFLUENCE, NEGATIVE_KEYWORD, NEUTRAL_KEYWORD, POSITIVE_INFLUENCE,
+                                      POSITIVE_KEYWORD)
+
+FIXTURE_PATH = join(dirname(__file__), 'fixtures', 'album_search.json.gz')
+
+
+def count_occurrence_and_return_diff(movie_name: str, query_words: list[str], keyword_list: list[str]) -> tuple[
+    int, list]:
+    """Previous keyword counting of enrich_with_spotify_data, kept as a reference"""
+    words = []
+    count = 0
+    movie_words = movie_name.lower().split()
+    for word in keyword_list:
+        if word not in movie_words:
+            words.append(word)
+            if word in query_words:
+                count += 1
+    return count, words
+
+
+def score_best_matching_albums(albums_df: pd.DataFrame, date: int, name: str, composer: str) -> list[tuple[int, int]]:
+    """Previous scoring of enrich_with_spotify_data, kept as a reference"""
+    score = []
+    for j in range(len(albums_df.values)):
+        artist_bool = False
+        album = albums_df.loc[j]
+
+        if composer:
+            for artist in album["artists"]:
+                if fuzz.ratio(composer, artist["name"]) > 85 or "Various Artists" == artist["name"]:
+                    artist_bool = True
+                    break
+            if not artist_bool:
+                continue
+
+        if date:
+            if not (str(date) in (str(album["release_date"])) or str(int(date) - 1) in (
+                    str(album["release_date"])) or str(int(date) + 1) in (str(album["release_date"]))):
+                continue
+
+        movie_name = name.lower()
+        query_name = album["name"].lower()
+        if not ("(" in movie_name or ")" in movie_name):
+            query_name = query_name.replace("(", "")
+            query_name = query_name.replace(")", "")
+
+        query_words = query_name.split()
+
+        pos_count, positive_words = count_occurrence_and_return_diff(movie_name, query_words, POSITIVE_KEYWORD)
+        neg_count, negative_words = count_occurrence_and_return_diff(movie_name, query_words, NEGATIVE_KEYWORD)
+        neu_count, neutral_words = count_occurrence_and_return_diff(movie_name, query_words, NEUTRAL_KEYWORD)
+
+        to_remove = positive_words + negative_words + neutral_words
+        cleaned_query = [word for word in query_words if word.lower() not in to_remove]
+        result = ' '.join(cleaned_query)
+
+        if not (max(movie_name.split(), key=len) in result):
+            continue
+
+        modifiers = POSITIVE_INFLUENCE ** pos_count * NEGATIVE_INFLUENCE ** neg_count
+        score += [(j, modifiers * fuzz.ratio(movie_name, result))]
+    return score
+
+
+def best_matching_album_ids_reference(albums_per_movie, dates, names, composers) -> list:
+    """Previous selection of the album of each movie in get_album_ids_into_df, kept as a reference"""
+    album_ids = []
+    for albums, date, name, composer in zip(albums_per_movie, dates, names, composers):
+        albums_df = pd.DataFrame(albums)
+        scores = score_best_matching_albums(albums_df, date, name, composer)
+        if len(scores) > 0:
+            best_score = max(scores, key=lambda x: x[1])
+            album_ids.append(albums_df.loc[best_score[0]]["id"])
+        else:
+            album_ids.append(None)
+    return album_ids
+
+
+def load_fixture() -> list[dict]:
+    """The movies of the fixture, with their candidate albums and the album id chosen by the previous implementation"""
+    with gzip.open(FIXTURE_PATH, 'rt') as file:
+        return json.load(file)
+
+
+def fixture_columns(fixture: list[dict]) -> tuple[list, list, list, list]:
+    return ([movie['albums'] for movie in fixture], [movie['date'] for movie in fixture],
+            [movie['name'] for movie in fixture], [movie['composer'] for movie in fixture])
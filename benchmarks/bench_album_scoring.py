@@ -0,0 +1,113 @@
+"""
+Benchmark of enrich_with_spotify_data.find_best_matching_album_ids, compared to the previous
+score_best_matching_albums applied movie by movie. Their equivalence is checked by tests/test_album_scoring.py.
+
+Both run on a synthetic fixture of album searches, not on recorded Spotify responses: the movies of the movie_album
+table, each with candidate albums generated from the ALBUM_NAMES templates to imitate what the Spotify search returns
+(soundtracks, scores, live or remastered versions, video game music, compilations, albums of other artists or released
+other years...). The speedup is therefore measured on this synthetic distribution of candidates, which may differ from
+real search results. The album id chosen by the previous implementation is stored in the fixture.
+
+Run from the root of the repository with: python -m benchmarks.bench_album_scoring
+The fixture is generated again with: python -m benchmarks.bench_album_scoring --generate
+"""
+import gzip
+import json
+import sys
+import time
+
+import numpy as np
+
+from benchmarks.album_scoring_reference import (FIXTURE_PATH, best_matching_album_ids_reference, fixture_columns,
+                                                load_fixture)
+from enrich_with_spotify_data import find_best_matching_album_ids
+from storage import load_movie_albums
+
+FIXTURE_MOVIES = 1_000
+
+ALBUM_NAMES = [
+    '{name} (Original Motion Picture Soundtrack)',
+    '{name} - Original Score',
+    '{name} (Music From The Motion Picture)',
+    '{name}: Original Soundtrack',
+    'Music from {name}',
+    '{name} (Live)',
+    '{name} (Remastered 2015)',
+    '{name} - The Video Game Soundtrack',
+    '{name}, Vol. 2',
+    '{name} Theme',
+    '{name}',
+    'The Best of {composer}',
+    '{first_word}',
+    'Greatest Hits',
+    '{name} (Deluxe Edition) [Bonus Tracks]',
+    'Television Series {name} Season 1 Episode',
+]
+
+
+def _misspell(rng: np.random.Generator, text: str) -> str:
+    """Replace one character of the text"""
+    position = rng.integers(0, len(text))
+    return text[:position] + 'x' + text[position + 1:]
+
+
+def generate_fixture(seed: int = 0):
+    """Generate the synthetic fixture from the movies of the movie_album table, and store the album chosen by the
+    previous implementation for each of them"""
+    rng = np.random.default_rng(seed)
+    movies = load_movie_albums().drop_duplicates(subset=['movie_name', 'composer_name']).head(FIXTURE_MOVIES)
+
+    fixture = []
+    for movie in movies.itertuples():
+        year = int(movie.release_date)
+        albums = []
+        for _ in range(rng.integers(0, 25)):
+            template = ALBUM_NAMES[rng.integers(0, len(ALBUM_NAMES))]
+            name = template.format(name=movie.movie_name, composer=movie.composer_name,
+                                   first_word=movie.movie_name.split()[0])
+            artist = rng.choice([movie.composer_name, _misspell(rng, movie.composer_name), 'Various Artists',
+                                 'London Symphony Orchestra'], p=[0.5, 0.2, 0.15, 0.15])
+            release_year = year + rng.choice([0, 0, 1, -1, 2, 10])
+            release_date = rng.choice([f'{release_year}', f'{release_year}-{rng.integers(1, 13):02d}-01'])
+            albums.append({
+                'id': f'{len(fixture):04d}{len(albums):02d}'.ljust(22, 'A'),
+                'name': name,
+                'release_date': str(release_date),
+                'artists': [{'name': str(artist)}] + ([{'name': 'Hans Zimmer'}] if rng.random() < 0.2 else []),
+            })
+        fixture.append({'name': movie.movie_name, 'date': movie.release_date, 'composer': movie.composer_name,
+                        'albums': albums})
+
+    expected = best_matching_album_ids_reference(*fixture_columns(fixture))
+    for movie, album_id in zip(fixture, expected):
+        movie['expected_album_id'] = album_id
+
+    with gzip.open(FIXTURE_PATH, 'wt') as file:
+        json.dump(fixture, file)
+    print(f'Generated {len(fixture)} movies, {sum(album_id is not None for album_id in expected)} with an album')
+
+
+def timed(func, *args):
+    start_time = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - start_time
+
+
+def run_benchmark():
+    fixture = load_fixture()
+    expected = [movie['expected_album_id'] for movie in fixture]
+    columns = fixture_columns(fixture)
+
+    _, elapsed = timed(find_best_matching_album_ids, *columns)
+    _, reference_elapsed = timed(best_matching_album_ids_reference, *columns)
+
+    nb_albums = sum(len(albums) for albums in columns[0])
+    print(f'{len(fixture)} movies, {nb_albums} albums, {sum(a is not None for a in expected)} matched')
+    print(f'batched: {elapsed:.3f}s, previous: {reference_elapsed:.3f}s, speedup: {reference_elapsed / elapsed:.1f}x')
+
+
+if __name__ == '__main__':
+    if '--generate' in sys.argv:
+        generate_fixture()
+    else:
+        run_benchmark()
@@ -0,0 +1,68 @@
+"""
+Benchmark of the assembly of the Music objects into the albums dataframe of enrich_with_spotify_data, on synthetic
+tracks, comparing the hash join of assign_musics_to_tracks to the previous per-track .loc assignment, which scanned the
+whole track_ids column for every music and was therefore quadratic in the number of tracks.
+
+Run from the root of the repository with: python -m benchmarks.bench_assign_musics
+"""
+import time
+
+import numpy as np
+import pandas as pd
+
+from enrich_with_spotify_data import assign_musics_to_tracks
+from spotify.Music import Music
+
+SIZES = [1_000, 5_000, 10_000, 50_000, 100_000]
+# The previous implementation is too slow to be run on more tracks
+REFERENCE_MAX_SIZE = 10_000
+TRACKS_PER_ALBUM = 12
+
+
+def assign_musics_loc(albums_with_track_ids: pd.DataFrame, musics: dict[str, Music]) -> pd.DataFrame:
+    """Previous assembly of get_music_from_track_ids, kept as a reference"""
+    result = albums_with_track_ids.copy()
+    result['track'] = result.get('track', pd.Series(dtype='object'))
+    for music in musics.values():
+        result.loc[result["track_ids"] == music.id, "track"] = music
+    return result
+
+
+def synthetic_tracks(n: int, seed: int = 0) -> tuple[pd.DataFrame, dict[str, Music]]:
+    """Generate an exploded albums dataframe of n tracks with 22 characters ids, and the musics of 95% of them"""
+    rng = np.random.default_rng(seed)
+    track_ids = [f'{i:022d}' for i in rng.permutation(n)]
+    albums = pd.DataFrame({
+        'album_id': [f'album{i // TRACKS_PER_ALBUM}' for i in range(n)],
+        'track_ids': track_ids,
+    }, index=np.arange(n) // TRACKS_PER_ALBUM)
+
+    found = rng.random(n) < 0.95
+    musics = {track_id: Music(track_id, f'Track {track_id}', [], 'artist', int(rng.integers(0, 100)))
+              for track_id, is_found in zip(track_ids, found) if is_found}
+    return albums, musics
+
+
+def timed(func, *args):
+    start_time = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - start_time
+
+
+def run_benchmark():
+    print(f'{"tracks":>10} {"join (s)":>10} {"us/track":>9} {".loc (s)":>10} {"us/track":>9} {"speedup":>8}')
+    for size in SIZES:
+        albums, musics = synthetic_tracks(size)
+        result, elapsed = timed(assign_musics_to_tracks, albums, musics)
+        line = f'{size:>10} {elapsed:>10.4f} {elapsed / size * 1e6:>9.2f}'
+
+        if size <= REFERENCE_MAX_SIZE:
+            expected, reference_elapsed = timed(assign_musics_loc, albums, musics)
+            pd.testing.assert_frame_equal(result, expected)
+            line += (f' {reference_elapsed:>10.3f} {reference_elapsed / size * 1e6:>9.2f} '
+                     f'{reference_elapsed / elapsed:>7.1f}x')
+        print(line)
+
+
+if __name__ == '__main__':
+    run_benchmark()
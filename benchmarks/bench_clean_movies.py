@@ -0,0 +1,46 @@
+"""
+Benchmark of helpers.clean_movies and helpers.clean_movies_revenue on synthetic data shaped like the CMU
+movie.metadata.tsv, compared to their previous row-wise implementations. Their equivalence is checked by
+tests/test_clean_movies.py.
+
+Run from the root of the repository with: python -m benchmarks.bench_clean_movies
+"""
+import os
+import tempfile
+import time
+
+from benchmarks.clean_movies_reference import (clean_movies_apply, clean_movies_revenue_apply, synthetic_metadata,
+                                               with_tmdb_revenue)
+from helpers import load_movies, clean_movies, clean_movies_revenue
+
+SIZES = [10_000, 100_000]
+
+
+def timed(func, *args):
+    start_time = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - start_time
+
+
+def run_benchmark():
+    print(f'{"rows":>10} {"function":>22} {"new (s)":>8} {"apply (s)":>10} {"speedup":>8}')
+    with tempfile.TemporaryDirectory() as directory:
+        for size in SIZES:
+            path = os.path.join(directory, 'movie.metadata.tsv')
+            synthetic_metadata(path, size)
+            raw_movies = load_movies(path)
+
+            _, elapsed = timed(clean_movies, raw_movies)
+            expected, reference_elapsed = timed(clean_movies_apply, raw_movies)
+            print(f'{size:>10} {"clean_movies":>22} {elapsed:>8.3f} {reference_elapsed:>10.3f} '
+                  f'{reference_elapsed / elapsed:>7.1f}x')
+
+            movies = with_tmdb_revenue(expected)
+            _, elapsed = timed(clean_movies_revenue, movies)
+            _, reference_elapsed = timed(clean_movies_revenue_apply, movies)
+            print(f'{size:>10} {"clean_movies_revenue":>22} {elapsed:>8.3f} {reference_elapsed:>10.3f} '
+                  f'{reference_elapsed / elapsed:>7.1f}x')
+
+
+if __name__ == '__main__':
+    run_benchmark()
@@ -0,0 +1,98 @@
+"""
+Equivalence check and benchmark of question_script.question_helper.extract_composers_data on the enriched movies
+dataset, which gathers the attributes of the composers with records.RecordColumns, compared to its previous
+implementation unpacking every composer with a per-row lambda. Also reports the memory taken by one Composer, slotted
+and frozen, compared to the previous dataclass with a per instance __dict__.
+
+Run from the root of the repository with: python -m benchmarks.bench_composer_columns
+"""
+import time
+import tracemalloc
+from dataclasses import astuple, dataclass, fields
+
+import pandas as pd
+
+from question_script.question_helper import extract_composers_data
+from storage import load_movies_with_composers
+from tmdb.Composer import Composer
+
+NB_INSTANCES = 100_000
+# The dataset is replicated to see how the extraction scales
+REPLICATIONS = [1, 10]
+
+
+@dataclass
+class LegacyComposer:
+    """Previous Composer dataclass, without slots, kept as a reference"""
+    id: str
+    name: str
+    birthday: str = None
+    gender: int = None
+    homepage: str = None
+    place_of_birth: str = None
+    date_first_appearance: str = None
+
+
+def extract_composers_data_lambda(df: pd.DataFrame) -> pd.DataFrame:
+    """Previous implementation of extract_composers_data, kept as a reference"""
+    exploded_df = df.dropna(subset='composers').explode('composers')
+
+    (exploded_df['c_id'], exploded_df['c_name'], exploded_df['c_birthday'], exploded_df['c_gender'],
+     exploded_df['c_homepage'], exploded_df['c_place_of_birth'], exploded_df['c_date_first_appearance']) = \
+        zip(*exploded_df.composers.apply(
+            lambda c: (c.id, c.name, c.birthday, c.gender, c.homepage, c.place_of_birth, c.date_first_appearance)
+        ))
+
+    exploded_df['c_birthday'] = pd.to_datetime(exploded_df.c_birthday)
+    exploded_df['c_date_first_appearance'] = pd.to_datetime(exploded_df.c_date_first_appearance)
+    exploded_df.drop('composers', axis='columns', inplace=True)
+    exploded_df.reset_index(drop=True, inplace=True)
+    return exploded_df
+
+
+def timed(func, *args, repeat: int = 5):
+    """Best time of the repeated calls"""
+    best = float('inf')
+    for _ in range(repeat):
+        start_time = time.perf_counter()
+        result = func(*args)
+        best = min(best, time.perf_counter() - start_time)
+    return result, best
+
+
+def memory_per_instance(record_type: type, records: list) -> float:
+    """Bytes allocated per instance when copying the records as instances of record_type"""
+    tracemalloc.start()
+    copies = [record_type(*values) for values in records]
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    # Only the instances, not the list holding them
+    return (size - 8 * len(copies)) / len(copies)
+
+
+def run_benchmark():
+    movies = load_movies_with_composers()
+    # Distinct instances for every movie, as after unpickling or when freshly requested, instead of shared ones
+    copied = movies.assign(composers=movies['composers'].map(
+        lambda composers: [Composer(*astuple(c)) for c in composers], na_action='ignore'))
+
+    print(f'{"dataset":>16} {"rows":>8} {"columns (s)":>12} {"lambda (s)":>11} {"speedup":>8}')
+    for replication in REPLICATIONS:
+        for name, subset in [(f'movies x{replication}', movies), (f'copies x{replication}', copied)]:
+            subset = pd.concat([subset] * replication, ignore_index=True)
+            result, elapsed = timed(extract_composers_data, subset)
+            expected, reference_elapsed = timed(extract_composers_data_lambda, subset)
+            pd.testing.assert_frame_equal(result, expected)
+            print(f'{name:>16} {len(result):>8} {elapsed:>12.4f} {reference_elapsed:>11.4f} '
+                  f'{reference_elapsed / elapsed:>7.1f}x')
+
+    composers = movies['composers'].dropna().explode().drop_duplicates()
+    values = [astuple(c) for c in composers] * (NB_INSTANCES // len(composers) + 1)
+    values = values[:NB_INSTANCES]
+    slotted, legacy = memory_per_instance(Composer, values), memory_per_instance(LegacyComposer, values)
+    print(f'{len(fields(Composer))} fields composer: slotted {slotted:.0f} bytes, with __dict__ {legacy:.0f} bytes '
+          f'({legacy / slotted:.1f}x)')
+
+
+if __name__ == '__main__':
+    run_benchmark()
@@ -0,0 +1,61 @@
+"""
+Equivalence check and benchmark of question_script.question_helper.load_composers_data, which computes the composers
+table from the parquet tables once and keeps it in memory, compared to calling extract_composers_data on the enriched
+movies for every question, as milestone_3.ipynb used to do.
+
+Run from the root of the repository with: python -m benchmarks.bench_composers_data
+"""
+import time
+
+import pandas as pd
+
+from question_script.question_helper import (MOVIE_COLUMNS, _compute_composers_data, extract_composers_data,
+                                             load_composers_data)
+from storage import load_movies_with_composers
+
+# Columns requested by the questions of the notebook, None for all of them
+QUESTION_COLUMNS = [
+    ['name', 'c_name', 'box_office_revenue'],
+    ['c_birthday', 'c_date_first_appearance'],
+    None,
+    ['release_date', 'c_id', 'c_name', 'box_office_revenue'],
+    ['name', 'c_name', 'c_place_of_birth'],
+    None,
+    None,
+]
+
+
+def timed(func, *args):
+    start_time = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - start_time
+
+
+def extract_for_every_question(movies: pd.DataFrame) -> list[pd.DataFrame]:
+    return [extract_composers_data(movies)[columns] if columns else extract_composers_data(movies)
+            for columns in QUESTION_COLUMNS]
+
+
+def load_for_every_question() -> list[pd.DataFrame]:
+    return [load_composers_data(columns) for columns in QUESTION_COLUMNS]
+
+
+def run_benchmark():
+    # Layout of the enriched movies dataset the notebook used to load
+    movies = load_movies_with_composers()[MOVIE_COLUMNS + ['composers']].astype({'tmdb_id': 'float64'})
+
+    expected, extract_elapsed = timed(extract_for_every_question, movies)
+    _compute_composers_data.cache_clear()
+    result, load_elapsed = timed(load_for_every_question)
+    for result_table, expected_table in zip(result, expected):
+        pd.testing.assert_frame_equal(result_table, expected_table)
+    _, warm_elapsed = timed(load_for_every_question)
+
+    print(f'{len(QUESTION_COLUMNS)} questions on {len(expected[2])} rows:')
+    print(f'\textract_composers_data for every question: {extract_elapsed:.4f}s')
+    print(f'\tload_composers_data, first run: {load_elapsed:.4f}s ({extract_elapsed / load_elapsed:.1f}x)')
+    print(f'\tload_composers_data, cached: {warm_elapsed:.4f}s ({extract_elapsed / warm_elapsed:.1f}x)')
+
+
+if __name__ == '__main__':
+    run_benchmark()
@@ -0,0 +1,57 @@
+"""
+Benchmark of the lightweight export mode of question_script.plotly_graph, compared to the default export embedding the
+whole plotly.js bundle in every html file. It exports the Q3 and Q7 figures and a popularity vs revenue scatter plot
+(without trendline, statsmodels being optional) in both modes, and reports the time taken and the size of the exported
+files, plotly.js bundle included.
+
+Run from the root of the repository with: python -m benchmarks.bench_figure_export
+"""
+import os
+import tempfile
+import time
+from os.path import join
+
+import plotly.express as px
+
+from benchmarks.bench_plot_data import q3_input, q7_input
+from question_script import plotly_graph
+from question_script.plotly_graph import downsample_markers, write_figure
+
+REPLICATION = 20
+MAX_POINTS = 5000
+
+
+def export_figures(movie_grouped_by_top_composer, merged_df, lightweight: bool, directory: str):
+    plotly_graph.create_plotly_number_of_movies(movie_grouped_by_top_composer, lightweight,
+                                                join(directory, 'Q3_number_of_movies_per_year.html'))
+    plotly_graph.create_plotly_box_office_revenue(movie_grouped_by_top_composer, lightweight,
+                                                  join(directory, 'Q3_box_office_revenue_per_year.html'))
+    plotly_graph.plot_heatmap_correlation(merged_df, lightweight, join(directory, 'Q7_correlation_heatmap.html'),
+                                          show=False)
+
+    fig = px.scatter(merged_df, x='popularity', y='movie_revenue', color='release_date',
+                     render_mode=plotly_graph._scatter_render_mode(merged_df, lightweight))
+    if lightweight:
+        downsample_markers(fig, MAX_POINTS)
+    write_figure(fig, join(directory, 'Q7_scatter_popularity_revenue.html'), lightweight)
+
+
+def run_benchmark():
+    movie_grouped_by_top_composer, merged_df = q3_input(REPLICATION), q7_input(REPLICATION)
+
+    print(f'{len(movie_grouped_by_top_composer)} Q3 rows, {len(merged_df)} Q7 rows')
+    for lightweight in [False, True]:
+        with tempfile.TemporaryDirectory() as directory:
+            start_time = time.perf_counter()
+            export_figures(movie_grouped_by_top_composer, merged_df, lightweight, directory)
+            elapsed = time.perf_counter() - start_time
+
+            sizes = {name: os.path.getsize(join(directory, name)) for name in sorted(os.listdir(directory))}
+            print(f'\n{"lightweight" if lightweight else "default"} export: {elapsed:.3f}s, '
+                  f'{sum(sizes.values()) / 1e6:.2f} MB')
+            for name, size in sizes.items():
+                print(f'\t{name}: {size / 1e3:.0f} kB')
+
+
+if __name__ == '__main__':
+    run_benchmark()
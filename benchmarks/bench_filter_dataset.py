@@ -0,0 +1,80 @@
+"""
+Benchmark of the duplicate tmdb id resolution of TMDBDataLoader._filter_dataset on synthetic dataframes, compared to
+the previous nested groupby/apply implementation.
+
+Run from the root of the repository with: python -m benchmarks.bench_filter_dataset
+"""
+import time
+
+import numpy as np
+import pandas as pd
+from rapidfuzz import fuzz
+
+from tmdb.tmdbDataLoader import TMDBDataLoader
+
+SIZES = [10_000, 100_000, 1_000_000]
+DUPLICATED_RATIO = 0.2
+
+WORDS = np.array(['the', 'star', 'war', 'love', 'night', 'day', 'dark', 'man', 'red', 'blue', 'of', 'return'])
+
+
+def filter_dataset_apply(df: pd.DataFrame) -> pd.DataFrame:
+    """Previous implementation of TMDBDataLoader._filter_dataset, kept as a reference"""
+    result = df.copy()
+    result.query('tmdb_id != -1', inplace=True)
+
+    duplicated_tmdb_id = result[result.tmdb_id.duplicated(keep=False)][['tmdb_id', 'name', 'tmdb_title']]
+
+    best_unique_id = duplicated_tmdb_id.groupby('tmdb_id').apply(lambda grouped_df: grouped_df.apply(
+        lambda row: fuzz.ratio(row['name'].lower(), row['tmdb_title'].lower()), axis='columns'
+    ).idxmax())
+
+    duplicated_to_drop = duplicated_tmdb_id.drop(index=best_unique_id).index
+
+    return result.drop(index=duplicated_to_drop).drop(columns='tmdb_title')
+
+
+def random_titles(rng: np.random.Generator, n: int) -> list[str]:
+    """Generate n random titles of one to four words"""
+    words = rng.choice(WORDS, size=(n, 4))
+    lengths = rng.integers(1, 5, size=n)
+    return [' '.join(w[:length]) for w, length in zip(words, lengths)]
+
+
+def synthetic_movies(n: int, seed: int = 0) -> pd.DataFrame:
+    """Generate a dataframe shaped like the output of append_tmdb_movie_ids, where DUPLICATED_RATIO of the movies
+    share their tmdb id with another movie, and some movies were not found"""
+    rng = np.random.default_rng(seed)
+    nb_duplicated = int(n * DUPLICATED_RATIO)
+    tmdb_id = np.arange(n)
+    tmdb_id[:nb_duplicated] = rng.integers(0, nb_duplicated // 2, size=nb_duplicated)
+    tmdb_id[rng.random(n) < 0.05] = -1
+
+    return pd.DataFrame({
+        'name': random_titles(rng, n),
+        'release_date': rng.integers(1920, 2020, size=n).astype(str),
+        'tmdb_id': tmdb_id,
+        'tmdb_title': random_titles(rng, n),
+    })
+
+
+def timed(func, *args):
+    start_time = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - start_time
+
+
+def run_benchmark():
+    print(f'{"rows":>10} {"vectorized (s)":>15} {"apply (s)":>10} {"speedup":>8}')
+    for size in SIZES:
+        movies = synthetic_movies(size)
+        result, elapsed = timed(TMDBDataLoader._filter_dataset, movies)
+        expected, reference_elapsed = timed(filter_dataset_apply, movies)
+
+        # Both implementations must keep exactly the same movies
+        pd.testing.assert_frame_equal(result, expected)
+        print(f'{size:>10} {elapsed:>15.3f} {reference_elapsed:>10.3f} {reference_elapsed / elapsed:>7.1f}x')
+
+
+if __name__ == '__main__':
+    run_benchmark()
@@ -0,0 +1,67 @@
+"""
+Benchmark of location.gazetteer.Gazetteer on the places of birth of the composers. It reports the agreement of the
+gazetteer with the GPT mapping of mapping_locations_to_country.csv (without learning from it, so that the comparison is
+fair), the time taken to map all the places of birth, and the number of locations left for the GPT backend of
+location.location_resolver.LocationResolver with and without the gazetteer.
+
+Run from the root of the repository with: python -m benchmarks.bench_gazetteer
+"""
+import asyncio
+import time
+
+import pandas as pd
+
+from location.country_backends import StaticCountryBackend
+from location.gazetteer import Gazetteer
+from location.location_resolver import MAPPING_PATH, LocationResolver
+from storage import load_table
+
+REPEATS = 5
+
+
+def best_time(function, *args) -> tuple[object, float]:
+    """Best elapsed time of REPEATS calls of the function, with the result of the last one"""
+    elapsed = []
+    for _ in range(REPEATS):
+        start_time = time.perf_counter()
+        result = function(*args)
+        elapsed.append(time.perf_counter() - start_time)
+    return result, min(elapsed)
+
+
+async def nb_requested(locations: list[str], gazetteer: Gazetteer | None) -> int:
+    """Number of locations the resolver sends to its backend on a cold cache"""
+    async with LocationResolver(StaticCountryBackend(), cache_path=':memory:', gazetteer=gazetteer) as resolver:
+        await resolver.resolve(locations)
+        return resolver.requested
+
+
+def run_benchmark():
+    mapping = pd.read_csv(MAPPING_PATH, dtype=str)
+    places = load_table('composer', columns=['place_of_birth'])['place_of_birth']
+
+    print('\nAgreement with the GPT mapping')
+    unlearned = Gazetteer.load(mapping_path=None)
+    for fuzzy in [False, True]:
+        countries = unlearned.resolve(mapping['location'], fuzzy=fuzzy)
+        agree = (countries == mapping['country']).sum()
+        print(f'fuzzy={fuzzy!s:<5} {agree}/{len(mapping)} agree, {countries.isna().sum()} not found')
+        for location, expected, country in zip(mapping['location'], mapping['country'], countries):
+            if country != expected and isinstance(country, str):
+                print(f'    {location.strip()!r}: {expected} (GPT), {country} (gazetteer)')
+
+    print(f'\n{places.notna().sum()} places of birth, {places.nunique()} distinct')
+    gazetteer, load_elapsed = best_time(Gazetteer.load)
+    print(f'load: {load_elapsed * 1000:.1f} ms, {len(gazetteer)} names')
+    for name, gazetteer_ in [('without learning', unlearned), ('learning from the csv', gazetteer)]:
+        countries, elapsed = best_time(gazetteer_.resolve, places)
+        missing = places[places.notna() & countries.isna()].unique()
+        print(f'{name}: {elapsed * 1000:.1f} ms, {len(missing)} distinct places not found {list(missing)}')
+
+    locations = places.dropna().unique().tolist()
+    for name, gazetteer_ in [('no gazetteer', None), ('gazetteer', gazetteer)]:
+        print(f'{name}: {asyncio.run(nb_requested(locations, gazetteer_))} locations sent to the backend')
+
+
+if __name__ == '__main__':
+    run_benchmark()
@@ -0,0 +1,64 @@
+"""
+Equivalence check and benchmark of enrich_with_spotify_data.create_db_to_link_composers_to_movies on the enriched
+movies dataset, compared to its previous implementation growing the link table one .loc insertion at a time.
+
+Run from the root of the repository with: python -m benchmarks.bench_link_composers
+"""
+import time
+
+import pandas as pd
+
+from enrich_with_spotify_data import create_db_to_link_composers_to_movies
+from storage import load_movies_with_composers
+
+# The previous implementation is too slow to be run on the whole dataset
+REFERENCE_SIZES = [500, 2_000]
+
+
+def create_db_to_link_composers_to_movies_loc(movies: pd.DataFrame) -> pd.DataFrame:
+    """Previous implementation of create_db_to_link_composers_to_movies, kept as a reference"""
+    db_to_link_composers_to_movies = pd.DataFrame(
+        columns=['tmdb_id', 'comp_id', 'movie_name', 'movie_revenue', 'composer_name', 'release_date',
+                 'composer_place_of_birth']
+    )
+    db_to_link_composers_to_movies.set_index(['tmdb_id', 'comp_id'], inplace=True)
+
+    for _, movie in movies.iterrows():
+        composers = movie['composers']
+        if type(composers) == list:
+            for composer in composers:
+                db_to_link_composers_to_movies.loc[(movie['tmdb_id'], composer.id), :] = \
+                    {'movie_name': movie['name'],
+                     'movie_revenue': movie['box_office_revenue'],
+                     'composer_name': composer.name,
+                     'release_date': movie['release_date'],
+                     'composer_place_of_birth': composer.place_of_birth}
+
+    return db_to_link_composers_to_movies
+
+
+def timed(func, *args):
+    start_time = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - start_time
+
+
+def run_benchmark():
+    movies = load_movies_with_composers(columns=['name', 'release_date', 'box_office_revenue'])
+
+    print(f'{"movies":>10} {"links":>8} {"explode (s)":>12} {".loc (s)":>10} {"speedup":>8}')
+    for size in REFERENCE_SIZES + [len(movies)]:
+        subset = movies.iloc[:size]
+        result, elapsed = timed(create_db_to_link_composers_to_movies, subset)
+        line = f'{size:>10} {len(result):>8} {elapsed:>12.4f}'
+
+        if size in REFERENCE_SIZES:
+            expected, reference_elapsed = timed(create_db_to_link_composers_to_movies_loc, subset)
+            # The previous implementation stored every column as object
+            pd.testing.assert_frame_equal(result, expected, check_dtype=False)
+            line += f' {reference_elapsed:>10.3f} {reference_elapsed / elapsed:>7.1f}x'
+        print(line)
+
+
+if __name__ == '__main__':
+    run_benchmark()
@@ -0,0 +1,142 @@
+"""
+End-to-end throughput benchmark of TMDBDataLoader and SpotifyDataLoader against the local stand-in server of
+benchmarks.mock_api, reporting for each stage the requests per second, the p50/p99 latency of the requests as seen by
+the loader (retries and throttling included) and the peak memory allocated, followed by the per-endpoint metrics
+recorded by the loaders themselves. SpotifyDataLoader also prints the rate its limiter reached: without --max-rps or
+--throttle-rate the server never throttles, and the rate keeps rising above its initial 20 requests per second.
+
+Run from the root of the repository with: python -m benchmarks.bench_loaders_throughput
+e.g. python -m benchmarks.bench_loaders_throughput --movies 20000 --latency 0.05 --error-rate 0.02 --throttle-rate 0.005
+"""
+import argparse
+import asyncio
+import time
+import tracemalloc
+
+import numpy as np
+
+from benchmarks.mock_api import MockAPIServer, MockBehaviour, synthetic_movies
+from config import config
+from loader_utils.metrics import LoaderMetrics
+from loader_utils.retry import RetryPolicy
+from spotify.SpotifyDataLoader import SpotifyDataLoader
+from spotify.SpotifyTokenProvider import SpotifyTokenProvider
+from tmdb.tmdbDataLoader import TMDBDataLoader
+
+def record_latencies(loader, latencies: list[float]):
+    """Wrap the request method of the loader to record the latency of every request"""
+    perform_async_request = loader._perform_async_request
+
+    async def timed_request(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return await perform_async_request(*args, **kwargs)
+        finally:
+            latencies.append(time.perf_counter() - start)
+
+    loader._perform_async_request = timed_request
+
+
+async def run_stage(name: str, server: MockAPIServer, create_loader, stage):
+    """Run one stage with a fresh loader, and print its metrics
+
+    Parameters
+    ----------
+    name: name of the stage in the report
+    server: the stand-in server
+    create_loader: function creating the loader
+    stage: async function running the stage with the loader, and returning its result
+
+    Returns
+    -------
+    The result of the stage
+    """
+    latencies = []
+    server.reset_stats()
+    tracemalloc.start()
+    start = time.perf_counter()
+
+    async with create_loader() as loader:
+        record_latencies(loader, latencies)
+        result = await stage(loader)
+
+    elapsed = time.perf_counter() - start
+    peak_memory = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    served = sum(server.stats.values())
+    p50, p99 = np.percentile(latencies, [50, 99]) * 1000 if latencies else (np.nan, np.nan)
+    print(f'{name:>24} {len(latencies):>9} {served:>8} {server.stats[429]:>5} {server.stats[503]:>5} '
+          f'{elapsed:>8.2f} {served / elapsed:>8.1f} {p50:>8.1f} {p99:>8.1f} {peak_memory / 2 ** 20:>9.1f}')
+    return result
+
+
+def print_metrics(metrics: LoaderMetrics):
+    """Print the per-endpoint metrics recorded by the loaders"""
+    summary = metrics.summary()
+    print(f'{metrics.name}: peak in flight {summary["peak_in_flight"]}, mean in flight {summary["mean_in_flight"]}')
+    for endpoint, endpoint_metrics in summary['endpoints'].items():
+        print(f'{endpoint:>24} {endpoint_metrics["requests"]:>9} {endpoint_metrics["retries"]:>8} '
+              f'{endpoint_metrics["throttled"]:>9} {endpoint_metrics["bytes_received"] / 2 ** 20:>8.2f} '
+              f'{endpoint_metrics["p50_latency_seconds"] or float("nan"):>8} '
+              f'{endpoint_metrics["p99_latency_seconds"] or float("nan"):>8}')
+
+
+async def run_benchmark(nb_movies: int, behaviour: MockBehaviour, max_in_flight: int, metrics_path: str = None):
+    # The stand-in server does not check the tokens
+    config.setdefault('TMDB_BEARER_TOKEN', 'mock')
+    movies = synthetic_movies(nb_movies)
+    # Retry quickly, the point is to measure the loaders, not to wait
+    retry_policy = RetryPolicy(base_delay=0.05, max_delay=1)
+
+    tmdb_metrics, spotify_metrics = LoaderMetrics('tmdb'), LoaderMetrics('spotify')
+
+    async with MockAPIServer(behaviour) as server:
+        def tmdb_loader():
+            return TMDBDataLoader(debug=False, max_in_flight=max_in_flight, retry_policy=retry_policy,
+                                  base_url=server.tmdb_url, metrics=tmdb_metrics)
+
+        def spotify_loader():
+            return SpotifyDataLoader(SpotifyTokenProvider(access_token='mock'), base_url=server.spotify_url,
+                                     metrics=spotify_metrics)
+
+        print(f'{nb_movies} movies, {behaviour}')
+        print(f'{"stage":>24} {"requests":>9} {"served":>8} {"429":>5} {"503":>5} {"time (s)":>8} {"req/s":>8} '
+              f'{"p50 (ms)":>8} {"p99 (ms)":>8} {"peak (MB)":>9}')
+
+        with_ids = await run_stage('append_tmdb_movie_ids', server, tmdb_loader,
+                                   lambda tmdb: tmdb.append_tmdb_movie_ids(movies))
+        await run_stage('append_movie_revenue', server, tmdb_loader,
+                        lambda tmdb: tmdb.append_movie_revenue(movies, chunk_size=max(nb_movies // 4, 1)))
+        with_composers = await run_stage('append_movie_composers', server, tmdb_loader,
+                                         lambda tmdb: tmdb.append_movie_composers(with_ids))
+
+        composer_names = list({c.name for composers in with_composers['composers'].dropna() for c in composers})
+        await run_stage('create_composers_table', server, spotify_loader,
+                        lambda spotify: spotify.create_composers_table(composer_names))
+
+    print()
+    print(f'{"endpoint":>24} {"requests":>9} {"retries":>8} {"throttled":>9} {"MB":>8} {"p50 (s)":>8} {"p99 (s)":>8}')
+    for metrics in [tmdb_metrics, spotify_metrics]:
+        print_metrics(metrics)
+        if metrics_path is not None:
+            metrics.write(f'{metrics_path}/{metrics.name}.json', prometheus=True)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark the data loaders against a local stand-in server')
+    parser.add_argument('--movies', type=int, default=2_000, help='number of synthetic movies')
+    parser.add_argument('--latency', type=float, default=0.02, help='mean latency of the server in seconds')
+    parser.add_argument('--error-rate', type=float, default=0.01, help='proportion of 503 responses')
+    parser.add_argument('--throttle-rate', type=float, default=0.0, help='proportion of 429 responses')
+    parser.add_argument('--retry-after', type=float, default=1.0, help='Retry-After of the 429 responses')
+    parser.add_argument('--max-rps', type=float, default=None, help='requests per second over which 429 is answered')
+    parser.add_argument('--max-in-flight', type=int, default=50, help='maximum tmdb requests in flight')
+    parser.add_argument('--metrics', default=None, help='directory where to write the metrics of the loaders')
+    args = parser.parse_args()
+
+    asyncio.run(run_benchmark(args.movies, MockBehaviour(latency=args.latency, error_rate=args.error_rate,
+                                                         throttle_rate=args.throttle_rate,
+                                                         retry_after=args.retry_after,
+                                                         max_requests_per_second=args.max_rps),
+                              args.max_in_flight, args.metrics))
@@ -0,0 +1,62 @@
+"""
+Benchmark of location.location_resolver.LocationResolver on the places of birth of the composers, with a local
+backend answering after a fixed latency per batch, as a stand-in for the chat completion API. It reports how many
+locations are sent to the backend and the time taken, on a cold cache, after seeding it with the mapping csv, and on a
+warm cache, for different numbers of batches in flight.
+
+Run from the root of the repository with: python -m benchmarks.bench_location_resolver
+"""
+import asyncio
+import time
+
+from location.country_backends import StaticCountryBackend
+from location.location_resolver import LocationResolver, normalize_location
+from storage import load_table
+
+# Seconds taken by the stand-in backend to answer a batch
+BATCH_LATENCY = 0.2
+BATCH_SIZE = 50
+MAX_IN_FLIGHT = [1, 4, 8]
+
+
+class SlowCountryBackend(StaticCountryBackend):
+    """Static backend answering after BATCH_LATENCY seconds"""
+
+    async def countries(self, locations: list[str]) -> dict[str, str | None]:
+        await asyncio.sleep(BATCH_LATENCY)
+        return await super().countries(locations)
+
+
+async def timed_resolve(resolver: LocationResolver, locations: list[str]) -> tuple[dict, float]:
+    start_time = time.perf_counter()
+    countries = await resolver.resolve(locations)
+    return countries, time.perf_counter() - start_time
+
+
+async def run_benchmark():
+    locations = load_table('composer', columns=['place_of_birth'])['place_of_birth'].dropna().tolist()
+    backend_mapping = {normalize_location(location): 'Country' for location in locations}
+
+    rows = []
+    for max_in_flight in MAX_IN_FLIGHT:
+        for seeded in [False, True]:
+            backend = SlowCountryBackend(backend_mapping)
+            async with LocationResolver(backend, cache_path=':memory:', batch_size=BATCH_SIZE,
+                                        max_in_flight=max_in_flight) as resolver:
+                if seeded:
+                    resolver.seed_from_csv()
+                countries, cold_elapsed = await timed_resolve(resolver, locations)
+                sent = sum(len(batch) for batch in backend.requested)
+                _, warm_elapsed = await timed_resolve(resolver, locations)
+                rows.append((max_in_flight, 'csv' if seeded else 'empty', len(countries), sent, len(backend.requested),
+                             cold_elapsed, warm_elapsed))
+
+    print(f'\n{len(locations)} locations, {BATCH_LATENCY}s per batch of {BATCH_SIZE}')
+    print(f'{"in flight":>9} {"cache":>6} {"mapped":>7} {"sent":>6} {"batches":>8} {"cold (s)":>9} {"warm (s)":>9}')
+    for max_in_flight, cache, mapped, sent, batches, cold_elapsed, warm_elapsed in rows:
+        print(f'{max_in_flight:>9} {cache:>6} {mapped:>7} {sent:>6} {batches:>8} {cold_elapsed:>9.3f} '
+              f'{warm_elapsed:>9.4f}')
+
+
+if __name__ == '__main__':
+    asyncio.run(run_benchmark())
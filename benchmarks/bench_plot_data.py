@@ -0,0 +1,121 @@
+"""
+Equivalence check and benchmark of question_script.plot_data, which aggregates the data of the Q3 and Q7 figures once
+per content of the input dataframe, compared to the aggregations question_script.plotly_graph used to run for every
+figure (copied below as the reference).
+
+The Q3 input is built from the composers data as in milestone_3.ipynb. The album popularities of the Q7 input are not
+part of the dataset, so a fixed random popularity is drawn per album of movie_album_and_revenue.pickle.
+
+Run from the root of the repository with: python -m benchmarks.bench_plot_data
+"""
+import time
+
+import numpy as np
+import pandas as pd
+
+from question_script import plot_data
+from question_script.question_helper import load_composers_data
+
+REPLICATIONS = [1, 20]
+REPEATS = 5
+
+
+def reference_movie_counts(movie_grouped_by_top_composer: pd.DataFrame) -> pd.DataFrame:
+    movie_counts = movie_grouped_by_top_composer.groupby(['composer_name', 'year_bin'], observed=False).size()
+    movie_counts_df = movie_counts.unstack(level='composer_name').reset_index()
+    movie_counts_df.columns = ['year_bin'] + list(movie_counts_df.columns[1:])
+    movie_counts_df = movie_counts_df.sort_values(by='year_bin')
+    movie_counts_df['year_bin'] = movie_counts_df['year_bin'].apply(
+        lambda x: str(x).replace('(', '').replace(']', '').replace(',', ' -'))
+    return movie_counts_df
+
+
+def reference_box_office_revenues(movie_grouped_by_top_composer: pd.DataFrame) -> pd.DataFrame:
+    new_df = movie_grouped_by_top_composer.copy()
+    new_df.dropna(inplace=True)
+    new_df['year_bin'] = new_df['year_bin'].astype(str)
+    new_df = new_df.groupby(['composer_name', 'year_bin'], observed=False)['box_office_revenue'].sum().reset_index()
+    new_df = new_df.sort_values(by='year_bin', kind='stable')
+    new_df['year_bin'] = new_df['year_bin'].apply(lambda x: str(x).replace('(', '').replace(']', '').replace(',', ' -'))
+    return new_df
+
+
+def reference_correlation_by_year(merged_df: pd.DataFrame) -> pd.DataFrame:
+    merged_df_modified = merged_df.copy()
+    merged_df_modified['release_date'] = pd.to_datetime(merged_df_modified['release_date'])
+    merged_df_modified['year'] = merged_df_modified['release_date'].dt.year
+    correlation_by_year = merged_df_modified.groupby('year')[['movie_revenue', 'popularity']].corr().iloc[0::2,
+                          -1].reset_index()
+    mean_revenue_by_year = merged_df_modified.groupby('year')['movie_revenue'].mean().reset_index()
+    correlation_by_year['mean_revenue'] = mean_revenue_by_year['movie_revenue']
+    correlation_by_year.columns = ['year', 'drop', 'correlation', 'mean_revenue']
+    correlation_by_year = correlation_by_year.drop(columns='drop')
+    correlation_by_year.dropna(inplace=True)
+    correlation_by_year = correlation_by_year[correlation_by_year["correlation"] < 0.99]
+    return correlation_by_year[correlation_by_year["correlation"] > -0.99]
+
+
+def reference(movie_grouped_by_top_composer: pd.DataFrame, merged_df: pd.DataFrame) -> list[pd.DataFrame]:
+    return [reference_movie_counts(movie_grouped_by_top_composer),
+            reference_box_office_revenues(movie_grouped_by_top_composer),
+            reference_correlation_by_year(merged_df)]
+
+
+def aggregated(movie_grouped_by_top_composer: pd.DataFrame, merged_df: pd.DataFrame) -> list[pd.DataFrame]:
+    year_bins = plot_data.composer_year_bins(movie_grouped_by_top_composer)
+    return [year_bins.movie_counts(), year_bins.box_office_revenues(), plot_data.correlation_by_year(merged_df)]
+
+
+def q3_input(replication: int) -> pd.DataFrame:
+    df_q3 = load_composers_data(['release_date', 'c_id', 'c_name', 'box_office_revenue']).dropna()
+    df_q3 = pd.concat([df_q3] * replication, ignore_index=True)
+    df_q3.columns = ['release_year', 'composer_id', 'composer_name', 'box_office_revenue']
+
+    top_composers = df_q3['composer_id'].value_counts().head(5).index
+    movie_grouped_by_top_composer = df_q3[df_q3['composer_id'].isin(top_composers)].copy()
+    movie_grouped_by_top_composer['release_year'] = movie_grouped_by_top_composer['release_year'].astype(int)
+    bins = np.arange(movie_grouped_by_top_composer['release_year'].min(),
+                     movie_grouped_by_top_composer['release_year'].max() + 1, 5)
+    movie_grouped_by_top_composer['year_bin'] = pd.cut(movie_grouped_by_top_composer['release_year'], bins)
+    return movie_grouped_by_top_composer
+
+
+def q7_input(replication: int) -> pd.DataFrame:
+    merged_df = pd.read_pickle('dataset/movie_album_and_revenue.pickle')
+    merged_df = merged_df[merged_df['album_id'].notna()].drop_duplicates(subset=['movie_name'])
+    merged_df = pd.concat([merged_df] * replication, ignore_index=True).astype({'movie_revenue': 'float'})
+    merged_df['popularity'] = np.random.default_rng(0).uniform(0, 80, len(merged_df))
+    return merged_df
+
+
+def best_time(func, *args, clear_cache: bool = False) -> tuple[object, float]:
+    elapsed = []
+    for _ in range(REPEATS):
+        if clear_cache:
+            plot_data._plot_data_cache.clear()
+        start_time = time.perf_counter()
+        result = func(*args)
+        elapsed.append(time.perf_counter() - start_time)
+    return result, min(elapsed)
+
+
+def run_benchmark():
+    for replication in REPLICATIONS:
+        movie_grouped_by_top_composer, merged_df = q3_input(replication), q7_input(replication)
+
+        expected, reference_elapsed = best_time(reference, movie_grouped_by_top_composer, merged_df)
+        result, cold_elapsed = best_time(aggregated, movie_grouped_by_top_composer, merged_df, clear_cache=True)
+        _, cached_elapsed = best_time(aggregated, movie_grouped_by_top_composer, merged_df)
+
+        pd.testing.assert_frame_equal(result[0], expected[0])
+        pd.testing.assert_frame_equal(result[1].reset_index(drop=True), expected[1].reset_index(drop=True))
+        pd.testing.assert_frame_equal(result[2], expected[2], rtol=1e-12)
+
+        print(f'x{replication}: {len(movie_grouped_by_top_composer)} Q3 rows, {len(merged_df)} Q7 rows')
+        print(f'\tper figure aggregations: {reference_elapsed:.4f}s')
+        print(f'\tplot_data, first run: {cold_elapsed:.4f}s ({reference_elapsed / cold_elapsed:.1f}x)')
+        print(f'\tplot_data, cached: {cached_elapsed:.4f}s ({reference_elapsed / cached_elapsed:.1f}x)')
+
+
+if __name__ == '__main__':
+    run_benchmark()
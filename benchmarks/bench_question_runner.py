@@ -0,0 +1,51 @@
+"""
+Benchmark of question_script.runner, answering every question in one run which loads each dataset once, compared to
+answering the questions one after the other, each loading its datasets again (as re-running the cells of
+milestone_3.ipynb did). The figures are written to a temporary directory. The runner is timed with one worker (in the
+main process) and with one worker per core.
+
+Run from the root of the repository with: python -m benchmarks.bench_question_runner
+"""
+import os
+import tempfile
+import time
+from contextlib import redirect_stdout
+from io import StringIO
+
+from question_script.question_helper import _compute_composers_data
+from question_script.questions import QUESTIONS, FigureOutput
+from question_script.runner import run_questions
+
+
+def timed_run(names: list[str] | None, workers: int, output: FigureOutput) -> tuple[float, int]:
+    """Time taken by the runner, and number of failed tasks, with its progress output silenced"""
+    _compute_composers_data.cache_clear()
+    start_time = time.perf_counter()
+    with redirect_stdout(StringIO()):
+        _, errors = run_questions(names, workers, output)
+    return time.perf_counter() - start_time, len(errors)
+
+
+def run_benchmark():
+    with tempfile.TemporaryDirectory() as directory:
+        output = FigureOutput(directory)
+        # Write the shared plotly.js bundle beforehand, so that no run pays for it
+        timed_run(None, 1, output)
+
+        rows = []
+        elapsed, failed = 0, 0
+        for name in QUESTIONS:
+            question_elapsed, question_failed = timed_run([name], 1, output)
+            elapsed, failed = elapsed + question_elapsed, failed + question_failed
+        rows.append(('one run per question', elapsed, failed))
+
+        for workers in sorted({1, os.cpu_count() or 1}):
+            rows.append((f'runner, {workers} worker(s)', *timed_run(None, workers, output)))
+
+    print(f'{len(QUESTIONS)} questions, {os.cpu_count()} core(s)')
+    for name, elapsed, failed in rows:
+        print(f'\t{name}: {elapsed:.2f}s ({failed} failed tasks)')
+
+
+if __name__ == '__main__':
+    run_benchmark()
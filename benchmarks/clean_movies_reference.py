@@ -0,0 +1,75 @@
+"""
+Previous row-wise implementations of helpers.clean_movies and helpers.clean_movies_revenue, kept as a reference for
+their equivalence tests and benchmark, and synthetic data shaped like the CMU movie.metadata.tsv to run them on
+"""
+import json
+
+import numpy as np
+import pandas as pd
+
+COUNTRIES = ['United States of America', 'France', 'India', 'United Kingdom', 'Germany', 'Japan', 'Italy']
+GENRES = ['Drama', 'Comedy', 'Thriller', 'Romance Film', 'Action', 'World cinema', 'Documentary', 'Horror']
+LANGUAGES = ['English Language', 'French Language', 'Hindi Language']
+
+
+def clean_movies_apply(df: pd.DataFrame) -> pd.DataFrame:
+    """Previous implementation of helpers.clean_movies, kept as a reference"""
+    df_used_features = df[['name', 'release_date', 'box_office_revenue', 'countries', 'genres']].copy()
+    for dic in ['countries', 'genres']:
+        df_used_features[dic] = df_used_features[dic].apply(json.loads)
+        df_used_features[dic] = df_used_features[dic].apply(dict.values)
+        df_used_features[dic] = df_used_features[dic].apply(list)
+    df_no_nans = df_used_features.dropna(subset=df_used_features.columns.difference(['box_office_revenue'])).copy()
+    reg_map = lambda d: d.group(0)[:4]
+    reg = r"\d{4}-\d{2}(-\d{2})?"
+    df_no_nans['release_date'] = df_no_nans['release_date'].str.replace(reg, reg_map, regex=True)
+    df_no_nans['release_date'].astype('int', copy=False)
+
+    df_no_nans.sort_values(by='box_office_revenue', axis='rows', ascending=False, inplace=True)
+    df_no_nans.drop_duplicates(subset=['name', 'release_date'], keep='first', inplace=True)
+
+    return df_no_nans.reset_index(drop=True)
+
+
+def clean_movies_revenue_apply(df: pd.DataFrame) -> pd.DataFrame:
+    """Previous implementation of helpers.clean_movies_revenue, kept as a reference"""
+    result = df.copy()
+    result["box_office_revenue"] = result.agg(
+        lambda x: x["box_office_revenue"] if not pd.isna(x["box_office_revenue"]) else x["tmdb_revenue"], axis=1)
+
+    result = result.drop(["tmdb_revenue"], axis=1).dropna(subset='box_office_revenue')
+    result.sort_values(by='box_office_revenue', axis='rows', ascending=False, inplace=True)
+    return result.reset_index(drop=True)
+
+
+def freebase_dict(rng: np.random.Generator, values: list[str]) -> str:
+    """Generate a Freebase-like JSON dict of zero to three values"""
+    chosen = rng.choice(values, size=rng.integers(0, 4), replace=False)
+    return json.dumps({f'/m/{abs(hash(v)) % 10 ** 6:x}': v for v in chosen})
+
+
+def synthetic_metadata(path: str, n: int, seed: int = 0):
+    """Write a tsv file shaped like movie.metadata.tsv: dates given as year, year-month or full date (sometimes
+    missing), about 90% of missing box office revenues, and some duplicated (name, year)"""
+    rng = np.random.default_rng(seed)
+    lines = []
+    for i in range(n):
+        year = rng.integers(1900, 2015)
+        date = rng.choice([f'{year}', f'{year}-{rng.integers(1, 13):02d}',
+                           f'{year}-{rng.integers(1, 13):02d}-{rng.integers(1, 29):02d}', ''])
+        revenue = str(rng.integers(10 ** 4, 10 ** 9)) if rng.random() < 0.1 else ''
+        name = f'Movie {rng.integers(0, n // 2)}'
+        lines.append('\t'.join([str(i), f'/m/{i:x}', name, date, revenue, str(rng.integers(60, 200)),
+                                freebase_dict(rng, LANGUAGES), freebase_dict(rng, COUNTRIES),
+                                freebase_dict(rng, GENRES)]))
+    with open(path, 'w') as file:
+        file.write('\n'.join(lines) + '\n')
+
+
+def with_tmdb_revenue(movies: pd.DataFrame, seed: int = 0) -> pd.DataFrame:
+    """Append a tmdb_revenue column like the one of TMDBDataLoader.append_movie_revenue"""
+    rng = np.random.default_rng(seed)
+    result = movies.copy()
+    result['tmdb_revenue'] = np.where(rng.random(len(movies)) < 0.3, rng.integers(10 ** 4, 10 ** 9, len(movies)),
+                                      np.nan)
+    return result
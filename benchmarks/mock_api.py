@@ -0,0 +1,228 @@
+"""
+Local stand-in for the tmdb and Spotify APIs, serving deterministic synthetic responses (or responses recorded in a
+ResponseCache) with a configurable latency, error rate and throttling, so that the data loaders can be benchmarked
+offline and without credentials.
+
+e.g. async with MockAPIServer(MockBehaviour(latency=0.02, error_rate=0.01)) as server:
+        async with TMDBDataLoader(base_url=server.tmdb_url) as tmdb:
+            ...
+"""
+import asyncio
+import random
+import time
+import zlib
+from collections import Counter, deque
+from dataclasses import dataclass
+
+import numpy as np
+import pandas as pd
+from aiohttp import web
+
+from loader_utils.response_cache import CacheMissError, ResponseCache
+
+TMDB_ORIGIN = 'https://api.themoviedb.org'
+
+# Number of distinct synthetic composers, so that the same composers appear in many movies
+NB_COMPOSERS = 2_000
+GENRES = ['soundtrack', 'orchestral', 'classical', 'ambient', 'electronic', 'jazz']
+
+# Words of the titles of the synthetic movies
+MOVIE_WORDS = ['night', 'star', 'love', 'dark', 'river', 'city', 'last', 'king', 'blue', 'silent', 'war', 'summer']
+
+
+@dataclass
+class MockBehaviour:
+    """
+    How the stand-in server behaves, applied to every request
+    """
+    # Mean latency of a response in seconds, and the maximum deviation around it
+    latency: float = 0.02
+    latency_jitter: float = 0.01
+    # Proportion of requests answered with a 503
+    error_rate: float = 0.0
+    # Proportion of requests answered with a 429, and the Retry-After delay sent with it
+    throttle_rate: float = 0.0
+    retry_after: float = 1.0
+    # If set, requests over this number per second (on a sliding second) are answered with a 429
+    max_requests_per_second: float = None
+
+
+def synthetic_movies(n: int, seed: int = 0) -> pd.DataFrame:
+    """Generate a dataframe shaped like the cleaned CMU movies, whose titles the stand-in server finds"""
+    rng = np.random.default_rng(seed)
+    words = rng.choice(MOVIE_WORDS, size=(n, 2))
+    return pd.DataFrame({
+        'name': [f'{first.title()} {second.title()} {i}' for i, (first, second) in enumerate(words)],
+        'release_date': rng.integers(1950, 2015, size=n).astype(str),
+        'box_office_revenue': np.where(rng.random(n) < 0.1, rng.integers(10 ** 5, 10 ** 9, size=n), np.nan),
+        'countries': [['United States of America']] * n,
+        'genres': [['Drama']] * n,
+    })
+
+
+def _stable_hash(text: str) -> int:
+    """Hash independent of the interpreter run, to generate the same responses every time"""
+    return zlib.crc32(text.encode())
+
+
+def movie_id(title: str) -> int:
+    """tmdb id given by the stand-in server to the movie of this title"""
+    return _stable_hash(title.lower()) % 10_000_000 + 1
+
+
+class MockAPIServer:
+    """
+    aiohttp server answering the tmdb endpoints used by TMDBDataLoader under /3, and the Spotify endpoints used by
+    SpotifyDataLoader under /v1. It is started on a free local port when entering the 'async with' block.
+
+    The served responses are counted per status in stats, to be compared with what the client saw.
+    """
+
+    def __init__(self, behaviour: MockBehaviour = MockBehaviour(), recorded: ResponseCache = None, seed: int = 0):
+        """
+        Parameters
+        ----------
+        behaviour: latency, errors and throttling of the server
+        recorded: Optional cache of recorded tmdb responses, replayed instead of the synthetic ones when present
+        seed: seed of the latency, errors and throttling draws
+        """
+        self.behaviour = behaviour
+        self._recorded = recorded
+        self._random = random.Random(seed)
+        self._recent_requests = deque()
+        self._runner = None
+
+        self.url = None
+        self.stats = Counter()
+
+    @property
+    def tmdb_url(self) -> str:
+        """Base url to give to TMDBDataLoader"""
+        return f'{self.url}/3'
+
+    @property
+    def spotify_url(self) -> str:
+        """Base url to give to SpotifyDataLoader"""
+        return f'{self.url}/v1/'
+
+    async def __aenter__(self):
+        app = web.Application(middlewares=[self._behaviour_middleware])
+        app.add_routes([
+            web.get('/3/search/movie', self._tmdb_search_movie),
+            web.get('/3/movie/{id}/credits', self._tmdb_credits),
+            web.get('/3/movie/{id}', self._tmdb_movie),
+            web.get('/3/person/{id}', self._tmdb_person),
+            web.get('/v1/search', self._spotify_search),
+            web.get('/v1/artists', self._spotify_artists),
+        ])
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, '127.0.0.1', 0).start()
+        self.url = f'http://127.0.0.1:{self._runner.addresses[0][1]}'
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self._runner.cleanup()
+
+    def reset_stats(self):
+        """Forget the requests served so far"""
+        self.stats.clear()
+
+    def _is_over_rate(self) -> bool:
+        if self.behaviour.max_requests_per_second is None:
+            return False
+        now = time.monotonic()
+        while self._recent_requests and now - self._recent_requests[0] > 1:
+            self._recent_requests.popleft()
+        if len(self._recent_requests) >= self.behaviour.max_requests_per_second:
+            return True
+        self._recent_requests.append(now)
+        return False
+
+    @web.middleware
+    async def _behaviour_middleware(self, request: web.Request, handler):
+        behaviour = self.behaviour
+        await asyncio.sleep(max(0.0, behaviour.latency + self._random.uniform(-1, 1) * behaviour.latency_jitter))
+
+        draw = self._random.random()
+        if draw < behaviour.throttle_rate or self._is_over_rate():
+            response = web.Response(status=429, headers={'Retry-After': str(behaviour.retry_after)})
+        elif draw < behaviour.throttle_rate + behaviour.error_rate:
+            response = web.Response(status=503)
+        else:
+            response = await self._replay(request) or await handler(request)
+
+        self.stats[response.status] += 1
+        return response
+
+    async def _replay(self, request: web.Request):
+        """Serve the recorded response of the request, if any"""
+        if self._recorded is None or not request.path.startswith('/3/'):
+            return None
+        try:
+            recorded = self._recorded.get(f'{TMDB_ORIGIN}{request.path_qs}', 'other')
+        except CacheMissError:
+            return None
+        return web.json_response(recorded) if recorded is not None else None
+
+    # tmdb
+
+    async def _tmdb_search_movie(self, request: web.Request):
+        query = request.query['query']
+        year = request.query.get('year', '2000')
+        h = _stable_hash(query)
+
+        # The movie itself, and a few movies with close titles or released other years
+        results = [{'id': movie_id(query), 'title': query, 'original_title': query, 'release_date': f'{year}-06-01'}]
+        for k in range(h % 5):
+            title = f'{query} {["II", "Returns", "The Beginning", "Reloaded", "Origins"][k]}'
+            results.append({'id': movie_id(title), 'title': title, 'original_title': title,
+                            'release_date': f'{int(year) + k + 1}-01-01' if k % 2 else ''})
+        # Some movies are not found
+        if h % 20 == 0:
+            results = []
+        return web.json_response({'page': 1, 'results': results, 'total_results': len(results)})
+
+    async def _tmdb_credits(self, request: web.Request):
+        movie = int(request.match_info['id'])
+        crew = [{'id': 10_000_000 + (movie * (k + 7)) % NB_COMPOSERS, 'job': 'Original Music Composer'}
+                for k in range(movie % 3)]
+        crew += [{'id': 20_000_000 + movie, 'job': 'Director'}, {'id': 30_000_000 + movie, 'job': 'Editor'}]
+        return web.json_response({'id': movie, 'cast': [], 'crew': crew})
+
+    async def _tmdb_movie(self, request: web.Request):
+        movie = int(request.match_info['id'])
+        revenue = 0 if movie % 4 == 0 else movie * 37 % 900_000_000
+        return web.json_response({'id': movie, 'revenue': revenue})
+
+    async def _tmdb_person(self, request: web.Request):
+        person = int(request.match_info['id'])
+        credits = [{'job': 'Original Music Composer', 'release_date': f'{1950 + (person + k) % 70}-0{k + 1}-15'}
+                   for k in range(3)]
+        return web.json_response({
+            'id': person,
+            'name': f'Composer {person % NB_COMPOSERS}',
+            'birthday': f'{1930 + person % 60}-01-01',
+            'gender': person % 3,
+            'homepage': None,
+            'place_of_birth': ['Paris, France', 'London, England, UK', 'Los Angeles, California, USA'][person % 3],
+            'movie_credits': {'crew': credits},
+        })
+
+    # Spotify
+
+    async def _spotify_search(self, request: web.Request):
+        name = request.query['q']
+        h = _stable_hash(name)
+        items = [] if h % 10 == 0 else [{'id': f'artist{h:018d}'[:22], 'name': name}]
+        return web.json_response({'artists': {'items': items}})
+
+    async def _spotify_artists(self, request: web.Request):
+        artists = [{
+            'id': artist_id,
+            'name': f'Artist {artist_id}',
+            'genres': GENRES[:_stable_hash(artist_id) % len(GENRES)],
+            'followers': {'total': _stable_hash(artist_id) % 1_000_000},
+            'popularity': _stable_hash(artist_id) % 100,
+        } for artist_id in request.query['ids'].split(',')]
+        return web.json_response({'artists': artists})
@@ -9,18 +9,41 @@ import time
 import pandas
 
 from helpers import load_movies, clean_movies, clean_movies_revenue
-from tmdb.tmdbDataLoader import TMDBDataLoader
+from loader_utils.metrics import LoaderMetrics
+from loader_utils.response_cache import ResponseCache
+from storage import save_movies
+from tmdb.tmdbDataLoader import TMDBDataLoader, CACHE_TTL
 
+TMDB_CACHE_PATH = 'dataset/cache/tmdb_responses.sqlite'
+TMDB_METRICS_PATH = 'dataset/metrics/tmdb.json'
 
-async def enhanced_with_composer(movies: pandas.DataFrame):
-    """Enhanced the dataset with the composers, and directly save it as a pickle
+
+def open_tmdb_cache(offline: bool = False) -> ResponseCache:
+    """Open the on-disk cache of the tmdb responses
+
+    Parameters
+    ----------
+    offline: If True, open the cache in read-only replay mode, every request must already be cached
+
+    Returns
+    -------
+    The response cache
+    """
+    return ResponseCache(TMDB_CACHE_PATH, ttl=CACHE_TTL, read_only=offline)
+
+
+async def enhanced_with_composer(movies: pandas.DataFrame, cache: ResponseCache = None,
+                                 metrics: LoaderMetrics = None):
+    """Enhanced the dataset with the composers, and directly save it as parquet tables
 
     Parameters
     ----------
     movies: the dataframe to enhance with the composers
+    cache: Optional response cache to use for the tmdb requests
+    metrics: Optional metrics recording the tmdb requests
 
     """
-    async with TMDBDataLoader() as tmdb:
+    async with TMDBDataLoader(cache=cache, metrics=metrics) as tmdb:
         start_time = time.time()
 
         result = await tmdb.append_movie_composers(movies)
@@ -29,36 +52,50 @@ async def enhanced_with_composer(movies: pandas.DataFrame):
 
         print(f'Elapsed time: {end_time - start_time}')
 
-        # Finally create a pickle file of this new enrich dataframe
-        # pickle, as it takes less space on disk, and allows to directly
-        # parse the composer column as a list of Composer without having to cast anything
-        result.to_csv('dataset/clean_enrich_movies.csv')
-        result.to_pickle('dataset/clean_enrich_movies.pickle')
+        # Finally save this new enrich dataframe as flat movie, composer and movie_composer parquet tables, which take
+        # less space on disk and can be loaded column by column. The dataframe with the composer column as a list of
+        # Composer can be rebuilt with storage.load_movies_with_composers
+        save_movies(result)
 
 
-async def enhanced_with_revenue(movies: pandas.DataFrame, chunk_size=15000) -> pandas.DataFrame:
+async def enhanced_with_revenue(movies: pandas.DataFrame, chunk_size=15000,
+                                cache: ResponseCache = None, metrics: LoaderMetrics = None) -> pandas.DataFrame:
     """Enhanced the dataset with the revenue
 
     Parameters
     ----------
     movies: The dataset of the movie to enhanced
     chunk_size: The size of the chunk to split the requests to periodically save the work in case of an error
+    cache: Optional response cache to use for the tmdb requests
+    metrics: Optional metrics recording the tmdb requests
 
     Returns
     -------
     The enhanced dataset
     """
-    async with TMDBDataLoader() as tmdb:
+    async with TMDBDataLoader(cache=cache, metrics=metrics) as tmdb:
         result = await tmdb.append_movie_revenue(movies, chunk_size)
         return result
 
 
-def create_enhanced_movie_dataset():
+def create_enhanced_movie_dataset(offline: bool = False):
     """
     This function enhance the movie dataset. It does:
     - Loads a movie dataset
     - enhances it with revenue information
     - enriches it with composer details for each movie.
+
+    Every tmdb response is cached on disk, so that a re-run only requests what is not cached yet. The metrics of the
+    requests are written to dataset/metrics/tmdb.json (and tmdb.prom for Prometheus).
+
+    Parameters
+    ----------
+    offline: If True, replay the responses from the cache only, without ever touching the network
+
+    Raises
+    ------
+    CacheMissError if a response is missing from the cache in offline mode, before any table is saved, so that an
+    incomplete cache never overwrites the stored tables with degraded data
     """
     # Load movies data set
     raw_movies = load_movies('dataset/MovieSummaries/movie.metadata.tsv')
@@ -66,13 +103,19 @@ def create_enhanced_movie_dataset():
     # Clean data to filter only observation with all needed features (without looking at box office revenue)
     cleaned_movies_without_revenue_cleaned = clean_movies(raw_movies)
 
+    metrics = LoaderMetrics('tmdb')
+
     # Merge revenue from cmu and tmdb and drop nan
-    res = asyncio.run(enhanced_with_revenue(cleaned_movies_without_revenue_cleaned, 15000))
+    with open_tmdb_cache(offline) as cache:
+        try:
+            res = asyncio.run(enhanced_with_revenue(cleaned_movies_without_revenue_cleaned, 15000, cache, metrics))
 
-    cleaned_movies = clean_movies_revenue(res)
+            cleaned_movies = clean_movies_revenue(res)
 
-    # Retrieve composers of all movies
-    asyncio.run(enhanced_with_composer(cleaned_movies))
+            # Retrieve composers of all movies
+            asyncio.run(enhanced_with_composer(cleaned_movies, cache, metrics))
+        finally:
+            metrics.write(TMDB_METRICS_PATH, prometheus=True)
 
 
 if __name__ == '__main__':
@@ -1,20 +1,23 @@
 import asyncio
 import time
 
-import pandas as pd
-
+from loader_utils.metrics import LoaderMetrics
 from spotify.SpotifyDataLoader import SpotifyDataLoader
+from storage import load_table, write_table
+
+SPOTIFY_METRICS_PATH = 'dataset/metrics/spotify_composer.json'
 
 
-async def get_music_dataset(composers_names: list) -> None:
+async def get_music_dataset(composers_names: list, metrics: LoaderMetrics = None) -> None:
     """
-    This function is used to create the spotify_dataset.pickle file
+    This function is used to create the spotify_composer table
 
     Parameters
     ----------
     composers_names: list ist of composers names
+    metrics: Optional metrics recording the Spotify requests
     """
-    async with SpotifyDataLoader() as spotify:
+    async with SpotifyDataLoader(metrics=metrics) as spotify:
         start_time = time.time()
 
         result = await spotify.create_composers_table(composers_names)
@@ -23,23 +26,22 @@ async def get_music_dataset(composers_names: list) -> None:
 
         print(f'Elapsed time: {end_time - start_time}')
 
-        # Finally create a pickle file of this new dataframe, as it takes less space on disk
-        result.to_pickle('dataset/spotify_composers_dataset.pickle')
-        result.to_csv('dataset/spotify_composers_dataset.csv')
+        # Finally save this new dataframe as a parquet table, as it takes less space on disk
+        write_table(result, 'spotify_composer')
 
 
 def create_music_composers_dataset():
     """
-    Create the composer dataset
+    Create the composer dataset, and write the metrics of the Spotify requests to dataset/metrics
     """
 
-    m = pd.read_pickle('dataset/clean_enrich_movies.pickle')
-    list_composers = m['composers'].dropna().tolist()
-    # Flatten the list
-    list_composers = [item for sublist in list_composers for item in sublist]
-    composers_names = [c.name for c in list_composers]
-    composers_names = list(set(composers_names))
-    asyncio.run(get_music_dataset(composers_names))
+    # Only the names of the composers are needed
+    composers_names = load_table('composer', columns=['name'])['name'].unique().tolist()
+    metrics = LoaderMetrics('spotify')
+    try:
+        asyncio.run(get_music_dataset(composers_names, metrics))
+    finally:
+        metrics.write(SPOTIFY_METRICS_PATH, prometheus=True)
 
 
 if __name__ == '__main__':
@@ -1,14 +1,26 @@
+import argparse
 import asyncio
+import multiprocessing
 import os
 import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import nullcontext
+from dataclasses import asdict, dataclass
 
 import numpy as np
 import pandas as pd
-from rapidfuzz import fuzz
+from rapidfuzz import fuzz, process
 
+from loader_utils.metrics import LoaderMetrics
+from loader_utils.work_ledger import WorkLedger
+from records import RecordColumns
 # from question_script.question1 import create_db_to_link_composers_to_movies
-from spotify import get_bearer_token
+from spotify.Music import Music
 from spotify.SpotifyDataLoader import SpotifyDataLoader
+from storage import (load_movie_albums, load_movies_with_composers, load_table, load_tracks, save_album_tracks,
+                     save_movie_albums, save_tracks, table_exists)
+from tmdb.Composer import Composer
 
 # Define keywords to search for soundtrack of movies
 POSITIVE_KEYWORD = ["original", "motion", "picture", "soundtrack", "music", "band", "score", "theme", "ost", "ost.",
@@ -22,320 +34,514 @@ NEUTRAL_KEYWORD = ["the", "of", "from", "in", "on", "at", "for", "a", "an", "and
 POSITIVE_INFLUENCE = 1.1
 NEGATIVE_INFLUENCE = 0.9
 
+# Keywords precompiled for the scoring, a keyword listed twice counting twice
+POSITIVE_KEYWORD_COUNTS = Counter(POSITIVE_KEYWORD)
+NEGATIVE_KEYWORD_COUNTS = Counter(NEGATIVE_KEYWORD)
+NEUTRAL_KEYWORDS = frozenset(NEUTRAL_KEYWORD)
+
+# An album artist matches the composer if their names are more than this similar, or if the album is a compilation
+ARTIST_SIMILARITY_THRESHOLD = 85
+VARIOUS_ARTISTS = "Various Artists"
+
 BATCH_SIZE = 100
 
+WORK_LEDGER_PATH = 'dataset/cache/work_ledger.sqlite'
+SPOTIFY_METRICS_PATH = 'dataset/metrics/spotify_musics.json'
+
+# Stages of the enrichment recorded in the work ledger
+ALBUM_STAGE = 'album_id'
+TRACK_IDS_STAGE = 'track_ids'
+TRACK_STAGE = 'track'
+
 
-def _regenerate_token_if_needed(timer, spotify):
+@dataclass(frozen=True)
+class MovieQuery:
     """
-    Regenerate token if timer is more than 3000 seconds
+    Movie-side part of the album scoring, computed once per movie instead of once per candidate album
     """
+    # Lowercased movie name
+    name: str
+    # Keywords missing from the movie name, with their number of occurrences in the keyword lists
+    positive: dict[str, int]
+    negative: dict[str, int]
+    # Keywords removed from the album names before comparing them to the movie name
+    to_remove: frozenset[str]
+    # The longest word of the movie name, which must appear in the cleaned album name
+    longest_word: str
+    # Accepted album release years, empty if the movie has no date
+    years: tuple[str, ...]
+    composer: str
+
+    @classmethod
+    def compile(cls, name: str, date, composer: str) -> 'MovieQuery':
+        """Precompute the movie-side part of the scoring
+
+        Parameters
+        ----------
+        name: the name of the movie
+        date: the release year of the movie
+        composer: the name of the composer
+
+        Returns
+        -------
+        The movie query
+        """
+        movie_name = name.lower()
+        movie_words = movie_name.split()
+        movie_word_set = frozenset(movie_words)
+
+        positive = {word: n for word, n in POSITIVE_KEYWORD_COUNTS.items() if word not in movie_word_set}
+        negative = {word: n for word, n in NEGATIVE_KEYWORD_COUNTS.items() if word not in movie_word_set}
+        neutral = NEUTRAL_KEYWORDS - movie_word_set
+
+        return cls(
+            name=movie_name,
+            positive=positive,
+            negative=negative,
+            to_remove=frozenset(positive) | frozenset(negative) | neutral,
+            longest_word=max(movie_words, key=len, default=''),
+            years=(str(date), str(int(date) - 1), str(int(date) + 1)) if date else (),
+            composer=composer,
+        )
+
+    def clean_album_name(self, album: dict) -> tuple[str, float] | None:
+        """Filter the album on its artists and release date, and clean its name
+
+        Parameters
+        ----------
+        album: the album, as returned by the Spotify search
+
+        Returns
+        -------
+        The cleaned album name and the modifier of its score, or None if the album cannot be the soundtrack of the
+        movie
+        """
+        if self.composer:
+            artists = [artist["name"] for artist in album["artists"]]
+            match = process.extractOne(self.composer, artists, scorer=fuzz.ratio,
+                                       score_cutoff=ARTIST_SIMILARITY_THRESHOLD)
+            if not ((match is not None and match[1] > ARTIST_SIMILARITY_THRESHOLD) or VARIOUS_ARTISTS in artists):
+                return None
+
+        if self.years:
+            release_date = str(album["release_date"])
+            if not any(year in release_date for year in self.years):
+                return None
+
+        query_name = album["name"].lower()
+        if not ("(" in self.name or ")" in self.name):
+            query_name = query_name.replace("(", "").replace(")", "")
+
+        query_words = query_name.split()
+        query_word_set = set(query_words)
+
+        pos_count = sum(self.positive.get(word, 0) for word in query_word_set)
+        neg_count = sum(self.negative.get(word, 0) for word in query_word_set)
 
-    if time.time() - timer > 3000:
-        print("Regenerate token")
-        get_bearer_token.replace_token("")
-        spotify.reload_config()
-        return time.time()
-    return timer
+        result = ' '.join(word for word in query_words if word not in self.to_remove)
+        if self.longest_word not in result:
+            return None
 
+        return result, POSITIVE_INFLUENCE ** pos_count * NEGATIVE_INFLUENCE ** neg_count
 
-def count_occurrence_and_return_diff(movie_name: str, query_words: list[str], keyword_list: list[str]) -> tuple[
-    int, list]:
+
+def find_best_matching_album_ids(albums_per_movie: list[list[dict]], dates: list, names: list[str],
+                                 composers: list[str], workers: int = -1) -> list[str | None]:
     """
-    Count the number of occurence of the keyword in the movie name and return the difference between the query words
+    Find the album of each movie among the albums returned by its search, scoring all the albums of the batch together
+
+    The albums whose artists do not match the composer, or released more than a year away from the movie, are
+    discarded. The others are scored on the similarity between the movie name and the album name stripped of its
+    keywords, boosted by the positive keywords (e.g. soundtrack) and penalized by the negative ones (e.g. live).
 
     Parameters
     ----------
-    movie_name: str
-        the movie name
-    query_words: list
-        the query words
-    keyword_list: list
-        the list of keywords
+    albums_per_movie: list[list[dict]]
+        the albums returned by the search of each movie
+    dates: list
+        the release year of each movie
+    names: list[str]
+        the name of each movie
+    composers: list[str]
+        the name of the composer of each movie
+    workers: int
+        the number of threads used to compute the similarities, -1 to use all the cores
 
     Returns
     -------
-    count: int
-    words: list
+    album_ids: list[str | None]
+        the id of the best matching album of each movie, None if no album matches
     """
-    words = []
-    count = 0
-    movie_words = movie_name.lower().split()
-    for word in keyword_list:
-        if word not in movie_words:
-            words.append(word)
-            if word in query_words:
-                count += 1
-    return count, words
-
-
-def score_best_matching_albums(albums_df: pd.DataFrame, date: int, name: str, composer: str) -> list[tuple[int, int]]:
+    movie_indices, album_ids, movie_names, album_names, modifiers = [], [], [], [], []
+    for i, (albums, date, name, composer) in enumerate(zip(albums_per_movie, dates, names, composers)):
+        query = MovieQuery.compile(name, date, composer)
+        for album in albums:
+            candidate = query.clean_album_name(album)
+            if candidate is not None:
+                movie_indices.append(i)
+                album_ids.append(album["id"])
+                movie_names.append(query.name)
+                album_names.append(candidate[0])
+                modifiers.append(candidate[1])
+
+    best_album_ids = [None] * len(albums_per_movie)
+    if not movie_indices:
+        return best_album_ids
+
+    scores = np.array(modifiers) * process.cpdist(movie_names, album_names, scorer=fuzz.ratio, workers=workers,
+                                                  dtype=np.float64)
+
+    # Keep the first album with the highest score of each movie
+    best_scores = [-1.0] * len(albums_per_movie)
+    for i, album_id, score in zip(movie_indices, album_ids, scores.tolist()):
+        if score > best_scores[i]:
+            best_scores[i] = score
+            best_album_ids[i] = album_id
+    return best_album_ids
+
+
+def _album_search_keys(movies: pd.DataFrame) -> pd.Series:
+    """Key of the album search of each movie in the work ledger, a movie being searched once per composer"""
+    return movies['movie_name'] + '\t' + movies['composer_name']
+
+
+async def _score_album_batches(queue: asyncio.Queue, executor: ProcessPoolExecutor | None, ledger: WorkLedger):
     """
-    Score the best matching albums with the movie name
+    Scoring stage of get_album_ids_into_df: score the batches of album searches put in the queue until it receives
+    None, and record the album found for each movie in the ledger
 
     Parameters
     ----------
-    albums_df: pd.DataFrame
-        the dataframe of albums
-    date: int
-        the date of the movie
-    name: str
-        the name of the movie
-    composer: str
-        the name of the composer
-
-    Returns
-    -------
-    score: list[tuple(int, int)]
+    queue: asyncio.Queue
+        the queue of (keys of the movies, arguments of find_best_matching_album_ids) of each batch
+    executor: ProcessPoolExecutor | None
+        the process pool scoring the batches, None to score them directly on the event loop
+    ledger: WorkLedger
+        the ledger recording the album found for each movie
     """
-    score = []
-    for j in range(len(albums_df.values)):
-        artist_bool = False
-        album = albums_df.loc[j]
-
-        if composer:
-            for artist in album["artists"]:
-                if fuzz.ratio(composer, artist["name"]) > 85 or "Various Artists" == artist["name"]:
-                    artist_bool = True
-                    break
-            if not artist_bool:
-                continue
-
-        if date:
-            if not (str(date) in (str(album["release_date"])) or str(int(date) - 1) in (
-                    str(album["release_date"])) or str(int(date) + 1) in (str(album["release_date"]))):
-                continue
-
-        movie_name = name.lower()
-        query_name = album["name"].lower()
-        if not ("(" in movie_name or ")" in movie_name):
-            query_name = query_name.replace("(", "")
-            query_name = query_name.replace(")", "")
+    loop = asyncio.get_running_loop()
+    while True:
+        item = await queue.get()
+        if item is None:
+            return
+
+        batch_keys, args = item
+        try:
+            if executor is None:
+                album_ids = find_best_matching_album_ids(*args)
+            else:
+                # Every process already scores a batch, so each of them computes its similarities on a single thread
+                album_ids = await loop.run_in_executor(executor, find_best_matching_album_ids, *args, 1)
+        except Exception as e:
+            # Retried by the next run
+            print(f'Album scoring failed for {len(batch_keys)} movies: {e}')
+            ledger.record_failed(ALBUM_STAGE, batch_keys, e)
+            continue
 
-        query_words = query_name.split()
+        ledger.record_done(ALBUM_STAGE, zip(batch_keys, album_ids))
 
-        pos_count, positive_words = count_occurrence_and_return_diff(movie_name, query_words, POSITIVE_KEYWORD)
-        neg_count, negative_words = count_occurrence_and_return_diff(movie_name, query_words, NEGATIVE_KEYWORD)
-        neu_count, neutral_words = count_occurrence_and_return_diff(movie_name, query_words, NEUTRAL_KEYWORD)
 
-        to_remove = positive_words + negative_words + neutral_words
-        cleaned_query = [word for word in query_words if word.lower() not in to_remove]
-        result = ' '.join(cleaned_query)
+async def _search_album_batches(todo: pd.DataFrame, keys: pd.Series, queue: asyncio.Queue, ledger: WorkLedger,
+                                metrics: LoaderMetrics = None):
+    """
+    Fetching stage of get_album_ids_into_df: search the albums of the movies batch by batch, and put the results in
+    the queue of the scoring stage
 
-        if not (max(movie_name.split(), key=len) in result):
-            continue
+    Parameters
+    ----------
+    todo: pd.DataFrame
+        the movies to search
+    keys: pd.Series
+        the key of each movie in the ledger
+    queue: asyncio.Queue
+        the queue of the scoring stage
+    ledger: WorkLedger
+        the ledger recording the failed searches
+    metrics: LoaderMetrics
+        optional metrics recording the Spotify requests
+    """
+    # Get the album ids for each movie
+    async with SpotifyDataLoader(metrics=metrics) as spotify:
+        for i in range(0, len(todo), BATCH_SIZE):
+            # Get all the albums for the movies in the batch
+            batch = todo.iloc[i:i + BATCH_SIZE]
+            batch_keys = keys[batch.index]
+
+            try:
+                results = await spotify.search_albums_by_name(list(batch.movie_name))
+            except Exception as e:
+                # Retried by the next run
+                print(f'Album search failed for {len(batch)} movies: {e}')
+                ledger.record_failed(ALBUM_STAGE, batch_keys, e)
+                continue
 
-        modifiers = POSITIVE_INFLUENCE ** pos_count * NEGATIVE_INFLUENCE ** neg_count
-        score += [(j, modifiers * fuzz.ratio(movie_name, result))]
-    return score
+            await queue.put((batch_keys, (results, list(batch.release_date), list(batch.movie_name),
+                                          list(batch.composer_name))))
 
 
-async def get_album_ids_into_df(movie_names_and_date: pd.DataFrame, checkpoint: bool = False,
-                                save_interval: int = 5) -> pd.DataFrame:
+async def get_album_ids_into_df(movie_names_and_date: pd.DataFrame, ledger: WorkLedger = None,
+                                scoring_workers: int = None, metrics: LoaderMetrics = None) -> pd.DataFrame:
     """
-    This function is used to create the movie_album_and_revenue.pickle file
+    This function is used to create the movie_album table
+
+    The albums returned by the searches are handed to a scoring stage through a queue, so that the next searches are
+    performed while the previous ones are scored, by a pool of processes.
 
     Parameters
     ----------
     movie_names_and_date: pd.DataFrame
         the dataframe of movies
 
-    checkpoint: bool
-        if True, load the checkpoint and save the dataframe every save_interval
+    ledger: WorkLedger
+        the ledger recording the album found for each movie, so that only the movies not searched yet (or whose search
+        failed) are searched. By default, an in-memory ledger is used and every movie is searched
 
-    save_interval: int
-        the interval to save the dataframe
+    scoring_workers: int
+        the number of processes scoring the albums, by default one per core. With 0, the albums are scored directly
+        on the event loop
+
+    metrics: LoaderMetrics
+        optional metrics recording the Spotify requests
 
     Returns
     -------
     movie_albums_df: pd.DataFrame
     """
-    checkpoint_path = 'dataset/checkpoints/movie_album_and_revenue.pickle'
-
-    movie_albums_df = movie_names_and_date
-    movie_albums_df['album_id'] = None
-
-    if checkpoint:
-        # Load the checkpoint if it exists
-        if os.path.isfile(checkpoint_path):
-            movie_albums_df = pd.read_pickle(checkpoint_path)
+    ledger = ledger if ledger is not None else WorkLedger()
 
-    mask = movie_albums_df["album_id"].isna()
-    working_index = movie_albums_df[mask].index
+    movie_albums_df = movie_names_and_date.copy()
+    keys = _album_search_keys(movie_albums_df)
+    todo = movie_albums_df[~keys.duplicated() & keys.isin(set(ledger.pending(ALBUM_STAGE, keys)))]
 
+    print(f'Searching the albums of {len(todo)} movies')
     start_time = time.time()
-    timer = start_time
-
-    # Get the album ids for each movie
-    async with SpotifyDataLoader() as spotify:
-        for i in range(0, len(working_index), BATCH_SIZE):
-            # Get all the albums for the movies in the batch
-            batch = movie_albums_df.loc[working_index[i:i + BATCH_SIZE]]
-            date = list(batch.release_date)
-            names = list(batch.movie_name)
-            composer = list(batch.composer_name)
 
-            # if timer more than 1 hour, regenerate token
-            timer = _regenerate_token_if_needed(timer, spotify)
-
-            results = await spotify.search_albums_by_name(names)
-            for j, albums in enumerate(results):
-                albums_df = pd.DataFrame(albums)
-                scores = score_best_matching_albums(albums_df, date[j], names[j], composer[j])
-                if len(scores) > 0:
-                    best_score = max(scores, key=lambda x: x[1])
-                    movie_albums_df.loc[working_index[i + j], "album_id"] = albums_df.loc[best_score[0]]["id"]
-
-                    if checkpoint and j % save_interval == 0:
-                        movie_albums_df.to_pickle(checkpoint_path)
+    if len(todo) > 0:
+        scoring_workers = scoring_workers if scoring_workers is not None else os.cpu_count()
+        # The workers are started with spawn rather than fork, as forking this process, which already runs an event
+        # loop and its threads, could deadlock them on the locks held by the other threads
+        executor = (ProcessPoolExecutor(scoring_workers, mp_context=multiprocessing.get_context('spawn'))
+                    if scoring_workers > 0 else None)
+        # Bounded, so that the searches do not get too far ahead of the scoring
+        queue = asyncio.Queue(maxsize=2 * max(scoring_workers, 1))
+
+        with executor if executor is not None else nullcontext():
+            if executor is not None:
+                # Start every worker before the Spotify session is opened, rather than on the first scored batch
+                loop = asyncio.get_running_loop()
+                await asyncio.gather(*(loop.run_in_executor(executor, os.getpid) for _ in range(scoring_workers)))
+            scorers = [asyncio.create_task(_score_album_batches(queue, executor, ledger))
+                       for _ in range(max(scoring_workers, 1))]
+            try:
+                await _search_album_batches(todo, keys, queue, ledger, metrics)
+                for _ in scorers:
+                    await queue.put(None)
+                await asyncio.gather(*scorers)
+            finally:
+                for scorer in scorers:
+                    scorer.cancel()
 
     end_time = time.time()
 
     print(f'Elapsed time for mapping album ids to film: {end_time - start_time}')
 
+    movie_albums_df['album_id'] = keys.map(ledger.results(ALBUM_STAGE))
+
     # Save the dataframe
-    movie_albums_df.to_pickle('dataset/movie_album_and_revenue.pickle')
-    movie_albums_df.to_csv('dataset/movie_album_and_revenue.csv')
+    save_movie_albums(movie_albums_df)
 
     return movie_albums_df
 
 
-async def get_track_ids_into_df(movie_albums_df: pd.DataFrame, checkpoint: bool = False,
-                                save_interval: int = 5) -> pd.DataFrame:
+async def get_track_ids_into_df(movie_albums_df: pd.DataFrame, ledger: WorkLedger = None,
+                                metrics: LoaderMetrics = None) -> pd.DataFrame:
     """
-    This function is used to create the movie_album_and_revenue_with_track_ids.pickle file
+    This function is used to create the album_track table
 
     Parameters
     ----------
     movie_albums_df: pd.DataFrame
         the dataframe of movies
 
-    checkpoint: bool
-        if True, load the checkpoint and save the dataframe every save_interval
+    ledger: WorkLedger
+        the ledger recording the track ids of each album, so that only the albums not retrieved yet (or whose
+        retrieval failed) are requested. By default, an in-memory ledger is used and every album is requested
 
-    save_interval: int
-        the interval to save the dataframe
+    metrics: LoaderMetrics
+        optional metrics recording the Spotify requests
 
     Returns
     -------
     movie_albums_df: pd.DataFrame
     """
+    ledger = ledger if ledger is not None else WorkLedger()
 
-    checkpoint_path = 'dataset/checkpoints/movie_album_and_revenue_with_track_ids.pickle'
-    movie_albums_df['track_ids'] = None
+    movie_albums_df = movie_albums_df.copy()
+    todo = ledger.pending(TRACK_IDS_STAGE, movie_albums_df['album_id'].dropna())
 
-    if checkpoint:
-        # Load the checkpoint if it exists
-        if os.path.isfile(checkpoint_path):
-            movie_albums_df = pd.read_pickle(checkpoint_path)
+    print(f'Retrieving the track ids of {len(todo)} albums')
+    start_time = time.time()
 
-    mask = movie_albums_df["track_ids"].isna()
-    working_index = movie_albums_df[mask].index
+    if todo:
+        async with SpotifyDataLoader(metrics=metrics) as spotify:
+            for i in range(0, len(todo), BATCH_SIZE):
+                # Get all the tracks ids of the albums in the batch
+                batch = todo[i:i + BATCH_SIZE]
 
-    start_time = time.time()
-    timer = start_time
-
-    async with SpotifyDataLoader() as spotify:
-        for i in range(0, len(working_index), BATCH_SIZE):
-            # Get all the tracks ids of the albums in the batch
-            batch = list(movie_albums_df.loc[working_index[i:i + BATCH_SIZE]]["album_id"])
-            results = await spotify.get_albums_tracks_async(batch)
-            movie_albums_df.loc[working_index[i:i + BATCH_SIZE], "track_ids"] = np.array(results, dtype=object)
-            timer = _regenerate_token_if_needed(timer, spotify)
-            if checkpoint and i % save_interval == 0:
-                movie_albums_df.to_pickle(checkpoint_path)
+                try:
+                    results = await spotify.get_albums_tracks_async(batch)
+                except Exception as e:
+                    # Retried by the next run
+                    print(f'Track ids retrieval failed for {len(batch)} albums: {e}')
+                    ledger.record_failed(TRACK_IDS_STAGE, batch, e)
+                    continue
+
+                ledger.record_done(TRACK_IDS_STAGE, zip(batch, results))
 
     end_time = time.time()
 
     print(f'Elapsed time for retrieving all track_ids from album_ids: {end_time - start_time}')
 
+    movie_albums_df['track_ids'] = movie_albums_df['album_id'].map(ledger.results(TRACK_IDS_STAGE))
+
     # Save the dataframe
-    movie_albums_df.to_pickle('dataset/movie_album_and_revenue_with_track_ids.pickle')
-    movie_albums_df.to_csv('dataset/movie_album_and_revenue_with_track_ids.csv')
+    save_album_tracks(movie_albums_df)
 
     return movie_albums_df
 
 
-async def get_music_from_track_ids(albums_with_track_ids: pd.DataFrame, checkpoint: bool = False,
-                                   save_interval: int = 10) -> pd.DataFrame:
+def assign_musics_to_tracks(albums_with_track_ids: pd.DataFrame, musics: dict[str, Music]) -> pd.DataFrame:
     """
-    This function is used to create the movie_album_and_revenue_with_track_ids.pickle file
+    Fill the track column with the music of each track id, in a single hash join instead of scanning the whole
+    track_ids column for every music
 
     Parameters
     ----------
     albums_with_track_ids: pd.DataFrame
-        the dataframe of albums
-
-    checkpoint: bool
-        if True, load the checkpoint and save the dataframe every save_interval
+        the dataframe of albums, with one row per track id
 
-    save_interval: int
-        the interval to save the dataframe
+    musics: dict[str, Music]
+        the music of each retrieved track id
 
     Returns
     -------
     albums_with_track_ids: pd.DataFrame
+        a copy of the dataframe, whose track column holds the music of each track (nan if it was not retrieved)
     """
-    # Create new dataframe with the same columns as movie_names_and_date and an additional column for the album id
-    albums_with_track_ids['track'] = albums_with_track_ids.get('track', pd.Series(dtype='object'))
-    checkpoint_path = 'dataset/checkpoints/album_id_and_musics.pickle'
+    result = albums_with_track_ids.copy()
+    result['track'] = result['track_ids'].map(musics)
+    return result
 
-    if checkpoint:
-        # Load the checkpoint if it exists
-        if os.path.isfile(checkpoint_path):
-            albums_with_track_ids = pd.read_pickle(checkpoint_path)
-            mask = albums_with_track_ids["track_ids"].str.len() != 22
-            albums_with_track_ids = albums_with_track_ids[~mask]
 
-    mask = albums_with_track_ids["track"].isna()
-    working_index = albums_with_track_ids[mask].index
+async def get_music_from_track_ids(albums_with_track_ids: pd.DataFrame, ledger: WorkLedger = None,
+                                   metrics: LoaderMetrics = None) -> pd.DataFrame:
+    """
+    This function is used to create the track table
 
-    start_time = time.time()
-    timer = start_time
+    Parameters
+    ----------
+    albums_with_track_ids: pd.DataFrame
+        the dataframe of albums, with one row per track id
 
+    ledger: WorkLedger
+        the ledger recording the music of each track, so that only the tracks not retrieved yet (or whose retrieval
+        failed) are requested. By default, an in-memory ledger is used and every track is requested
+
+    metrics: LoaderMetrics
+        optional metrics recording the Spotify requests
+
+    Returns
+    -------
+    albums_with_track_ids: pd.DataFrame
+    """
+    ledger = ledger if ledger is not None else WorkLedger()
+
+    albums_with_track_ids = albums_with_track_ids.copy()
+    todo = ledger.pending(TRACK_STAGE, albums_with_track_ids['track_ids'])
+
+    print(f'Retrieving {len(todo)} tracks')
     start_time = time.time()
-    async with SpotifyDataLoader() as spotify:
-        # Define the batch size
-        batch_size = 250  # You can change this value as needed
-
-        # Calculate the number of batches
-        unique_keys = working_index.unique()
-        num_batches = int(np.ceil(len(unique_keys) / batch_size))
-
-        # Iterate over each batch
-        for batch_num in range(num_batches):
-            # Get the start and end index for the current batch
-            start_idx = batch_num * batch_size
-            end_idx = start_idx + batch_size
-
-            # Get the keys for the current batch
-            batch_keys = unique_keys[start_idx:end_idx]
-            tracks, genres = await spotify.get_tracks_from_tracks_ids(albums_with_track_ids["track_ids"][batch_keys],
-                                                                      genre=False)
-            timer = _regenerate_token_if_needed(timer, spotify)
-            for batch in tracks:
-                for track in batch["tracks"]:
-                    genre = []
-                    music = spotify.get_music_from_track(track, genre)
-                    # Use .loc for setting the value
-                    albums_with_track_ids.loc[albums_with_track_ids["track_ids"] == music.id, "track"] = music
-
-            if checkpoint:
-                albums_with_track_ids.to_pickle(checkpoint_path)
+
+    if todo:
+        async with SpotifyDataLoader(metrics=metrics) as spotify:
+            # Define the batch size
+            batch_size = 250  # You can change this value as needed
+
+            for i in range(0, len(todo), batch_size):
+                batch = todo[i:i + batch_size]
+
+                try:
+                    tracks, genres = await spotify.get_tracks_from_tracks_ids(pd.Series(batch), genre=False)
+                except Exception as e:
+                    # Retried by the next run
+                    print(f'Tracks retrieval failed for {len(batch)} tracks: {e}')
+                    ledger.record_failed(TRACK_STAGE, batch, e)
+                    continue
+
+                musics = {}
+                for response in tracks:
+                    for track in (response['tracks'] if response else []):
+                        if track:
+                            music = spotify.get_music_from_track(track, [])
+                            musics[music.id] = asdict(music)
+
+                # Tracks unknown to Spotify are recorded as done, without music
+                ledger.record_done(TRACK_STAGE, ((track_id, musics.get(track_id)) for track_id in batch))
 
     end_time = time.time()
 
     print(f'Elapsed time for retrieving all music objects from track_ids: {end_time - start_time}')
 
-    albums_with_track_ids.to_pickle('dataset/album_id_and_musics.pickle')
-    albums_with_track_ids.to_csv('dataset/album_id_and_musics.csv')
+    musics = {track_id: Music(**music) for track_id, music in ledger.results(TRACK_STAGE).items() if music}
+    albums_with_track_ids = assign_musics_to_tracks(albums_with_track_ids, musics)
+
+    save_tracks(albums_with_track_ids)
 
     return albums_with_track_ids
 
 
-def create_musics_dataset():
+def _seed_ledger_from_tables(ledger: WorkLedger):
+    """
+    Mark as done in the ledger the work already saved in the parquet tables by a run that did not record it in the
+    ledger, so that it is not requested again
+
+    Parameters
+    ----------
+    ledger: WorkLedger
+        the ledger to seed
+    """
+    if table_exists('movie_album') and not ledger.counts(ALBUM_STAGE):
+        movie_albums = load_movie_albums()
+        album_ids = movie_albums['album_id'].astype(object).where(movie_albums['album_id'].notna(), None)
+        ledger.record_done(ALBUM_STAGE, zip(_album_search_keys(movie_albums), album_ids))
+
+    if table_exists('album_track') and not ledger.counts(TRACK_IDS_STAGE):
+        album_tracks = load_table('album_track').sort_values(['album_id', 'position'])
+        # The albums without any track have no row in album_track, but their track ids were retrieved all the same
+        track_ids = {}
+        if table_exists('movie_album'):
+            track_ids = dict.fromkeys(load_table('movie_album', columns=['album_id'])['album_id'].dropna(), [])
+        track_ids.update(album_tracks.groupby('album_id')['track_id'].agg(list))
+        ledger.record_done(TRACK_IDS_STAGE, track_ids.items())
+
+    if table_exists('track') and not ledger.counts(TRACK_STAGE):
+        tracks = load_tracks(as_music=True)
+        ledger.record_done(TRACK_STAGE, zip(tracks['track_ids'], map(asdict, tracks['track'])))
+
+
+def create_musics_dataset(scoring_workers: int = None):
+    """
+    Create the movie_album, album_track and track tables, and write the metrics of the Spotify requests to
+    dataset/metrics
+
+    Parameters
+    ----------
+    scoring_workers: int
+        the number of processes scoring the albums found for the movies, by default one per core
+    """
     # Load the data
-    spotify_composers_dataset = pd.read_pickle('dataset/spotify_composers_dataset.pickle')
-    clean_enrich_movies = pd.read_pickle('dataset/clean_enrich_movies.pickle')
+    spotify_composers_dataset = load_table('spotify_composer', columns=['name', 'popularity'])
+    clean_enrich_movies = load_movies_with_composers(columns=['name', 'release_date', 'box_office_revenue'])
 
     composers_to_movies = create_db_to_link_composers_to_movies(clean_enrich_movies)
 
@@ -349,76 +555,82 @@ def create_musics_dataset():
     movie_names_and_date = box_office_and_composer_popularity[
         ["movie_name", "release_date", "movie_revenue", "composer_name"]]
 
-    if os.path.isfile("dataset/movie_album_and_revenue.pickle"):
-        movie_albums_df = pd.read_pickle("dataset/movie_album_and_revenue.pickle")
-    else:
-        get_bearer_token.replace_token("")
-        movie_albums_df = asyncio.run(get_album_ids_into_df(movie_names_and_date, checkpoint=True, save_interval=1))
-
-    # clean the dataframe
-    movie_albums_df = movie_albums_df.dropna(subset=['album_id'])
-    movie_albums_df = movie_albums_df.drop_duplicates(subset=['movie_name'])
-
-    if os.path.isfile("dataset/movie_album_and_revenue_with_track_ids.pickle"):
-        movie_albums_df = pd.read_pickle("dataset/movie_album_and_revenue_with_track_ids.pickle")
-    else:
-        get_bearer_token.replace_token("")
-        asyncio.run(get_track_ids_into_df(movie_albums_df, checkpoint=True, save_interval=1))
-
-    # clean the dataframe
-    movie_albums_df = movie_albums_df.dropna(subset=['track_ids'])
-    movie_albums_df = movie_albums_df.drop_duplicates(subset=['movie_name'])
-
-    # Create a dataframe only containing the album id and the track ids
-    albums_with_tracks = movie_albums_df.explode('track_ids')
-    albums_with_tracks = albums_with_tracks[["album_id", "track_ids"]]
-    mask = albums_with_tracks["track_ids"].str.len() != 22
-    albums_with_tracks = albums_with_tracks[~mask]
-
-    if os.path.isfile("dataset/album_id_and_musics.pickle"):
-        print("Enrichment already done!!")
-    else:
-        # Get the music object from track ids
-        get_bearer_token.replace_token("")
-        asyncio.run(get_music_from_track_ids(albums_with_tracks, checkpoint=True, save_interval=1))
+    metrics = LoaderMetrics('spotify')
+
+    # Every stage only processes the movies, albums and tracks that are not done yet in the ledger
+    with WorkLedger(WORK_LEDGER_PATH) as ledger:
+        _seed_ledger_from_tables(ledger)
+
+        try:
+            movie_albums_df = asyncio.run(get_album_ids_into_df(movie_names_and_date, ledger, scoring_workers, metrics))
+
+            # clean the dataframe
+            movie_albums_df = movie_albums_df.dropna(subset=['album_id'])
+            movie_albums_df = movie_albums_df.drop_duplicates(subset=['movie_name'])
+
+            movie_albums_df = asyncio.run(get_track_ids_into_df(movie_albums_df, ledger, metrics))
+
+            # clean the dataframe
+            movie_albums_df = movie_albums_df.dropna(subset=['track_ids'])
+            movie_albums_df = movie_albums_df.drop_duplicates(subset=['movie_name'])
+
+            # Create a dataframe only containing the album id and the track ids
+            albums_with_tracks = movie_albums_df.explode('track_ids')
+            albums_with_tracks = albums_with_tracks[["album_id", "track_ids"]]
+            mask = albums_with_tracks["track_ids"].str.len() != 22
+            albums_with_tracks = albums_with_tracks[~mask]
+
+            # Get the music object from track ids
+            asyncio.run(get_music_from_track_ids(albums_with_tracks, ledger, metrics))
+        finally:
+            metrics.write(SPOTIFY_METRICS_PATH, prometheus=True)
+
+        for stage in [ALBUM_STAGE, TRACK_IDS_STAGE, TRACK_STAGE]:
+            print(f'{stage}: {ledger.counts(stage)}')
 
     print("Enrichment done!!")
 
 
 def create_db_to_link_composers_to_movies(movies: pd.DataFrame) -> pd.DataFrame:
-    """Description if needed"""
-    # Initialize the new database
-    db_to_link_composers_to_movies = pd.DataFrame(
-        columns=['tmdb_id', 'comp_id', 'movie_name', 'movie_revenue', 'composer_name', 'release_date',
-                 'composer_place_of_birth']
-    )
-    # Set the index to be unique (pair of ids)
-    db_to_link_composers_to_movies.set_index(['tmdb_id', 'comp_id'], inplace=True)
-
-    # Description TODO
-    for _, movie in movies.iterrows():
-        movie_id = movie['tmdb_id']
-        movie_name = movie['name']
-        movie_revenue = movie['box_office_revenue']
-        composers = movie['composers']
-        release_date = movie['release_date']
-
-        if type(composers) == list:  # meaning we have information about composers, otherwise float nan returned
-            for composer in composers:
-                comp_id = composer.id
-                comp_name = composer.name
-                comp_place_of_birth = composer.place_of_birth
-                db_to_link_composers_to_movies.loc[(movie_id, comp_id), :] = \
-                    {'movie_name': movie_name,
-                     'movie_revenue': movie_revenue,
-                     'composer_name': comp_name,
-                     'release_date': release_date,
-                     'composer_place_of_birth': comp_place_of_birth}
-        else:
-            pass
-
-    return db_to_link_composers_to_movies
+    """
+    Build the table linking each movie to each of its composers
+
+    Parameters
+    ----------
+    movies: pd.DataFrame
+        the enriched movies, whose composers column holds a list of Composer (or nan if there is no information about
+        the composers of the movie)
+
+    Returns
+    -------
+    db_to_link_composers_to_movies: pd.DataFrame
+        one row per unique (tmdb_id, comp_id) pair, used as index, with the movie_name, movie_revenue, composer_name,
+        release_date and composer_place_of_birth columns
+    """
+    # One row per (movie, composer), movies without composers are dropped
+    exploded = movies[['tmdb_id', 'name', 'box_office_revenue', 'release_date', 'composers']].explode('composers')
+    exploded = exploded[exploded['composers'].notna()]
+
+    # Extract the attributes of all the composers as columns, reading them once per distinct composer
+    composers = RecordColumns.from_records(Composer, exploded['composers'].to_numpy())
+
+    db_to_link_composers_to_movies = pd.DataFrame({
+        'tmdb_id': exploded['tmdb_id'].to_numpy(),
+        'comp_id': composers['id'],
+        'movie_name': exploded['name'].to_numpy(),
+        'movie_revenue': exploded['box_office_revenue'].to_numpy(),
+        'composer_name': composers['name'],
+        'release_date': exploded['release_date'].to_numpy(),
+        'composer_place_of_birth': composers['place_of_birth'],
+    })
+
+    # The index must be unique (pair of ids)
+    db_to_link_composers_to_movies.drop_duplicates(subset=['tmdb_id', 'comp_id'], inplace=True)
+    return db_to_link_composers_to_movies.set_index(['tmdb_id', 'comp_id'])
 
 
 if __name__ == '__main__':
-    create_musics_dataset()
+    parser = argparse.ArgumentParser(description='Enrich the movies with their Spotify albums and tracks')
+    parser.add_argument('--scoring-workers', type=int, default=None,
+                        help='number of processes scoring the albums (default: one per core, 0 to score them inline)')
+    create_musics_dataset(parser.parse_args().scoring_workers)
@@ -1,8 +1,15 @@
 import json
 
+import numpy as np
 import pandas as pd
 from IPython.core.display_functions import display
 
+# orjson parses the Freebase dictionaries several times faster, but is optional
+try:
+    from orjson import loads as json_loads
+except ImportError:
+    json_loads = json.loads
+
 
 def load_movies(movie_metadata_path: str) -> pd.DataFrame:
     """Load movie metadata dataframe
@@ -36,17 +43,18 @@ def clean_movies(df: pd.DataFrame) -> pd.DataFrame:
     """
     # retain only the features we'll use
     df_used_features = df[['name', 'release_date', 'box_office_revenue', 'countries', 'genres']].copy()
-    # map the dictionaries to list of values, since we do not use the Freebase IDs
+    # map the dictionaries to list of values in a single pass, since we do not use the Freebase IDs
     for dic in ['countries', 'genres']:
-        df_used_features[dic] = df_used_features[dic].apply(json.loads)
-        df_used_features[dic] = df_used_features[dic].apply(dict.values)
-        df_used_features[dic] = df_used_features[dic].apply(list)
+        df_used_features[dic] = [list(json_loads(d).values()) for d in df_used_features[dic].tolist()]
     # drop NaNs excepts from box_office_revenue
     df_no_nans = df_used_features.dropna(subset=df_used_features.columns.difference(['box_office_revenue'])).copy()
-    # keep only the year of the release date
-    reg_map = lambda d: d.group(0)[:4]
-    reg = r"\d{4}-\d{2}(-\d{2})?"
-    df_no_nans['release_date'] = df_no_nans['release_date'].str.replace(reg, reg_map, regex=True)
+    # keep only the year of the release date: the dates are almost always exactly 'YYYY', 'YYYY-MM' or 'YYYY-MM-DD'
+    # so they are sliced, and only the few other values go through the regex replacement
+    reg = r"(\d{4})-\d{2}(?:-\d{2})?"
+    release_date = df_no_nans['release_date']
+    other_format = ~release_date.str.fullmatch(r"\d{4}(?:-\d{2}(?:-\d{2})?)?")
+    df_no_nans['release_date'] = release_date.str.slice(0, 4)
+    df_no_nans.loc[other_format, 'release_date'] = release_date[other_format].str.replace(reg, r"\1", regex=True)
     df_no_nans['release_date'].astype('int', copy=False)
 
     # we want the tuple (name, release date) to be unique
@@ -70,8 +78,9 @@ def clean_movies_revenue(df: pd.DataFrame) -> pd.DataFrame:
     The cleaned dataset
     """
     result = df.copy()
-    result["box_office_revenue"] = result.agg(
-        lambda x: x["box_office_revenue"] if not pd.isna(x["box_office_revenue"]) else x["tmdb_revenue"], axis=1)
+    box_office_revenue = result["box_office_revenue"].to_numpy(dtype='float64', na_value=np.nan)
+    tmdb_revenue = result["tmdb_revenue"].to_numpy(dtype='float64', na_value=np.nan)
+    result["box_office_revenue"] = np.where(np.isnan(box_office_revenue), tmdb_revenue, box_office_revenue)
 
     result = result.drop(["tmdb_revenue"], axis=1).dropna(subset='box_office_revenue')
     # sort by box_office_revenue
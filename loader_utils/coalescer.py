@@ -0,0 +1,36 @@
+import asyncio
+from typing import Awaitable, Callable, Hashable
+
+
+class RequestCoalescer:
+    """
+    Deduplicate concurrent identical requests: while a request for a given key is in flight, every other caller asking
+    for the same key awaits the same result instead of sending its own request
+    """
+
+    def __init__(self):
+        self._in_flight: dict[Hashable, asyncio.Future] = {}
+        self.coalesced = 0
+
+    async def run(self, key: Hashable, request: Callable[[], Awaitable]):
+        """Return the result of the request identified by key, sending it only if it is not already in flight
+
+        Parameters
+        ----------
+        key: identifier of the request, typically its url
+        request: function returning the coroutine that performs the request
+
+        Returns
+        -------
+        The result of the request
+        """
+        task = self._in_flight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(request())
+            self._in_flight[key] = task
+            task.add_done_callback(lambda _: self._in_flight.pop(key, None))
+        else:
+            self.coalesced += 1
+
+        # Shield the shared task, so that a cancelled caller does not cancel the request of the others
+        return await asyncio.shield(task)
@@ -0,0 +1,251 @@
+import json
+import math
+import os
+import time
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+from os.path import dirname
+
+import aiohttp
+
+# Upper bounds in seconds of the latency histogram buckets
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, math.inf)
+
+
+class RequestObservation:
+    """
+    Outcome of one request being tracked, filled by the loader while the request is performed
+    """
+
+    def __init__(self):
+        self.status = None
+        self.nb_bytes = 0
+
+
+class EndpointMetrics:
+    """
+    Metrics of the requests of one endpoint class
+    """
+
+    def __init__(self):
+        self.statuses = Counter()
+        self.latency_buckets = [0] * len(LATENCY_BUCKETS)
+        self.latency_sum = 0.0
+        self.bytes_received = 0
+        self.retries = 0
+        self.throttled = 0
+        self.cache_hits = 0
+        self.cache_misses = 0
+
+    @property
+    def requests(self) -> int:
+        return sum(self.statuses.values())
+
+    def observe_latency(self, latency: float):
+        self.latency_sum += latency
+        for i, bound in enumerate(LATENCY_BUCKETS):
+            if latency <= bound:
+                self.latency_buckets[i] += 1
+                return
+
+    def latency_quantile(self, q: float) -> float:
+        """Upper bound of the histogram bucket holding the q-quantile of the latency (nan without requests)"""
+        count = sum(self.latency_buckets)
+        if count == 0:
+            return math.nan
+        cumulated = 0
+        for bound, bucket in zip(LATENCY_BUCKETS, self.latency_buckets):
+            cumulated += bucket
+            if cumulated >= q * count:
+                return bound
+        return math.inf
+
+
+class LoaderMetrics:
+    """
+    Metrics of the requests performed by a data loader, per endpoint class: number of requests per status, latency
+    histogram, bytes received, retries, throttled requests and cache hits, along with the number of requests in flight.
+
+    They can be exported as a JSON summary, or as a Prometheus text file to be picked up by a node exporter.
+
+    e.g. with metrics.track('search') as request:
+            async with session.get(url) as response:
+                request.status = response.status
+                ...
+    """
+
+    def __init__(self, name: str):
+        """
+        Parameters
+        ----------
+        name: name of the loader, e.g. 'tmdb' or 'spotify', used as label of the exported metrics
+        """
+        self.name = name
+        self.endpoints: dict[str, EndpointMetrics] = defaultdict(EndpointMetrics)
+
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self._in_flight_time = 0.0
+        self._start = self._last_change = time.monotonic()
+
+    def _change_in_flight(self, delta: int):
+        now = time.monotonic()
+        self._in_flight_time += self.in_flight * (now - self._last_change)
+        self._last_change = now
+        self.in_flight += delta
+        self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+
+    @contextmanager
+    def track(self, endpoint: str):
+        """Track one request of the endpoint class: its latency and concurrency, and the status and number of bytes
+        set on the yielded observation. A request raising a ClientResponseError is recorded with its status, and any
+        other error with the 'error' status
+
+        Parameters
+        ----------
+        endpoint: the endpoint class of the request
+
+        Returns
+        -------
+        The observation of the request, to fill
+        """
+        observation = RequestObservation()
+        self._change_in_flight(1)
+        start = time.perf_counter()
+        try:
+            yield observation
+        except aiohttp.ClientResponseError as e:
+            observation.status = e.status
+            raise
+        except Exception:
+            observation.status = 'error'
+            raise
+        finally:
+            metrics = self.endpoints[endpoint]
+            metrics.observe_latency(time.perf_counter() - start)
+            metrics.statuses[str(observation.status)] += 1
+            if observation.status == 429:
+                metrics.throttled += 1
+            metrics.bytes_received += observation.nb_bytes
+            self._change_in_flight(-1)
+
+    def retried(self, endpoint: str, nb_retries: int = 1):
+        """Record that requests of the endpoint class were retried"""
+        if nb_retries:
+            self.endpoints[endpoint].retries += nb_retries
+
+    def cache_hit(self, endpoint: str):
+        """Record that a request of the endpoint class was served by the response cache"""
+        self.endpoints[endpoint].cache_hits += 1
+
+    def cache_miss(self, endpoint: str):
+        """Record that a request of the endpoint class was not in the response cache"""
+        self.endpoints[endpoint].cache_misses += 1
+
+    @property
+    def mean_in_flight(self) -> float:
+        """Time-weighted mean number of requests in flight since the creation of the metrics"""
+        now = time.monotonic()
+        elapsed = now - self._start
+        in_flight_time = self._in_flight_time + self.in_flight * (now - self._last_change)
+        return in_flight_time / elapsed if elapsed > 0 else 0.0
+
+    def summary(self) -> dict:
+        """JSON serializable summary of the metrics
+
+        Returns
+        -------
+        A dict with the global metrics, and the metrics of each endpoint class
+        """
+        endpoints = {}
+        for endpoint, metrics in sorted(self.endpoints.items()):
+            cache_lookups = metrics.cache_hits + metrics.cache_misses
+            endpoints[endpoint] = {
+                'requests': metrics.requests,
+                'statuses': dict(metrics.statuses),
+                'retries': metrics.retries,
+                'throttled': metrics.throttled,
+                'bytes_received': metrics.bytes_received,
+                'total_latency_seconds': round(metrics.latency_sum, 3),
+                'mean_latency_seconds': round(metrics.latency_sum / metrics.requests, 4) if metrics.requests else None,
+                # Upper bounds of the histogram buckets, None if there was no request
+                **{f'p{round(q * 100)}_latency_seconds': metrics.latency_quantile(q) if metrics.requests else None
+                   for q in (0.5, 0.9, 0.99)},
+                'cache_hits': metrics.cache_hits,
+                'cache_hit_rate': round(metrics.cache_hits / cache_lookups, 4) if cache_lookups else None,
+            }
+
+        return {
+            'loader': self.name,
+            'elapsed_seconds': round(time.monotonic() - self._start, 3),
+            'requests': sum(metrics['requests'] for metrics in endpoints.values()),
+            'peak_in_flight': self.peak_in_flight,
+            'mean_in_flight': round(self.mean_in_flight, 2),
+            'endpoints': endpoints,
+        }
+
+    def to_prometheus(self) -> str:
+        """Export the metrics in the Prometheus text exposition format
+
+        Returns
+        -------
+        The content of the Prometheus text file
+        """
+        lines = []
+
+        def metric(name: str, kind: str, description: str, samples: list[tuple[str, dict, float]]):
+            lines.append(f'# HELP {name} {description}')
+            lines.append(f'# TYPE {name} {kind}')
+            for suffix, labels, value in samples:
+                labels = ','.join(f'{key}="{label}"' for key, label in {'loader': self.name, **labels}.items())
+                lines.append(f'{name}{suffix}{{{labels}}} {value}')
+
+        endpoints = sorted(self.endpoints.items())
+        metric('loader_requests_total', 'counter', 'Requests sent, per endpoint and status',
+               [('', {'endpoint': endpoint, 'status': status}, count)
+                for endpoint, metrics in endpoints for status, count in sorted(metrics.statuses.items())])
+
+        latency_samples = []
+        for endpoint, metrics in endpoints:
+            cumulated = 0
+            for bound, bucket in zip(LATENCY_BUCKETS, metrics.latency_buckets):
+                cumulated += bucket
+                le = '+Inf' if bound == math.inf else str(bound)
+                latency_samples.append(('_bucket', {'endpoint': endpoint, 'le': le}, cumulated))
+            latency_samples.append(('_sum', {'endpoint': endpoint}, metrics.latency_sum))
+            latency_samples.append(('_count', {'endpoint': endpoint}, cumulated))
+        metric('loader_request_duration_seconds', 'histogram', 'Latency of the requests', latency_samples)
+
+        for name, attribute, description in [
+            ('loader_response_bytes_total', 'bytes_received', 'Bytes received in the response bodies'),
+            ('loader_retries_total', 'retries', 'Requests retried after a transient error or a refreshed token'),
+            ('loader_throttled_total', 'throttled', 'Requests throttled by the API'),
+            ('loader_cache_hits_total', 'cache_hits', 'Requests served by the response cache'),
+            ('loader_cache_misses_total', 'cache_misses', 'Requests missing from the response cache'),
+        ]:
+            metric(name, 'counter', description,
+                   [('', {'endpoint': endpoint}, getattr(metrics, attribute)) for endpoint, metrics in endpoints])
+
+        metric('loader_in_flight_peak', 'gauge', 'Maximum number of requests in flight at the same time',
+               [('', {}, self.peak_in_flight)])
+        metric('loader_in_flight_mean', 'gauge', 'Time-weighted mean number of requests in flight',
+               [('', {}, round(self.mean_in_flight, 2))])
+
+        return '\n'.join(lines) + '\n'
+
+    def write(self, path: str, prometheus: bool = False):
+        """Write the JSON summary of the metrics, and optionally the Prometheus text file next to it (same path with
+        a .prom extension)
+
+        Parameters
+        ----------
+        path: path of the JSON file
+        prometheus: whether to also write the Prometheus text file
+        """
+        if dirname(path):
+            os.makedirs(dirname(path), exist_ok=True)
+        with open(path, 'w') as file:
+            json.dump(self.summary(), file, indent=2)
+        if prometheus:
+            with open(f'{os.path.splitext(path)[0]}.prom', 'w') as file:
+                file.write(self.to_prometheus())
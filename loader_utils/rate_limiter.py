@@ -0,0 +1,143 @@
+import asyncio
+import time
+
+
+class AdaptiveRateLimiter:
+    """
+    Rate limiter shared by all the requests of a data loader. It combines:
+        - a token bucket, that spreads the requests evenly at a given rate (with a small burst allowed)
+        - AIMD (additive increase, multiplicative decrease) of both the rate of the bucket and a concurrency window:
+          the rate grows by rate_increase requests per second every second of successful requests and the window by
+          one slot every time a full window of requests succeeded, until the API throttles us, which halves both
+        - a global pause, to honour precisely the Retry-After header of a throttled response
+
+    Should be used as an async context manager around each request, and notified of the outcome of the request with
+    succeeded() or throttled()
+
+    e.g. async with limiter:
+            response = ...
+            limiter.succeeded()
+    """
+
+    def __init__(self, rate: float, burst: int = 1, initial_concurrency: int = 10, max_concurrency: int = 50,
+                 min_concurrency: int = 1, min_rate: float = 1.0, max_rate: float = None, rate_increase: float = 1.0):
+        """
+        Parameters
+        ----------
+        rate: initial number of requests per second
+        burst: number of requests that can be sent at once when the bucket is full
+        initial_concurrency: initial number of requests allowed in flight
+        max_concurrency: maximum number of requests in flight, should not exceed the connection pool size
+        min_concurrency: minimum number of requests in flight
+        min_rate: minimum number of requests per second
+        max_rate: maximum number of requests per second, unbounded if None
+        rate_increase: number of requests per second added to the rate every second of successful requests
+        """
+        self._min_rate = min_rate
+        self._max_rate = max_rate if max_rate is not None else float('inf')
+        self._rate_increase = rate_increase
+        self._rate = min(max(rate, min_rate), self._max_rate)
+        self._burst = burst
+        self._tokens = float(burst)
+        self._last_refill = time.monotonic()
+        self._paused_until = 0.0
+        self._token_lock = asyncio.Lock()
+
+        self._min_concurrency = min_concurrency
+        self._max_concurrency = max_concurrency
+        self._concurrency = float(initial_concurrency)
+        self._in_flight = 0
+        self._window = asyncio.Condition()
+
+        self._start_time = None
+        self.completed = 0
+        self.throttled_count = 0
+
+    async def __aenter__(self):
+        await self.acquire()
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.release()
+
+    async def acquire(self):
+        """Wait for a free slot in the concurrency window, then for a token"""
+        async with self._window:
+            await self._window.wait_for(lambda: self._in_flight < int(self._concurrency))
+            self._in_flight += 1
+        try:
+            await self._acquire_token()
+        except BaseException:
+            await self.release()
+            raise
+
+    async def release(self):
+        """Free the slot of a request in the concurrency window"""
+        async with self._window:
+            self._in_flight -= 1
+            self._window.notify_all()
+
+    async def _acquire_token(self):
+        """Wait until a token is available. The lock is held while sleeping so that waiters are served in order, and
+        the requests stay evenly spaced"""
+        async with self._token_lock:
+            if self._start_time is None:
+                self._start_time = time.monotonic()
+
+            while True:
+                now = time.monotonic()
+                if now < self._paused_until:
+                    await asyncio.sleep(self._paused_until - now)
+                    continue
+
+                self._tokens = min(self._burst, self._tokens + (now - self._last_refill) * self._rate)
+                self._last_refill = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self._rate)
+
+    def succeeded(self):
+        """Notify the limiter that a request succeeded, growing the rate and the concurrency window (additive
+        increase)"""
+        self.completed += 1
+        # At the current rate, rate_increase is added once per second of successful requests
+        self._rate = min(self._max_rate, self._rate + self._rate_increase / self._rate)
+        self._concurrency = min(self._max_concurrency, self._concurrency + 1 / self._concurrency)
+
+    def throttled(self, retry_after: float):
+        """Notify the limiter that a request was throttled, halving the rate and the concurrency window
+        (multiplicative decrease) and pausing every request until the Retry-After delay is over
+
+        Parameters
+        ----------
+        retry_after: number of seconds to wait before sending any new request
+        """
+        self.throttled_count += 1
+        # The requests already in flight when the API started throttling us are answered during the same pause, and
+        # only halve the rate and the window once
+        if time.monotonic() >= self._paused_until:
+            self._rate = max(self._min_rate, self._rate / 2)
+            self._concurrency = max(self._min_concurrency, self._concurrency / 2)
+        self._paused_until = max(self._paused_until, time.monotonic() + retry_after)
+        # The bucket is emptied, so that the requests restart evenly spaced instead of in a burst
+        self._tokens = 0.0
+        self._last_refill = self._paused_until
+
+    @property
+    def concurrency(self) -> int:
+        """Current size of the concurrency window"""
+        return int(self._concurrency)
+
+    @property
+    def rate(self) -> float:
+        """Current rate of the token bucket, in requests per second"""
+        return self._rate
+
+    @property
+    def requests_per_second(self) -> float:
+        """Achieved rate of successful requests since the first request"""
+        if self._start_time is None:
+            return 0.0
+        elapsed = time.monotonic() - self._start_time
+        return self.completed / elapsed if elapsed > 0 else 0.0
@@ -0,0 +1,204 @@
+import hashlib
+import json
+import os
+import sqlite3
+import time
+import urllib.parse
+import zlib
+from os.path import dirname
+
+
+class CacheMissError(Exception):
+    """Raised when a response is not in the cache while the cache is in offline replay mode"""
+
+    def __init__(self, url: str):
+        super().__init__(f'No cached response for {url} (offline replay mode)')
+        self.url = url
+
+
+class ResponseCache:
+    """
+    Persistent on-disk cache of JSON responses, stored in a SQLite database and keyed by a hash of the normalized url.
+
+    Each entry belongs to an endpoint class (e.g. 'search', 'movie', 'person'), which decides how long the entry stays
+    valid. Once the database grows over max_size_bytes, the least recently used entries are evicted.
+
+    In read-only mode (offline replay), nothing is ever written and a miss raises a CacheMissError instead of letting
+    the caller go to the network.
+
+    The access times of the hits are only kept in memory, and written in batches (with the next stored response, every
+    TOUCH_BATCH_SIZE hits, before an eviction and on close), so that a fully cached re-run does not write on every hit.
+    """
+
+    # Maximum number of access times kept in memory before writing them
+    TOUCH_BATCH_SIZE = 1000
+
+    def __init__(self, path: str, ttl: dict[str, float] = None, default_ttl: float = None,
+                 max_size_bytes: int = 2 * 1024 ** 3, read_only: bool = False):
+        """
+        Parameters
+        ----------
+        path: path of the sqlite database, created if missing (unless read_only)
+        ttl: time to live in seconds per endpoint class, None meaning the entry never expires
+        default_ttl: time to live in seconds of endpoint classes missing from ttl
+        max_size_bytes: maximum size of the stored payloads before evicting the least recently used entries
+        read_only: offline replay mode, never write to the cache and raise CacheMissError on miss
+        """
+        self._ttl = ttl if ttl is not None else {}
+        self._default_ttl = default_ttl
+        self._max_size_bytes = max_size_bytes
+        self.read_only = read_only
+
+        self.hits = 0
+        self.misses = 0
+
+        # Access time of the entries hit since the last write, by key
+        self._touched = {}
+
+        if read_only:
+            self._connection = sqlite3.connect(f'file:{path}?mode=ro', uri=True)
+        else:
+            if dirname(path):
+                os.makedirs(dirname(path), exist_ok=True)
+            self._connection = sqlite3.connect(path)
+            self._connection.execute('PRAGMA journal_mode=WAL')
+            self._connection.execute('CREATE TABLE IF NOT EXISTS responses ('
+                                     'key TEXT PRIMARY KEY, '
+                                     'url TEXT NOT NULL, '
+                                     'endpoint TEXT NOT NULL, '
+                                     'payload BLOB NOT NULL, '
+                                     'size INTEGER NOT NULL, '
+                                     'created_at REAL NOT NULL, '
+                                     'accessed_at REAL NOT NULL)')
+            self._connection.execute('CREATE INDEX IF NOT EXISTS responses_accessed_at ON responses (accessed_at)')
+            self._connection.commit()
+
+        self._size = self._connection.execute('SELECT COALESCE(SUM(size), 0) FROM responses').fetchone()[0]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def close(self):
+        """Write the pending access times and close the underlying database connection"""
+        if self._touched:
+            self._flush_touched()
+            self._connection.commit()
+        self._connection.close()
+
+    def _flush_touched(self):
+        """Write the access times of the entries hit since the last write, without committing"""
+        self._connection.executemany('UPDATE responses SET accessed_at = ? WHERE key = ?',
+                                     [(accessed_at, key) for key, accessed_at in self._touched.items()])
+        self._touched.clear()
+
+    @staticmethod
+    def normalize_url(url: str) -> str:
+        """Normalize the url so that equivalent requests share the same key: lowercase scheme and host, and sort the
+        query parameters
+
+        Parameters
+        ----------
+        url: the url to normalize
+
+        Returns
+        -------
+        The normalized url
+        """
+        parts = urllib.parse.urlsplit(url)
+        query = urllib.parse.urlencode(sorted(urllib.parse.parse_qsl(parts.query, keep_blank_values=True)))
+        return urllib.parse.urlunsplit((parts.scheme.lower(), parts.netloc.lower(), parts.path, query, ''))
+
+    @classmethod
+    def _key(cls, url: str) -> str:
+        return hashlib.sha256(cls.normalize_url(url).encode()).hexdigest()
+
+    def _is_expired(self, endpoint: str, created_at: float) -> bool:
+        ttl = self._ttl.get(endpoint, self._default_ttl)
+        return ttl is not None and time.time() - created_at > ttl
+
+    def get(self, url: str, endpoint: str):
+        """Return the cached response of the url
+
+        Parameters
+        ----------
+        url: the url of the request
+        endpoint: the endpoint class of the request, used to check the time to live
+
+        Returns
+        -------
+        The decoded JSON response, or None if the url is not cached or expired
+
+        Raises
+        ------
+        CacheMissError if the response is not available and the cache is in offline replay mode
+        """
+        key = self._key(url)
+        row = self._connection.execute('SELECT payload, created_at FROM responses WHERE key = ?', (key,)).fetchone()
+
+        # In offline replay mode, an expired entry is still better than nothing
+        if row is None or (not self.read_only and self._is_expired(endpoint, row[1])):
+            self.misses += 1
+            if self.read_only:
+                raise CacheMissError(url)
+            return None
+
+        self.hits += 1
+        if not self.read_only:
+            self._touched[key] = time.time()
+            if len(self._touched) >= self.TOUCH_BATCH_SIZE:
+                self._flush_touched()
+                self._connection.commit()
+        return json.loads(zlib.decompress(row[0]))
+
+    def set(self, url: str, endpoint: str, response):
+        """Store the response of the url, evicting the least recently used entries if the cache is full
+
+        Parameters
+        ----------
+        url: the url of the request
+        endpoint: the endpoint class of the request
+        response: the decoded JSON response to store
+        """
+        if self.read_only:
+            return
+
+        key = self._key(url)
+        payload = zlib.compress(json.dumps(response, separators=(',', ':')).encode())
+        now = time.time()
+
+        previous = self._connection.execute('SELECT size FROM responses WHERE key = ?', (key,)).fetchone()
+        if previous is not None:
+            self._size -= previous[0]
+
+        # The pending access times are written in the same transaction as the response
+        self._touched.pop(key, None)
+        self._flush_touched()
+        self._connection.execute('INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?, ?)',
+                                 (key, self.normalize_url(url), endpoint, payload, len(payload), now, now))
+        self._size += len(payload)
+
+        if self._size > self._max_size_bytes:
+            self._evict()
+
+        self._connection.commit()
+
+    def _evict(self):
+        """Delete the least recently used entries until the cache goes back under 90% of its maximum size"""
+        target = self._max_size_bytes * 0.9
+        rows = self._connection.execute('SELECT key, size FROM responses ORDER BY accessed_at')
+        to_delete = []
+        for key, size in rows:
+            if self._size <= target:
+                break
+            to_delete.append((key,))
+            self._size -= size
+        self._connection.executemany('DELETE FROM responses WHERE key = ?', to_delete)
+
+    @property
+    def hit_rate(self) -> float:
+        """Proportion of lookups served from the cache"""
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
@@ -0,0 +1,66 @@
+import asyncio
+import random
+from dataclasses import dataclass
+
+import aiohttp
+
+
+@dataclass(frozen=True)
+class RetryPolicy:
+    """
+    Decide whether a failed request should be retried, and how long to wait before retrying it.
+
+    Only transient errors are retried: timeouts, connection errors, and responses whose status is in
+    retryable_statuses. The delay grows exponentially with the attempt number, with full jitter so that failed
+    requests do not all come back at the same time, unless the response asked for a precise Retry-After delay.
+    """
+    max_attempts: int = 5
+    base_delay: float = 0.5
+    max_delay: float = 30.0
+    retryable_statuses: frozenset[int] = frozenset({408, 425, 429, 500, 502, 503, 504})
+
+    def is_retryable(self, error: BaseException) -> bool:
+        """Whether the error is transient, and the request worth retrying
+
+        Parameters
+        ----------
+        error: the exception raised by the request
+
+        Returns
+        -------
+        True if the request should be retried
+        """
+        if isinstance(error, aiohttp.ClientResponseError):
+            return error.status in self.retryable_statuses
+        return isinstance(error, (aiohttp.ClientConnectionError, aiohttp.ClientPayloadError, asyncio.TimeoutError))
+
+    def delay(self, attempt: int, error: BaseException = None) -> float:
+        """Number of seconds to wait before the next attempt
+
+        Parameters
+        ----------
+        attempt: the number of the attempt that just failed, starting at 1
+        error: the exception raised by the request, whose Retry-After header is honoured if present
+
+        Returns
+        -------
+        The delay in seconds
+        """
+        if isinstance(error, aiohttp.ClientResponseError) and error.headers and error.headers.get('Retry-After'):
+            try:
+                return float(error.headers['Retry-After'])
+            except ValueError:
+                pass
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** (attempt - 1)))
+
+
+@dataclass
+class FailedRequest:
+    """
+    Request that still failed after all the attempts allowed by its retry policy, kept in a dead-letter list so that it
+    can be inspected or retried later without re-running the requests that succeeded
+    """
+    url: str
+    request_descr: str
+    error: BaseException
+    attempts: int
@@ -0,0 +1,154 @@
+import json
+import os
+import sqlite3
+import time
+from os.path import dirname
+from typing import Any, Iterable
+
+PENDING = 'pending'
+DONE = 'done'
+FAILED = 'failed'
+
+
+class WorkLedger:
+    """
+    Persistent per-key record of the work done by each stage of an enrichment pipeline, stored in a SQLite database.
+
+    Every key (a movie, an album, a track...) of a stage has one row holding its status and, once done, its JSON
+    encoded result. A stage registers the keys it has to process, asks for the ones that are not done yet (new or
+    failed), and records the results batch by batch in small transactions. After a crash, re-running the stage
+    therefore only processes the remaining keys, instead of reloading and re-writing the whole dataframe.
+
+    e.g. with WorkLedger('dataset/cache/work_ledger.sqlite') as ledger:
+            todo = ledger.pending('album_id', keys)
+            ...
+            ledger.record_done('album_id', batch_results.items())
+    """
+
+    def __init__(self, path: str = ':memory:'):
+        """
+        Parameters
+        ----------
+        path: path of the sqlite database, created if missing. By default the ledger only lives in memory
+        """
+        if path != ':memory:' and dirname(path):
+            os.makedirs(dirname(path), exist_ok=True)
+        self._connection = sqlite3.connect(path)
+        self._connection.execute('PRAGMA journal_mode=WAL')
+        self._connection.execute('CREATE TABLE IF NOT EXISTS work ('
+                                 'stage TEXT NOT NULL, '
+                                 'key TEXT NOT NULL, '
+                                 'status TEXT NOT NULL, '
+                                 'result TEXT, '
+                                 'error TEXT, '
+                                 'attempts INTEGER NOT NULL DEFAULT 0, '
+                                 'updated_at REAL NOT NULL, '
+                                 'PRIMARY KEY (stage, key))')
+        self._connection.commit()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def close(self):
+        """Close the underlying database connection"""
+        self._connection.close()
+
+    def register(self, stage: str, keys: Iterable[str]):
+        """Add the keys missing from the stage as pending, leaving the status of the known ones untouched
+
+        Parameters
+        ----------
+        stage: name of the stage
+        keys: the keys the stage has to process
+        """
+        now = time.time()
+        with self._connection:
+            self._connection.executemany('INSERT OR IGNORE INTO work (stage, key, status, updated_at) '
+                                         'VALUES (?, ?, ?, ?)', ((stage, key, PENDING, now) for key in keys))
+
+    def pending(self, stage: str, keys: Iterable[str] = None) -> list[str]:
+        """Keys of the stage that still have to be processed, i.e. new, pending or failed ones
+
+        Parameters
+        ----------
+        stage: name of the stage
+        keys: if given, register these keys first and only return the pending ones among them, in the same order
+
+        Returns
+        -------
+        The keys to process
+        """
+        if keys is None:
+            rows = self._connection.execute('SELECT key FROM work WHERE stage = ? AND status != ?', (stage, DONE))
+            return [key for key, in rows]
+
+        keys = list(dict.fromkeys(keys))
+        self.register(stage, keys)
+        done = set(key for key, in self._connection.execute('SELECT key FROM work WHERE stage = ? AND status = ?',
+                                                            (stage, DONE)))
+        return [key for key in keys if key not in done]
+
+    def record_done(self, stage: str, results: Iterable[tuple[str, Any]]):
+        """Record the results of processed keys, in a single transaction
+
+        Parameters
+        ----------
+        stage: name of the stage
+        results: iterable of (key, result) tuples, the result being JSON serializable (None if nothing was found)
+        """
+        now = time.time()
+        with self._connection:
+            self._connection.executemany(
+                'INSERT INTO work (stage, key, status, result, error, attempts, updated_at) '
+                'VALUES (?, ?, ?, ?, NULL, 1, ?) '
+                'ON CONFLICT (stage, key) DO UPDATE SET status = excluded.status, result = excluded.result, '
+                'error = NULL, attempts = attempts + 1, updated_at = excluded.updated_at',
+                ((stage, key, DONE, json.dumps(result, separators=(',', ':')), now) for key, result in results))
+
+    def record_failed(self, stage: str, keys: Iterable[str], error: BaseException):
+        """Record that processing the keys failed, so that they are retried by the next run
+
+        Parameters
+        ----------
+        stage: name of the stage
+        keys: the keys that failed
+        error: the exception raised while processing them
+        """
+        now = time.time()
+        with self._connection:
+            self._connection.executemany(
+                'INSERT INTO work (stage, key, status, error, attempts, updated_at) VALUES (?, ?, ?, ?, 1, ?) '
+                'ON CONFLICT (stage, key) DO UPDATE SET status = excluded.status, error = excluded.error, '
+                'attempts = attempts + 1, updated_at = excluded.updated_at',
+                ((stage, key, FAILED, repr(error), now) for key in keys))
+
+    def results(self, stage: str) -> dict[str, Any]:
+        """Results of all the keys of the stage that are done
+
+        Parameters
+        ----------
+        stage: name of the stage
+
+        Returns
+        -------
+        A dict mapping each done key to its decoded result
+        """
+        rows = self._connection.execute('SELECT key, result FROM work WHERE stage = ? AND status = ?', (stage, DONE))
+        return {key: json.loads(result) for key, result in rows}
+
+    def counts(self, stage: str) -> dict[str, int]:
+        """Number of keys of the stage per status
+
+        Parameters
+        ----------
+        stage: name of the stage
+
+        Returns
+        -------
+        A dict mapping each status to its number of keys
+        """
+        rows = self._connection.execute('SELECT status, COUNT(*) FROM work WHERE stage = ? GROUP BY status', (stage,))
+        return dict(rows.fetchall())
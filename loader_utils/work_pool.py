@@ -0,0 +1,120 @@
+import asyncio
+from dataclasses import dataclass
+from typing import Any, AsyncIterator, Awaitable, Callable, Hashable, Iterable
+
+from loader_utils.retry import RetryPolicy
+
+
+@dataclass
+class WorkResult:
+    """
+    Result of one item processed by a WorkPool, along with the argument it was processed with. If the item failed
+    after all its attempts, result is None and error holds the last exception raised
+    """
+    key: Hashable
+    arg: Any = None
+    result: Any = None
+    error: BaseException = None
+    attempts: int = 1
+
+
+class WorkPool:
+    """
+    Bounded-concurrency scheduler streaming the results of an async function applied to many items.
+
+    Items are pulled lazily from the input iterable, so that at most max_in_flight of them are processed at the same
+    time, and results are yielded in completion order as soon as they are available. Memory therefore stays
+    constant whatever the number of items, as long as the caller does not keep the raw results.
+
+    e.g. async for work in WorkPool(max_in_flight=50).stream(fetch, ((idx, url) for idx, url in urls.items())):
+            process(work.key, work.result)
+    """
+
+    def __init__(self, max_in_flight: int = 50, retry_policy: RetryPolicy = None):
+        """
+        Parameters
+        ----------
+        max_in_flight: maximum number of items processed at the same time
+        retry_policy: decides which failed items are retried and when, None meaning that items are never retried
+        """
+        self._max_in_flight = max_in_flight
+        self._retry_policy = retry_policy
+
+    async def _run(self, func: Callable[[Any], Awaitable], key: Hashable, arg) -> WorkResult:
+        """Process one item, retrying it on failure
+
+        Parameters
+        ----------
+        func: the async function to apply
+        key: the key identifying the item
+        arg: the argument given to func
+
+        Returns
+        -------
+        The result of the item
+        """
+        attempt = 1
+        while True:
+            try:
+                return WorkResult(key, arg, await func(arg), attempts=attempt)
+            except Exception as e:
+                policy = self._retry_policy
+                if policy is None or attempt >= policy.max_attempts or not policy.is_retryable(e):
+                    return WorkResult(key, arg, error=e, attempts=attempt)
+                await asyncio.sleep(policy.delay(attempt, e))
+                attempt += 1
+
+    async def stream(self, func: Callable[[Any], Awaitable],
+                     items: Iterable[tuple[Hashable, Any]]) -> AsyncIterator[WorkResult]:
+        """Apply func to every item, yielding the results in completion order
+
+        Parameters
+        ----------
+        func: the async function to apply to the argument of each item
+        items: iterable of (key, argument) tuples, consumed lazily
+
+        Returns
+        -------
+        An async iterator of WorkResult
+        """
+        items = iter(items)
+        pending = set()
+
+        def fill():
+            while len(pending) < self._max_in_flight:
+                try:
+                    key, arg = next(items)
+                except StopIteration:
+                    return
+                pending.add(asyncio.ensure_future(self._run(func, key, arg)))
+
+        try:
+            fill()
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                fill()
+                for task in done:
+                    yield task.result()
+        finally:
+            # If the consumer stops early, do not leave orphan requests behind
+            for task in pending:
+                task.cancel()
+
+    async def map(self, func: Callable[[Any], Awaitable], items: Iterable[tuple[Hashable, Any]]) -> dict:
+        """Apply func to every item and return all the results, raising the first error encountered
+
+        Parameters
+        ----------
+        func: the async function to apply to the argument of each item
+        items: iterable of (key, argument) tuples, consumed lazily
+
+        Returns
+        -------
+        A dict mapping each key to its result
+        """
+        results = {}
+        async for work in self.stream(func, items):
+            if work.error is not None:
+                raise work.error
+            results[work.key] = work.result
+        return results
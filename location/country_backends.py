@@ -0,0 +1,129 @@
+import abc
+import json
+
+import aiohttp
+
+from config import config
+
+SYSTEM_PROMPT = ('Map each given location (a place of birth) to its country. Be consistent over the country names, '
+                 'i.e. if multiple locations are in the USA, map them all to "United States". Use null when the '
+                 'location cannot be placed in a single country. Return every given location exactly as given.')
+
+# Structured output asked to the model, one object per location
+COUNTRIES_SCHEMA = {
+    'type': 'object',
+    'properties': {
+        'countries': {
+            'type': 'array',
+            'items': {
+                'type': 'object',
+                'properties': {
+                    'location': {'type': 'string'},
+                    'country': {'type': ['string', 'null']},
+                },
+                'required': ['location', 'country'],
+                'additionalProperties': False,
+            },
+        },
+    },
+    'required': ['countries'],
+    'additionalProperties': False,
+}
+
+
+class CountryBackend(abc.ABC):
+    """
+    Backend mapping batches of normalized locations to their country, used by location_resolver.LocationResolver for
+    the locations missing from its cache. It is entered with 'async with' before the first batch.
+    """
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        pass
+
+    @abc.abstractmethod
+    async def countries(self, locations: list[str]) -> dict[str, str | None]:
+        """Map the locations to their country
+
+        Parameters
+        ----------
+        locations: the normalized locations of the batch
+
+        Returns
+        -------
+        A dict mapping each location to its country, or None if it has no country
+        """
+
+
+class StaticCountryBackend(CountryBackend):
+    """
+    Local backend answering from a fixed mapping of normalized locations, None for the unknown ones, e.g. to test the
+    resolver or to run it without any API
+    """
+
+    def __init__(self, mapping: dict[str, str | None] = None):
+        """
+        Parameters
+        ----------
+        mapping: the country of each normalized location
+        """
+        self._mapping = mapping if mapping is not None else {}
+        self.requested: list[list[str]] = []
+
+    async def countries(self, locations: list[str]) -> dict[str, str | None]:
+        self.requested.append(list(locations))
+        return {location: self._mapping.get(location) for location in locations}
+
+
+class OpenAICountryBackend(CountryBackend):
+    """
+    Backend asking a chat completion model of the OpenAI API, with a JSON schema as response format so that its
+    answer can be parsed and validated, instead of evaluating python code written by the model
+    """
+
+    def __init__(self, api_key: str = None, model: str = 'gpt-4o-mini',
+                 base_url: str = 'https://api.openai.com/v1'):
+        """
+        Parameters
+        ----------
+        api_key: the OpenAI API key, OPENAI_API_KEY of the config by default
+        model: the model to use, check its pricing please
+        base_url: root url of the OpenAI API
+        """
+        self._api_key = api_key if api_key is not None else config.get('OPENAI_API_KEY')
+        self._model = model
+        self._url = f'{base_url.rstrip("/")}/chat/completions'
+        self._session = None
+
+    async def __aenter__(self):
+        if not self._api_key:
+            raise RuntimeError('No OpenAI API key given, and no OPENAI_API_KEY configured')
+        self._session = aiohttp.ClientSession(headers={'Authorization': f'Bearer {self._api_key}'},
+                                              timeout=aiohttp.ClientTimeout(total=120))
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self._session.close()
+
+    async def countries(self, locations: list[str]) -> dict[str, str | None]:
+        async with self._session.post(self._url, json={
+            'model': self._model,
+            'temperature': 0,
+            'messages': [
+                {'role': 'system', 'content': SYSTEM_PROMPT},
+                {'role': 'user', 'content': json.dumps(locations, ensure_ascii=False)},
+            ],
+            'response_format': {
+                'type': 'json_schema',
+                'json_schema': {'name': 'countries', 'strict': True, 'schema': COUNTRIES_SCHEMA},
+            },
+        }) as response:
+            response.raise_for_status()
+            completion = await response.json()
+
+        message = completion['choices'][0]['message']
+        if message.get('refusal'):
+            raise ValueError(f'The model refused to map the locations: {message["refusal"]}')
+        return {item['location']: item['country'] for item in json.loads(message['content'])['countries']}
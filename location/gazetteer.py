@@ -0,0 +1,214 @@
+import json
+import re
+from collections import defaultdict
+from os.path import dirname, join
+from typing import Iterable
+
+import numpy as np
+import pandas as pd
+import pytz
+from rapidfuzz import fuzz, process
+
+from location.location_resolver import MAPPING_PATH, normalize_location
+
+GAZETTEER_PATH = join(dirname(__file__), 'gazetteer.json')
+
+# Kinds of names of the index, from the most to the least trusted. A name of several kinds (e.g. 'ca', the code of
+# Canada and the abbreviation of California) is indexed with the country of its most trusted kind
+NAME_KINDS = ['country', 'alias', 'subdivision', 'code', 'learned']
+
+# Minimum rapidfuzz ratio, and length, of a location component matched with an approximate name of the index
+FUZZY_SCORE_CUTOFF = 90
+FUZZY_MIN_LENGTH = 5
+
+# Separators of the components of a location, e.g. 'buffalo - new york - usa'
+COMPONENT_SEPARATOR_PATTERN = re.compile(r',|\s+-\s+')
+# Text between parentheses or brackets, e.g. 'west germany (now germany)' or 'russian empire [now ukraine]'
+PARENTHESES_PATTERN = re.compile(r'[(\[]([^)\]]*)[)\]]')
+
+
+def location_components(location: str) -> list[str]:
+    """Split a normalized location into its components, from the last (the broadest, usually the country) to the
+    first, e.g. 'brooklyn, new york, usa' gives ['usa', 'new york', 'brooklyn']
+
+    Parameters
+    ----------
+    location: the normalized location
+
+    Returns
+    -------
+    The components to look up, the text between parentheses or brackets of a component coming before the component
+    itself
+    """
+    components = []
+    for component in reversed(COMPONENT_SEPARATOR_PATTERN.split(location)):
+        for inner in PARENTHESES_PATTERN.findall(component):
+            components.append(inner.strip().removeprefix('now ').removeprefix('present-day ').strip())
+        component = PARENTHESES_PATTERN.sub('', component).strip(' .')
+        components.append(component.removeprefix('the ') if component.startswith('the ') else component)
+    return [component for component in components if component]
+
+
+class Gazetteer:
+    """
+    Offline mapping of locations (e.g. the place of birth of the composers) to their country.
+
+    The components of a location are looked up from the last to the first in a compact index of names (country names,
+    aliases and historical names, ISO codes, first-level subdivisions, and the trailing components learned from the
+    previous mapping csv), the first one found giving the country. The locations with no component in the index fall
+    back to the closest name of the index (rapidfuzz), e.g. for typos. Only the locations left, if any, need
+    location_resolver.LocationResolver and its GPT backend.
+
+    e.g. gazetteer = Gazetteer.load()
+         composers['country'] = gazetteer.resolve(composers['place_of_birth'])
+    """
+
+    def __init__(self, index: dict[str, str], country_names: dict[str, str]):
+        """
+        Parameters
+        ----------
+        index: the ISO code of the country of each normalized name
+        country_names: the name of the country of each ISO code
+        """
+        self._index = index
+        self._country_names = country_names
+        self._names = list(index)
+
+    @classmethod
+    def load(cls, path: str = GAZETTEER_PATH, mapping_path: str | None = MAPPING_PATH) -> 'Gazetteer':
+        """Build the gazetteer from the names of pytz and of the gazetteer json file
+
+        Parameters
+        ----------
+        path: path of the json file of the country name overrides, aliases and subdivisions
+        mapping_path: path of a location,country csv file (e.g. of a previous GPT run) whose trailing components are
+        learned when they all map to the same country, None to not learn any
+
+        Returns
+        -------
+        The gazetteer
+        """
+        with open(path, encoding='utf-8') as file:
+            gazetteer = json.load(file)
+
+        # Names as understood by the 'country names' location mode of plotly
+        country_names = {code: gazetteer['country_names'].get(code, name) for code, name in pytz.country_names.items()}
+
+        names = {kind: {} for kind in NAME_KINDS}
+        for code, name in pytz.country_names.items():
+            names['country'][normalize_location(name)] = code
+            names['country'][normalize_location(country_names[code])] = code
+            names['code'][code.casefold()] = code
+        for kind, kind_names in [('alias', gazetteer['aliases']), ('subdivision', gazetteer['subdivisions'])]:
+            for code, code_names in kind_names.items():
+                names[kind].update((normalize_location(name), code) for name in code_names)
+
+        index = {}
+        for kind in reversed(NAME_KINDS):
+            index.update(names[kind])
+
+        if mapping_path is not None:
+            index = {**cls._learn(pd.read_csv(mapping_path, dtype=str), index), **index}
+        return cls(index, country_names)
+
+    @staticmethod
+    def _learn(mapping: pd.DataFrame, index: dict[str, str]) -> dict[str, str]:
+        """Learn the trailing components of the locations of a mapping that all map to the same known country
+
+        Parameters
+        ----------
+        mapping: the location,country dataframe
+        index: the ISO code of the country of each normalized name already known
+
+        Returns
+        -------
+        The ISO code of the country of each learned component
+        """
+        codes = defaultdict(set)
+        for location, country in zip(mapping['location'], mapping['country']):
+            if not isinstance(location, str) or not isinstance(country, str):
+                continue
+            code = index.get(normalize_location(country))
+            components = location_components(normalize_location(location))
+            if code is not None and components:
+                codes[components[0]].add(code)
+        return {component: code.pop() for component, code in codes.items() if len(code) == 1}
+
+    def __len__(self) -> int:
+        return len(self._index)
+
+    def country_code(self, location: str) -> str | None:
+        """ISO code of the country of a location, only looking up its components as they are written
+
+        Parameters
+        ----------
+        location: the location
+
+        Returns
+        -------
+        The ISO code of the country, None if no component of the location is in the index
+        """
+        for component in location_components(normalize_location(location)):
+            code = self._index.get(component)
+            if code is not None:
+                return code
+        return None
+
+    def resolve(self, locations: pd.Series | Iterable[str], fuzzy: bool = True) -> pd.Series:
+        """Map locations to the name of their country
+
+        Each distinct location is only looked up once, and the locations with no component in the index are matched
+        with the closest names all at once.
+
+        Parameters
+        ----------
+        locations: the locations, missing values are ignored
+        fuzzy: whether to match the components not in the index with the closest names
+
+        Returns
+        -------
+        The country of each location, aligned with the locations, NaN for the ones not found
+        """
+        locations = locations if isinstance(locations, pd.Series) else pd.Series(list(locations), dtype=object)
+        uniques = [location for location in locations.dropna().unique() if isinstance(location, str)]
+
+        codes = {location: self.country_code(location) for location in uniques}
+        residue = [location for location, code in codes.items() if code is None]
+        if fuzzy and residue:
+            codes.update(self._fuzzy_codes(residue))
+
+        countries = {location: self._country_names[code] for location, code in codes.items() if code is not None}
+        return locations.map(countries)
+
+    def _fuzzy_codes(self, locations: list[str]) -> dict[str, str]:
+        """Match the components of the locations with the closest names of the index
+
+        Parameters
+        ----------
+        locations: the locations with no component in the index
+
+        Returns
+        -------
+        The ISO code of the country of the locations with a component close enough to a name
+        """
+        candidates = {location: [component for component in location_components(normalize_location(location))
+                                 if len(component) >= FUZZY_MIN_LENGTH]
+                      for location in locations}
+        components = sorted({component for components in candidates.values() for component in components})
+        if not components:
+            return {}
+
+        # Scores of all the components against all the names at once, 0 when below the cutoff
+        scores = process.cdist(components, self._names, scorer=fuzz.ratio, score_cutoff=FUZZY_SCORE_CUTOFF,
+                               dtype=np.uint8)
+        best = scores.argmax(axis=1)
+        matches = {component: self._index[self._names[name]]
+                   for component, name, score in zip(components, best, scores[np.arange(len(components)), best])
+                   if score > 0}
+
+        codes = {}
+        for location, components in candidates.items():
+            code = next((matches[component] for component in components if component in matches), None)
+            if code is not None:
+                codes[location] = code
+        return codes
@@ -0,0 +1,198 @@
+import re
+import unicodedata
+from typing import Iterable
+
+import pandas as pd
+
+from loader_utils.retry import RetryPolicy
+from loader_utils.work_ledger import WorkLedger
+from loader_utils.work_pool import WorkPool
+from location.country_backends import CountryBackend
+
+LOCATION_CACHE_PATH = 'dataset/cache/location_countries.sqlite'
+MAPPING_PATH = 'dataset/mapping_locations_to_country.csv'
+
+# Stage of the cache in the work ledger
+COUNTRY_STAGE = 'country'
+
+
+def normalize_location(location: str) -> str:
+    """Normalize a location so that its variants share the same cache entry, e.g. ' Paris ,France.' and
+    'paris, france'
+
+    Parameters
+    ----------
+    location: the location as written in the dataset
+
+    Returns
+    -------
+    The normalized location, empty if there is no location
+    """
+    location = ' '.join(unicodedata.normalize('NFKC', location).split())
+    location = re.sub(r'\s*,\s*', ', ', location)
+    return location.strip(' ,.;').casefold()
+
+
+class LocationResolver:
+    """
+    Map locations (e.g. the place of birth of the composers) to their country.
+
+    The locations are deduplicated and normalized, and looked up in a persistent cache first (a WorkLedger, which can
+    be seeded from the mapping_locations_to_country.csv of a previous run), then in the offline gazetteer if any. Only
+    the missing ones are sent to the backend, in batches of bounded size resolved concurrently, and the validated
+    answers are recorded in the cache batch by batch. Mapping new locations is therefore incremental, and an interrupted
+    run resumes where it stopped.
+
+    e.g. async with LocationResolver(OpenAICountryBackend()) as resolver:
+            resolver.seed_from_csv()
+            countries = await resolver.resolve(composers['place_of_birth'])
+    """
+
+    def __init__(self, backend: CountryBackend, cache_path: str = LOCATION_CACHE_PATH, batch_size: int = 50,
+                 max_in_flight: int = 4, retry_policy: RetryPolicy = RetryPolicy(), gazetteer=None):
+        """
+        Parameters
+        ----------
+        backend: the backend resolving the locations missing from the cache
+        cache_path: path of the sqlite database of the cache, ':memory:' to only keep it in memory
+        batch_size: maximum number of locations sent to the backend at once
+        max_in_flight: maximum number of batches resolved at the same time
+        retry_policy: decides which failed batches are retried, and after how long
+        gazetteer: a gazetteer.Gazetteer mapping offline the locations missing from the cache, so that only the ones it
+        does not know are sent to the backend, None to send them all
+        """
+        self._backend = backend
+        self._gazetteer = gazetteer
+        self._ledger = WorkLedger(cache_path)
+        self._batch_size = batch_size
+        self._pool = WorkPool(max_in_flight=max_in_flight, retry_policy=retry_policy)
+
+        # Number of locations found in the cache, mapped by the gazetteer, and sent to the backend
+        self.cache_hits = 0
+        self.gazetteer_hits = 0
+        self.requested = 0
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def close(self):
+        """Close the cache"""
+        self._ledger.close()
+
+    def seed_from_csv(self, path: str = MAPPING_PATH) -> int:
+        """Add to the cache the locations of a location,country csv file that are not in it yet
+
+        Parameters
+        ----------
+        path: path of the csv file
+
+        Returns
+        -------
+        The number of locations added
+        """
+        mapping = pd.read_csv(path, dtype=str)
+        mapping['location'] = mapping['location'].fillna('').map(normalize_location)
+        mapping = mapping[mapping['location'] != ''].drop_duplicates(subset='location')
+        countries = {location: (country.strip() or None) if isinstance(country, str) else None
+                     for location, country in zip(mapping['location'], mapping['country'])}
+
+        missing = self._ledger.pending(COUNTRY_STAGE, countries)
+        self._ledger.record_done(COUNTRY_STAGE, ((location, countries[location]) for location in missing))
+        return len(missing)
+
+    async def resolve(self, locations: Iterable[str]) -> dict[str, str | None]:
+        """Map the locations to their country, only sending the ones missing from the cache to the backend
+
+        Parameters
+        ----------
+        locations: the locations as written in the dataset, missing values are ignored
+
+        Returns
+        -------
+        A dict mapping each location to its country (None if it has no country). The locations whose resolution failed
+        are left out, and retried by the next call
+        """
+        keys = {location: normalize_location(location) for location in locations if isinstance(location, str)}
+        keys = {location: key for location, key in keys.items() if key}
+
+        todo = self._ledger.pending(COUNTRY_STAGE, keys.values())
+        nb_cached = len(set(keys.values())) - len(todo)
+        nb_mapped = 0
+        if todo and self._gazetteer is not None:
+            mapped = self._gazetteer.resolve(pd.Series(todo, dtype=object)).dropna()
+            self._ledger.record_done(COUNTRY_STAGE, ((todo[i], country) for i, country in mapped.items()))
+            mapped_positions = set(mapped.index)
+            todo = [location for i, location in enumerate(todo) if i not in mapped_positions]
+            nb_mapped = len(mapped)
+
+        self.cache_hits += nb_cached
+        self.gazetteer_hits += nb_mapped
+        self.requested += len(todo)
+        print(f'{len(keys)} locations: {nb_cached} in the cache, {nb_mapped} mapped by the gazetteer, {len(todo)} to '
+              f'resolve')
+
+        if todo:
+            await self._resolve_missing(todo)
+
+        countries = self._ledger.results(COUNTRY_STAGE)
+        return {location: countries[key] for location, key in keys.items() if key in countries}
+
+    async def _resolve_missing(self, todo: list[str]):
+        """Resolve the normalized locations with the backend, batch by batch, and record them in the cache
+
+        Parameters
+        ----------
+        todo: the normalized locations missing from the cache
+        """
+        batches = [todo[i:i + self._batch_size] for i in range(0, len(todo), self._batch_size)]
+
+        async with self._backend as backend:
+            async for work in self._pool.stream(backend.countries, enumerate(batches)):
+                if work.error is not None:
+                    # Retried by the next run
+                    print(f'Resolution failed for {len(work.arg)} locations after {work.attempts} attempts: '
+                          f'{work.error!r}')
+                    self._ledger.record_failed(COUNTRY_STAGE, work.arg, work.error)
+                    continue
+
+                try:
+                    countries = self._validate(work.arg, work.result)
+                except ValueError as e:
+                    print(f'Invalid answer for {len(work.arg)} locations: {e}')
+                    self._ledger.record_failed(COUNTRY_STAGE, work.arg, e)
+                    continue
+
+                self._ledger.record_done(COUNTRY_STAGE, countries.items())
+                missing = [location for location in work.arg if location not in countries]
+                if missing:
+                    self._ledger.record_failed(COUNTRY_STAGE, missing, ValueError('Missing from the answer'))
+
+    @staticmethod
+    def _validate(batch: list[str], answer) -> dict[str, str | None]:
+        """Check the answer of the backend for a batch, and keep the countries of the requested locations
+
+        Parameters
+        ----------
+        batch: the normalized locations sent to the backend
+        answer: the answer of the backend
+
+        Returns
+        -------
+        The country of each location of the batch found in the answer
+        """
+        if not isinstance(answer, dict):
+            raise ValueError(f'Expected a dict of countries, got {type(answer).__name__}')
+
+        requested = set(batch)
+        countries = {}
+        for location, country in answer.items():
+            if not isinstance(location, str) or not (country is None or isinstance(country, str)):
+                raise ValueError(f'Expected location and country strings, got {location!r}: {country!r}')
+            # The backend may not return the locations exactly as they were sent
+            location = normalize_location(location)
+            if location in requested:
+                countries[location] = (country.strip() or None) if country is not None else None
+        return countries
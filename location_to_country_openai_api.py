@@ -1,38 +1,64 @@
-"""Script allowing to create a mapping between locations and countries with GPT"""
+"""Script allowing to create a mapping between locations and countries with GPT
 
-import ast
+Only the locations missing from the cache (seeded from the mapping of the previous runs) and unknown to the offline
+gazetteer are sent to the model, in small concurrent batches, so that re-running it after new composers were added only
+pays for the few new locations the gazetteer cannot place.
+"""
+import argparse
+import asyncio
 
 import pandas as pd
-from openai import OpenAI
-
-# Set the list of locations to map
-location_list = ['<list of your locations to map>']
-
-# Set your personal OpenAI API key
-client = OpenAI(
-    api_key='<API-KEY>'
-)
-
-# Make your request to GPT
-completion = client.chat.completions.create(
-    model="gpt-4",  # choose your model and check the corresponding pricing please
-    messages=[
-        {"role": "system",
-         "content": "Only return the asked information without phrasing or intorducing your answer. Return answer in "
-                    "the python variable asked. Be sure to return a variable as long as the given entry."},
-
-        {"role": "user",
-         "content": f"Map using a python dictionary each location (meaning each variable of the following list) to "
-                    f"its corresponding country. Please be consistent over the country name used, i.e. if multiple "
-                    f"location refer to USA please mapped them all to USA. {location_list}"}
-    ]
-)
-
-# Create the mapping dictionary
-location_dict = ast.literal_eval(f"{'{' + completion.choices[0].message.content + '}'}")
-
-# Convert the dict to a pandas Dataframe for easy manipulation
-location_to_country = pd.DataFrame(list(location_dict.items()), columns=['location', 'country'])
-
-# Store information in a .csv file in the computer disk
-location_to_country.to_csv('mapping_locations_to_country.csv', index=False)
+
+from location.country_backends import OpenAICountryBackend
+from location.gazetteer import Gazetteer
+from location.location_resolver import MAPPING_PATH, LocationResolver
+from storage import load_table
+
+
+async def map_locations_to_countries(locations: list[str], model: str, batch_size: int, max_in_flight: int,
+                                     use_gazetteer: bool = True) -> pd.DataFrame:
+    """Map the locations to their country with GPT
+
+    Parameters
+    ----------
+    locations: the locations to map
+    model: the OpenAI model to use
+    batch_size: maximum number of locations sent in one request
+    max_in_flight: maximum number of requests at the same time
+    use_gazetteer: whether to map offline with the gazetteer the locations it knows, instead of sending them to GPT
+
+    Returns
+    -------
+    The location,country dataframe of the mapped locations
+    """
+    gazetteer = Gazetteer.load() if use_gazetteer else None
+    async with LocationResolver(OpenAICountryBackend(model=model), batch_size=batch_size,
+                                max_in_flight=max_in_flight, gazetteer=gazetteer) as resolver:
+        resolver.seed_from_csv(MAPPING_PATH)
+        countries = await resolver.resolve(locations)
+
+    return pd.DataFrame(list(countries.items()), columns=['location', 'country'])
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Map the place of birth of the composers to their country')
+    parser.add_argument('--model', default='gpt-4o-mini', help='OpenAI model, check its pricing please')
+    parser.add_argument('--batch-size', type=int, default=50, help='locations sent in one request')
+    parser.add_argument('--max-in-flight', type=int, default=4, help='requests at the same time')
+    parser.add_argument('--no-gazetteer', action='store_true', help='send to GPT the locations the gazetteer knows')
+    args = parser.parse_args()
+
+    # The locations to map are the places of birth of the composers
+    location_list = load_table('composer', columns=['place_of_birth'])['place_of_birth'].dropna().unique().tolist()
+
+    location_to_country = asyncio.run(
+        map_locations_to_countries(location_list, args.model, args.batch_size, args.max_in_flight,
+                                   not args.no_gazetteer))
+
+    # Keep the locations of the previous mapping, even those of composers no longer in the dataset
+    previous = pd.read_csv(MAPPING_PATH)
+    location_to_country = pd.concat([previous[~previous['location'].isin(location_to_country['location'])],
+                                     location_to_country], ignore_index=True)
+
+    # Store information in a .csv file in the computer disk
+    location_to_country.to_csv(MAPPING_PATH, index=False)
@@ -0,0 +1,209 @@
+import hashlib
+from collections import OrderedDict
+from dataclasses import dataclass
+
+import numpy as np
+import pandas as pd
+
+# Maximum number of aggregates kept in memory, the least recently used being dropped first
+PLOT_DATA_CACHE_SIZE = 8
+
+_plot_data_cache = OrderedDict()
+
+
+def frame_fingerprint(df: pd.DataFrame) -> str:
+    """
+    Fingerprint of the content of a dataframe, equal for dataframes with the same columns, dtypes and values in the
+    same order whatever their index
+
+    Parameters
+    ----------
+    df: The dataframe
+
+    Returns
+    -------
+    The hexadecimal digest of the fingerprint
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    for name, column in df.items():
+        digest.update(f'{name}:{column.dtype}'.encode())
+        if isinstance(column.dtype, pd.CategoricalDtype):
+            # The unused categories are not part of the hashes of the values, but are still plotted
+            digest.update(repr(column.cat.categories.tolist()).encode())
+    digest.update(pd.util.hash_pandas_object(df, index=False).to_numpy().tobytes())
+    return digest.hexdigest()
+
+
+def _cached(name: str, df: pd.DataFrame, compute):
+    """
+    Aggregate of a dataframe, computed only once per content of the dataframe
+
+    Parameters
+    ----------
+    name: Name of the aggregate, part of the cache key
+    df: The dataframe, with only the columns the aggregate depends on
+    compute: Function computing the aggregate from the dataframe
+
+    Returns
+    -------
+    The aggregate, which must not be modified as it is cached
+    """
+    key = (name, frame_fingerprint(df))
+    if key in _plot_data_cache:
+        _plot_data_cache.move_to_end(key)
+        return _plot_data_cache[key]
+
+    aggregate = compute(df)
+    _plot_data_cache[key] = aggregate
+    if len(_plot_data_cache) > PLOT_DATA_CACHE_SIZE:
+        _plot_data_cache.popitem(last=False)
+    return aggregate
+
+
+def format_year_bins(year_bins: pd.Index) -> pd.Index:
+    """
+    Replace bins like (1900, 1905] by 1900 - 1905, only once per distinct bin
+
+    Parameters
+    ----------
+    year_bins: The distinct year bins, intervals or strings
+
+    Returns
+    -------
+    The labels of the year bins, in the same order
+    """
+    return (pd.Index(year_bins).astype(str)
+            .str.replace('(', '', regex=False)
+            .str.replace(']', '', regex=False)
+            .str.replace(',', ' -', regex=False))
+
+
+@dataclass(frozen=True)
+class ComposerYearBins:
+    """
+    Number of movies and sum of the box office revenues per composer and year bin, from which the figures of the top
+    composers' careers are drawn
+    """
+    # Indexed by composer_name and year_bin (categorical), with the columns nb_movies, nb_complete (number of movies
+    # without any missing value) and box_office_revenue (sum over the movies without any missing value)
+    cube: pd.DataFrame
+    # Labels of the categories of year_bin
+    labels: pd.Index
+    # Composers of the movies without any missing value, in order of first appearance
+    composers: np.ndarray
+    # Whether the year bins were categorical (binned with pd.cut) rather than labels
+    categorical: bool
+
+    def movie_counts(self) -> pd.DataFrame:
+        """
+        Number of movies per year bin (rows, sorted) and composer (columns), with the labels of the year bins in the
+        first column year_bin
+
+        Returns
+        -------
+        A new dataframe, with NaN for the year bins of a composer without any movie if the bins were not categorical
+        """
+        movie_counts_df = self.cube['nb_movies'].unstack(level='composer_name').reset_index().rename_axis(columns=None)
+        year_bin = movie_counts_df['year_bin']
+        movie_counts_df['year_bin'] = (year_bin.cat.rename_categories(self.labels) if self.categorical
+                                       else self.labels.take(year_bin.cat.codes))
+        return movie_counts_df
+
+    def box_office_revenues(self) -> pd.DataFrame:
+        """
+        Sum of the box office revenues of the movies without any missing value, per composer and year bin
+
+        Returns
+        -------
+        A new dataframe with the columns composer_name, year_bin (labels) and box_office_revenue, sorted by year bin
+        """
+        revenues = self.cube.loc[self.cube['nb_complete'] > 0, 'box_office_revenue'].reset_index()
+        revenues.sort_values(by='year_bin', kind='stable', inplace=True)
+        revenues['year_bin'] = self.labels.take(revenues['year_bin'].cat.codes)
+        return revenues
+
+
+def composer_year_bins(movie_grouped_by_top_composer: pd.DataFrame) -> ComposerYearBins:
+    """
+    Aggregate the movies of the top composers per composer and year bin, only once per content of the dataframe
+
+    Parameters
+    ----------
+    movie_grouped_by_top_composer: The movies of the top composers, with the columns composer_name, year_bin (binned
+        with pd.cut, or their labels) and box_office_revenue
+
+    Returns
+    -------
+    The aggregate, which must not be modified as it is cached
+    """
+    df = movie_grouped_by_top_composer[['composer_name', 'year_bin', 'box_office_revenue']].copy()
+    # The revenues are only summed over the movies without any missing value, in any of the columns
+    df['complete'] = movie_grouped_by_top_composer.notna().all(axis='columns').to_numpy()
+    df.reset_index(drop=True, inplace=True)
+    return _cached('composer_year_bins', df, _compute_composer_year_bins)
+
+
+def _compute_composer_year_bins(df: pd.DataFrame) -> ComposerYearBins:
+    # Categorical bins are all plotted, even without movies, while only the observed labels are
+    categorical = isinstance(df['year_bin'].dtype, pd.CategoricalDtype)
+    year_bin = df['year_bin'].astype('category')
+
+    cube = pd.DataFrame({
+        'composer_name': df['composer_name'],
+        'year_bin': year_bin,
+        'nb_movies': 1,
+        'nb_complete': df['complete'].astype('int64'),
+        'box_office_revenue': df['box_office_revenue'].where(df['complete'], 0),
+    }).groupby(['composer_name', 'year_bin'], observed=not categorical).sum()
+
+    return ComposerYearBins(cube=cube, labels=format_year_bins(year_bin.cat.categories),
+                            composers=df.loc[df['complete'], 'composer_name'].unique(), categorical=categorical)
+
+
+def correlation_by_year(merged_df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Correlation between the revenue and the popularity of the movies, and mean revenue, per release year, only once
+    per content of the dataframe
+
+    Parameters
+    ----------
+    merged_df: The dataframe containing the release_date, movie_revenue and popularity of the movies
+
+    Returns
+    -------
+    The dataframe with the columns year, correlation and mean_revenue, without the years whose correlation is
+    undefined or of absolute value 0.99 or more. It must not be modified as it is cached
+    """
+    df = merged_df[['release_date', 'movie_revenue', 'popularity']].reset_index(drop=True)
+    return _cached('correlation_by_year', df, _compute_correlation_by_year)
+
+
+def _compute_correlation_by_year(df: pd.DataFrame) -> pd.DataFrame:
+    df = pd.DataFrame({
+        'year': pd.to_datetime(df['release_date']).dt.year,
+        'revenue': df['movie_revenue'].astype('float64'),
+        'popularity': df['popularity'].astype('float64'),
+    })
+    mean_revenue = df.groupby('year')['revenue'].mean()
+
+    # Pearson correlation of all the years at once, from the sums of the deviations to the means of each year
+    pairs = df.dropna(subset=['revenue', 'popularity'])
+    grouped = pairs.groupby('year')
+    revenue_deviation = pairs['revenue'] - grouped['revenue'].transform('mean')
+    popularity_deviation = pairs['popularity'] - grouped['popularity'].transform('mean')
+    sums = pd.DataFrame({
+        'year': pairs['year'],
+        'revenue_popularity': revenue_deviation * popularity_deviation,
+        'revenue_revenue': revenue_deviation ** 2,
+        'popularity_popularity': popularity_deviation ** 2,
+    }).groupby('year').sum()
+    with np.errstate(divide='ignore', invalid='ignore'):
+        correlation = sums['revenue_popularity'] / np.sqrt(sums['revenue_revenue'] * sums['popularity_popularity'])
+
+    correlation_by_year = pd.DataFrame({
+        'year': mean_revenue.index,
+        'correlation': correlation.reindex(mean_revenue.index).to_numpy(),
+        'mean_revenue': mean_revenue.to_numpy(),
+    })
+    correlation_by_year.dropna(inplace=True)
+    return correlation_by_year[correlation_by_year['correlation'].between(-0.99, 0.99, inclusive='neither')]
@@ -1,45 +1,112 @@
+import os
+
+import numpy as np
 import pandas as pd
 import plotly.express as px
 import plotly.graph_objs as go
+from IPython.display import display
+from plotly.offline import get_plotlyjs, get_plotlyjs_version
 from plotly.subplots import make_subplots
 
+from question_script import plot_data
 
-def create_plotly_number_of_movies(movie_grouped_by_top_composer):
-    """
-    Save the plotly figure for the number of movies per composer
-    :param movie_grouped_by_top_composer: The dataframe grouped by composer
-    :return: None
+# plotly.js bundle shared by the figures exported in lightweight mode, written once next to them
+PLOTLYJS_FILENAME = f'plotly-{get_plotlyjs_version()}.min.js'
+
+# Number of points from which the scatter plots are drawn with WebGL (Scattergl) in lightweight mode
+WEBGL_MIN_POINTS = 500
+
+
+def write_figure(fig: go.Figure, path: str, lightweight: bool = False):
     """
-    new_df = movie_grouped_by_top_composer.copy()
+    Save a figure as a html file
 
-    new_df.dropna(inplace=True)
+    Parameters
+    ----------
+    fig: go.Figure
+        The figure to save
+    path: str
+        Path of the html file
+    lightweight: bool
+        Whether the file only references the plotly.js bundle shared by all the figures of its directory (written
+        there by the first of them), instead of embedding its ~4.8 MB
+    """
+    if not lightweight:
+        fig.write_html(path)
+        return
 
-    # Create a column count which contains the number of movies per year and per composer
-    # Group by composer and year bin, count the number of movies
-    movie_counts = movie_grouped_by_top_composer.groupby(['composer_name', 'year_bin'], observed=False).size()
+    plotlyjs_path = os.path.join(os.path.dirname(os.path.abspath(path)), PLOTLYJS_FILENAME)
+    if not os.path.exists(plotlyjs_path):
+        # Written under a temporary name first, so that a figure never references a partial bundle
+        with open(f'{plotlyjs_path}.{os.getpid()}.tmp', 'w', encoding='utf-8') as file:
+            file.write(get_plotlyjs())
+        os.replace(f'{plotlyjs_path}.{os.getpid()}.tmp', plotlyjs_path)
 
-    # Unstack the 'composer_name' level to create a DataFrame
-    movie_counts_df = movie_counts.unstack(level='composer_name')
+    fig.write_html(path, include_plotlyjs=PLOTLYJS_FILENAME)
 
-    # Create a df with the year bins and composer_name as columns
-    movie_counts_df = movie_counts_df.reset_index()
 
-    # Rename the columns
-    movie_counts_df.columns = ['year_bin'] + list(movie_counts_df.columns[1:])
-    movie_counts_df = movie_counts_df.sort_values(by='year_bin')
+def downsample_markers(fig: go.Figure, max_points: int, seed: int = 0) -> go.Figure:
+    """
+    Keep at most about max_points markers in the scatter traces of a figure, drawn at random in the same proportion
+    from every trace. The other traces, like the trendlines fitted beforehand on all the points, are left as they are
 
-    # Replace bins like (1900, 1905] by 1900 - 1905
-    movie_counts_df['year_bin'] = movie_counts_df['year_bin'].apply(
-        lambda x: str(x).replace('(', '')
-        .replace(']', '')
-        .replace(',', ' -')
-    )
+    Parameters
+    ----------
+    fig: go.Figure
+        The figure, modified in place
+    max_points: int
+        Number of markers to keep overall, each trace keeping at least one
+    seed: int
+        Seed of the random draw, so that exporting the same figure twice gives the same file
+
+    Returns
+    -------
+    The figure
+    """
+    traces = [trace for trace in fig.data
+              if trace.type in ('scatter', 'scattergl') and trace.mode == 'markers' and trace.x is not None]
+    nb_points = sum(len(trace.x) for trace in traces)
+    if nb_points <= max_points:
+        return fig
+
+    rng = np.random.default_rng(seed)
+    for trace in traces:
+        nb_trace_points = len(trace.x)
+        kept = np.sort(rng.choice(nb_trace_points, size=max(1, round(nb_trace_points * max_points / nb_points)),
+                                  replace=False))
+
+        # Every array attribute of the points is subset the same way
+        updates = {}
+        for name in ['x', 'y', 'customdata', 'hovertext', 'text', 'ids']:
+            values = trace[name]
+            if values is not None and not isinstance(values, str) and len(values) == nb_trace_points:
+                updates[name] = np.asarray(values)[kept]
+        for name in ['color', 'size', 'symbol']:
+            values = trace.marker[name]
+            if values is not None and not isinstance(values, (str, int, float)) and len(values) == nb_trace_points:
+                updates[f'marker.{name}'] = np.asarray(values)[kept]
+        trace.update(updates)
+    return fig
+
+
+def create_plotly_number_of_movies(movie_grouped_by_top_composer, lightweight=False,
+                                   path="Q3_number_of_movies_per_year.html"):
+    """
+    Save the plotly figure for the number of movies per composer
+    :param movie_grouped_by_top_composer: The dataframe grouped by composer
+    :param lightweight: Whether to reference the plotly.js bundle shared by the figures instead of embedding it
+    :param path: Path of the html file
+    :return: None
+    """
+    # Number of movies per year bin and composer, aggregated once for both figures of the top composers
+    year_bins = plot_data.composer_year_bins(movie_grouped_by_top_composer)
+    movie_counts_df = year_bins.movie_counts()
 
     fig = px.line(movie_counts_df, x='year_bin', y=list(movie_counts_df.columns[1:]),
                   title='Number of movies per composer')
 
     # Get the list of unique composers
-    composers = new_df['composer_name'].unique()
+    composers = year_bins.composers
 
     # Add a dropdown menu to select the composers to display
     dropdown = []
@@ -54,7 +121,7 @@ def create_plotly_number_of_movies(movie_grouped_by_top_composer):
     all_button = dict(
         method='update',
         label='All',
-        args=[{'visible': new_df['composer_name'].isin(new_df['composer_name'].unique())},
+        args=[{'visible': [True] * year_bins.cube['nb_complete'].sum()},
               {'title': 'All'}])
 
     # Prepend the "All" button to the dropdown list
@@ -85,31 +152,20 @@ def create_plotly_number_of_movies(movie_grouped_by_top_composer):
     )
     fig.update_traces(mode='lines')
 
-    fig.write_html("Q3_number_of_movies_per_year.html")
+    write_figure(fig, path, lightweight)
 
 
-def create_plotly_box_office_revenue(movie_grouped_by_top_composer):
+def create_plotly_box_office_revenue(movie_grouped_by_top_composer, lightweight=False,
+                                     path="Q3_box_office_revenue_per_year.html"):
     """
     Save the plotly figure for the box office revenue per composer
     :param movie_grouped_by_top_composer: The dataframe grouped by composer
+    :param lightweight: Whether to reference the plotly.js bundle shared by the figures instead of embedding it
+    :param path: Path of the html file
     :return: None
     """
-    new_df = movie_grouped_by_top_composer.copy()
-
-    new_df.dropna(inplace=True)
-    new_df['year_bin'] = new_df['year_bin'].astype(str)
-
-    # Sum the box office revenue per year and per composer
-    new_df = new_df.groupby(['composer_name', 'year_bin'], observed=False)['box_office_revenue'].sum().reset_index()
-
-    new_df = new_df.sort_values(by='year_bin')
-
-    # Replace bins like (1900, 1905] by 1900 - 1905
-    new_df['year_bin'] = new_df['year_bin'].apply(
-        lambda x: str(x).replace('(', '')
-        .replace(']', '')
-        .replace(',', ' -')
-    )
+    # Sum the box office revenue per year and per composer, aggregated once for both figures of the top composers
+    new_df = plot_data.composer_year_bins(movie_grouped_by_top_composer).box_office_revenues()
 
     fig = px.line(new_df, x='year_bin', y='box_office_revenue', color='composer_name',
                   title='Sum of the Box-Office Revenues per composer')
@@ -163,7 +219,7 @@ def create_plotly_box_office_revenue(movie_grouped_by_top_composer):
 
     fig.update_traces(mode='lines')
 
-    fig.write_html("Q3_box_office_revenue_per_year.html")
+    write_figure(fig, path, lightweight)
 
 
 def plot_popularity_histogram(pop_df: pd.DataFrame):
@@ -198,7 +254,8 @@ def plot_popularity_histogram(pop_df: pd.DataFrame):
     fig.show()
 
 
-def plot_scatter_popularity_revenue_by_year(merged_df: pd.DataFrame):
+def plot_scatter_popularity_revenue_by_year(merged_df: pd.DataFrame, path: str = None, lightweight: bool = False,
+                                            max_points: int = None):
     """
     Plot the scatter plot of popularity and revenue by year
 
@@ -206,12 +263,22 @@ def plot_scatter_popularity_revenue_by_year(merged_df: pd.DataFrame):
     ----------
     merged_df: pd.DataFrame
         The dataframe containing the popularity and revenue information
+    path: str
+        Path of the html file to save the figure to, None to show it
+    lightweight: bool
+        Whether to draw the points with WebGL when there are many of them, and to reference the plotly.js bundle
+        shared by the figures instead of embedding it in the html file
+    max_points: int
+        Maximum number of points to display, drawn at random, None to display all of them. The trendlines are still
+        fitted on all the points
     """
-    fig = px.scatter(merged_df, x="popularity", y="movie_revenue", color='release_date', trendline="ols")
-    fig.show()
+    fig = px.scatter(merged_df, x="popularity", y="movie_revenue", color='release_date', trendline="ols",
+                     render_mode=_scatter_render_mode(merged_df, lightweight))
+    _show_or_write(fig, path, lightweight, max_points)
 
 
-def plot_scatter_popularity_revenue_overall(merged_df: pd.DataFrame):
+def plot_scatter_popularity_revenue_overall(merged_df: pd.DataFrame, path: str = None, lightweight: bool = False,
+                                            max_points: int = None):
     """
     Plot the scatter plot of popularity and revenue overall
 
@@ -219,12 +286,36 @@ def plot_scatter_popularity_revenue_overall(merged_df: pd.DataFrame):
     ----------
     merged_df: pd.DataFrame
         The dataframe containing the popularity and revenue information
+    path: str
+        Path of the html file to save the figure to, None to show it
+    lightweight: bool
+        Whether to draw the points with WebGL when there are many of them, and to reference the plotly.js bundle
+        shared by the figures instead of embedding it in the html file
+    max_points: int
+        Maximum number of points to display, drawn at random, None to display all of them. The trendline is still
+        fitted on all the points
     """
-    fig = px.scatter(merged_df, x="popularity", y="movie_revenue", trendline="ols")
-    fig.show()
+    fig = px.scatter(merged_df, x="popularity", y="movie_revenue", trendline="ols",
+                     render_mode=_scatter_render_mode(merged_df, lightweight))
+    _show_or_write(fig, path, lightweight, max_points)
 
 
-def plot_heatmap_correlation(merged_df: pd.DataFrame):
+def _scatter_render_mode(df: pd.DataFrame, lightweight: bool) -> str:
+    # By default plotly express only switches to WebGL from 1000 points
+    return 'webgl' if lightweight and len(df) >= WEBGL_MIN_POINTS else 'auto'
+
+
+def _show_or_write(fig: go.Figure, path: str, lightweight: bool, max_points: int):
+    if max_points is not None:
+        downsample_markers(fig, max_points)
+    if path is None:
+        fig.show()
+    else:
+        write_figure(fig, path, lightweight)
+
+
+def plot_heatmap_correlation(merged_df: pd.DataFrame, lightweight: bool = False,
+                             path: str = "Q7_correlation_heatmap.html", show: bool = True):
     """
     Plot the heatmap of correlation between popularity and revenue
 
@@ -232,28 +323,18 @@ def plot_heatmap_correlation(merged_df: pd.DataFrame):
     ----------
     merged_df: pd.DataFrame
         The dataframe containing the popularity and revenue information
+    lightweight: bool
+        Whether to reference the plotly.js bundle shared by the figures instead of embedding it in the html file
+    path: str
+        Path of the html file
+    show: bool
+        Whether to display the correlation table and the figure in the notebook, False to only save the figure
     """
-    merged_df_modified = merged_df.copy()
-    merged_df_modified['release_date'] = pd.to_datetime(merged_df_modified['release_date'])
-
-    # Extract the year from the 'release_date'
-    merged_df_modified['year'] = merged_df_modified['release_date'].dt.year
+    # Correlation between 'movie_revenue' and 'popularity' per year, computed once per dataframe
+    correlation_by_year = plot_data.correlation_by_year(merged_df)
 
-    # Group by year and calculate the correlation between 'movie_revenue' and 'popularity'
-    correlation_by_year = merged_df_modified.groupby('year')[['movie_revenue', 'popularity']].corr().iloc[0::2,
-                          -1].reset_index()
-    mean_revenue_by_year = merged_df_modified.groupby('year')['movie_revenue'].mean().reset_index()
-
-    correlation_by_year['mean_revenue'] = mean_revenue_by_year['movie_revenue']
-
-    # Rename the columns for the heatmap
-    correlation_by_year.columns = ['year', 'drop', 'correlation', 'mean_revenue']
-    correlation_by_year = correlation_by_year.drop(columns='drop')
-    correlation_by_year.dropna(inplace=True)
-    correlation_by_year = correlation_by_year[correlation_by_year["correlation"] < 0.99]
-    correlation_by_year = correlation_by_year[correlation_by_year["correlation"] > -0.99]
-
-    display(correlation_by_year)
+    if show:
+        display(correlation_by_year)
 
     # Create the heatmap using Graph Objects
     fig = go.Figure(data=go.Scatter(
@@ -311,5 +392,6 @@ def plot_heatmap_correlation(merged_df: pd.DataFrame):
         ])
     )
 
-    fig.show()
-    fig.write_html("Q7_correlation_heatmap.html")
+    if show:
+        fig.show()
+    write_figure(fig, path, lightweight)
@@ -1,5 +1,17 @@
+from functools import lru_cache
+
+import numpy as np
 import pandas as pd
 
+from records import RecordColumns
+from storage import PARQUET_PATH, load_table, table_version
+from tmdb.Composer import Composer
+
+# Tables the composers data is computed from
+COMPOSERS_DATA_TABLES = ['movie', 'movie_composer', 'composer']
+# Order of the movie columns in the enriched movies dataset (clean_enrich_movies.pickle)
+MOVIE_COLUMNS = ['release_date', 'tmdb_id', 'name', 'countries', 'box_office_revenue', 'genres']
+
 
 def extract_composers_data(df: pd.DataFrame, group_by_composer_id: bool = False) -> pd.DataFrame:
     """
@@ -20,11 +32,10 @@ def extract_composers_data(df: pd.DataFrame, group_by_composer_id: bool = False)
     # The dropna makes the copy itself
     exploded_df = df.dropna(subset='composers').explode('composers')
 
-    (exploded_df['c_id'], exploded_df['c_name'], exploded_df['c_birthday'], exploded_df['c_gender'],
-     exploded_df['c_homepage'], exploded_df['c_place_of_birth'], exploded_df['c_date_first_appearance']) = \
-        zip(*exploded_df.composers.apply(
-            lambda c: (c.id, c.name, c.birthday, c.gender, c.homepage, c.place_of_birth, c.date_first_appearance)
-        ))
+    # The attributes are read once per distinct composer, and gathered into columns for all the movies
+    composers = RecordColumns.from_records(Composer, exploded_df.composers.to_numpy())
+    for name, column in composers.columns.items():
+        exploded_df[f'c_{name}'] = column
 
     # Transform date columns to date type
     exploded_df['c_birthday'] = pd.to_datetime(exploded_df.c_birthday)
@@ -40,3 +51,73 @@ def extract_composers_data(df: pd.DataFrame, group_by_composer_id: bool = False)
         exploded_df = exploded_df.groupby('c_id')
 
     return exploded_df
+
+
+def load_composers_data(columns: list[str] = None, group_by_composer_id: bool = False,
+                        path: str = PARQUET_PATH) -> pd.DataFrame:
+    """
+    Same table as extract_composers_data on the enriched movies dataset, but computed directly from the parquet tables
+    and only once: it is kept in memory until the tables are written again, so that every question only pays for a
+    copy of the columns it needs
+
+    Parameters
+    ----------
+    columns: columns to return, all of them if None. c_id is added if the table has to be grouped by composer id
+    group_by_composer_id: Whether to return the dataframe grouped by composers id
+    path: directory of the parquet files
+
+    Returns
+    -------
+    A copy of the requested columns of the composers dataframe, with one row per movie and composer
+    """
+    versions = tuple(table_version(table, path) for table in COMPOSERS_DATA_TABLES)
+    composers_data = _compute_composers_data(path, versions)
+
+    if columns is None:
+        composers_data = composers_data.copy()
+    else:
+        if group_by_composer_id and 'c_id' not in columns:
+            columns = ['c_id'] + list(columns)
+        composers_data = composers_data[columns].copy()
+
+    if group_by_composer_id:
+        # Group the dataframe by composer id
+        return composers_data.groupby('c_id')
+    return composers_data
+
+
+@lru_cache(maxsize=4)
+def _compute_composers_data(path: str, versions: tuple) -> pd.DataFrame:
+    """
+    Join the movies to the attributes of their composers, with the rows, columns and dtypes of extract_composers_data
+
+    Parameters
+    ----------
+    path: directory of the parquet files
+    versions: versions of the tables, only used as part of the cache key so that it is invalidated when they change
+
+    Returns
+    -------
+    The composers dataframe, which must not be modified as it is cached
+    """
+    movies = load_table('movie', MOVIE_COLUMNS, path=path)
+    # Position of the movie, to keep the order of the movies and of their composers
+    movies['movie_position'] = np.arange(len(movies))
+
+    composers = load_table('composer', path=path).add_prefix('c_')
+    links = load_table('movie_composer', path=path).merge(composers, left_on='composer_id', right_on='c_id')
+
+    composers_data = movies.merge(links, on='tmdb_id')
+    composers_data.sort_values(['movie_position', 'position'], kind='stable', inplace=True)
+    composers_data.drop(columns=['movie_position', 'composer_id', 'position'], inplace=True)
+
+    # Same dtypes as the enriched movies dataset, where the ids are floats, and as the columns extracted from the
+    # Composer objects (the gender is float if some are missing)
+    composers_data['tmdb_id'] = composers_data['tmdb_id'].astype('float64')
+    if pd.api.types.is_integer_dtype(composers_data['c_gender']):
+        composers_data['c_gender'] = composers_data['c_gender'].astype('int64')
+    composers_data['c_birthday'] = pd.to_datetime(composers_data.c_birthday)
+    composers_data['c_date_first_appearance'] = pd.to_datetime(composers_data.c_date_first_appearance)
+
+    composers_data.reset_index(drop=True, inplace=True)
+    return composers_data
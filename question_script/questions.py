@@ -0,0 +1,288 @@
+import os
+from dataclasses import dataclass
+from typing import Callable
+
+import numpy as np
+import pandas as pd
+import plotly.express as px
+import plotly.graph_objs as go
+
+from location.gazetteer import Gazetteer
+from question_script import plotly_graph
+from question_script.plotly_graph import write_figure
+from question_script.question_helper import load_composers_data
+from storage import load_movie_albums, load_table, load_tracks
+
+# Directory of the figures and tables generated by the questions
+FIGURES_PATH = 'figures'
+
+# Number of composers with the most movies whose career is plotted
+TOP_COMPOSERS = 5
+# Width in years of the bins of the top composers' careers
+YEAR_BIN_WIDTH = 5
+# Number of genres plotted, all of them being in the table
+GENRES_PLOTTED = 30
+
+
+@dataclass(frozen=True)
+class Task:
+    """A dataset or a question, computed from the datasets it requires"""
+    name: str
+    func: Callable
+    # Names of the datasets passed to func as keyword arguments
+    requires: tuple[str, ...] = ()
+    # Datasets are loaded once in the main process and shared by all the tasks requiring them, while the questions
+    # are answered by the workers
+    is_dataset: bool = False
+
+
+@dataclass(frozen=True)
+class FigureOutput:
+    """Where and how the questions save their figures and tables"""
+    directory: str = FIGURES_PATH
+    # Whether the html files only reference the plotly.js bundle shared by the figures, see plotly_graph.write_figure
+    lightweight: bool = True
+
+    def path(self, filename: str) -> str:
+        """Path of an output file, creating its directory if needed"""
+        os.makedirs(self.directory, exist_ok=True)
+        return os.path.join(self.directory, filename)
+
+    def write(self, fig: go.Figure, filename: str) -> str:
+        """Save a figure as a html file, and return its path"""
+        path = self.path(filename)
+        write_figure(fig, path, self.lightweight)
+        return path
+
+
+DATASETS: dict[str, Task] = {}
+QUESTIONS: dict[str, Task] = {}
+
+
+def dataset(*requires: str):
+    """Register the decorated function as the dataset of its name, computed from the required datasets"""
+
+    def register(func: Callable) -> Callable:
+        DATASETS[func.__name__] = Task(func.__name__, func, requires, is_dataset=True)
+        return func
+
+    return register
+
+
+def question(*requires: str):
+    """Register the decorated function as the question of its name, answered from the required datasets and saving
+    its figures to the FigureOutput given as first argument"""
+
+    def register(func: Callable) -> Callable:
+        QUESTIONS[func.__name__] = Task(func.__name__, func, requires)
+        return func
+
+    return register
+
+
+@dataset()
+def composers_data() -> pd.DataFrame:
+    """One row per movie and composer, see question_helper.load_composers_data"""
+    return load_composers_data()
+
+
+@dataset()
+def spotify_composers() -> pd.DataFrame:
+    """The Spotify artist of each composer, with their genres as lists"""
+    composers = load_table('spotify_composer')
+    composers['genres'] = composers['genres'].map(list)
+    return composers
+
+
+@dataset()
+def gazetteer() -> Gazetteer:
+    """Offline mapping of the places of birth to their country"""
+    return Gazetteer.load()
+
+
+@dataset('composers_data')
+def top_composer_movies(composers_data: pd.DataFrame) -> pd.DataFrame:
+    """The movies of the composers with the most movies, with their release year binned in year_bin"""
+    movies = composers_data[['release_date', 'c_id', 'c_name', 'box_office_revenue']].dropna().rename(
+        columns={'release_date': 'release_year', 'c_id': 'composer_id', 'c_name': 'composer_name'})
+
+    top_composers = movies['composer_id'].value_counts().head(TOP_COMPOSERS).index
+    movies = movies[movies['composer_id'].isin(top_composers)].copy()
+    movies['release_year'] = movies['release_year'].astype(int)
+
+    bins = np.arange(movies['release_year'].min(), movies['release_year'].max() + 1, YEAR_BIN_WIDTH)
+    movies['year_bin'] = pd.cut(movies['release_year'], bins)
+    return movies
+
+
+@dataset()
+def popularity_revenue() -> pd.DataFrame:
+    """The revenue of the movies with the mean popularity of the tracks of their album"""
+    movie_albums = load_movie_albums()
+    movie_albums = movie_albums[movie_albums['album_id'].notna()].drop_duplicates(subset=['movie_name'])
+
+    album_popularity = load_tracks(['album_id', 'popularity']).groupby('album_id')['popularity'].mean().dropna()
+    merged_df = movie_albums.merge(album_popularity.reset_index(), on='album_id', how='inner')
+    return merged_df.astype({'movie_revenue': 'float'})
+
+
+@question('composers_data', 'spotify_composers')
+def music_genres(output: FigureOutput, composers_data: pd.DataFrame, spotify_composers: pd.DataFrame) -> dict:
+    """Q1: Which are the most frequent music genre appearing in movies ?"""
+    map_composers_to_movies = composers_data[['name', 'c_name', 'box_office_revenue']].rename(columns={'name': 'm_name'})
+    movie_music_genre_df = spotify_composers.merge(map_composers_to_movies, left_on='name', right_on='c_name')
+
+    genres = movie_music_genre_df.loc[movie_music_genre_df['box_office_revenue'].between(0, int(1e12)), 'genres']
+    genre_count = genres.explode().dropna().value_counts().rename_axis('genre').reset_index(name='count')
+
+    table_path = output.path('Q1_genre_count.csv')
+    genre_count.to_csv(table_path, index=False)
+    fig = px.bar(genre_count.head(GENRES_PLOTTED), x='genre', y='count',
+                 title=f'{GENRES_PLOTTED} most frequent music genres of the composers')
+    return {'top_genres': genre_count['genre'].head(5).tolist(), 'table': table_path,
+            'figures': [output.write(fig, 'Q1_music_genres.html')]}
+
+
+@question('composers_data')
+def age_first_appearance(output: FigureOutput, composers_data: pd.DataFrame) -> dict:
+    """Q2: What is the average composer's age at their first movie appearance ?"""
+    # The composer attributes are the same on all their rows
+    composers = composers_data.drop_duplicates(subset='c_id')[['c_birthday', 'c_date_first_appearance']].dropna()
+    days = (composers['c_date_first_appearance'] - composers['c_birthday']).dt.days
+    years = days / 365.25
+
+    # Some composers have weird birthdate, and the ones over 100 years old are not directly related to movie industry
+    kept = (years > 0) & (years < 100)
+
+    fig = px.histogram(years[kept], nbins=50, title='Age distribution for first movie appearance',
+                       labels={'value': 'Age', 'count': 'Number of composer'})
+    return {'mean_age_years': years[kept].mean(), 'mean_age_days': days[kept].mean(),
+            'figures': [output.write(fig, 'Q2_age_first_appearance.html')]}
+
+
+@question('composers_data')
+def age_prime_career(output: FigureOutput, composers_data: pd.DataFrame) -> dict:
+    """Q2: What is the average composer's age at their biggest box office revenue ?"""
+    composers = composers_data.sort_values(by='box_office_revenue', ascending=False, kind='stable').drop_duplicates(
+        subset='c_id')[['c_birthday', 'release_date']]
+    composers['release_date'] = pd.to_datetime(composers['release_date'])
+    composers.dropna(inplace=True)
+
+    # To exclude composers such as Vivaldi or Mozart that are too old to be meaningful
+    composers.query('c_birthday > 1900', inplace=True)
+    days = (composers['release_date'] - composers['c_birthday']).dt.days
+    years = days / 365.25
+
+    # Some composers have weird birthdate, which result in negative ages
+    kept = years > 0
+
+    fig = px.histogram(years[kept], nbins=50, title='Age distribution for prime career',
+                       labels={'value': 'Age', 'count': 'Number of composer'})
+    return {'mean_age_years': years[kept].mean(), 'mean_age_days': days[kept].mean(),
+            'figures': [output.write(fig, 'Q2_age_prime_career.html')]}
+
+
+@question('top_composer_movies')
+def top_composer_timelines(output: FigureOutput, top_composer_movies: pd.DataFrame) -> dict:
+    """Q3: How the top composers' career progress over the years ?"""
+    number_of_movies_path = output.path('Q3_number_of_movies_per_year.html')
+    box_office_revenue_path = output.path('Q3_box_office_revenue_per_year.html')
+    plotly_graph.create_plotly_number_of_movies(top_composer_movies, output.lightweight, number_of_movies_path)
+    plotly_graph.create_plotly_box_office_revenue(top_composer_movies, output.lightweight, box_office_revenue_path)
+    return {'composers': top_composer_movies['composer_name'].unique().tolist(),
+            'figures': [number_of_movies_path, box_office_revenue_path]}
+
+
+@question('composers_data', 'spotify_composers', 'gazetteer')
+def birthplace_map(output: FigureOutput, composers_data: pd.DataFrame, spotify_composers: pd.DataFrame,
+                   gazetteer: Gazetteer) -> dict:
+    """Q4: Where do composers come from ?"""
+    map_composers_to_movies = composers_data[['name', 'c_name', 'c_place_of_birth']].rename(columns={'name': 'm_name'})
+    composer_place_of_birth_df = spotify_composers.merge(map_composers_to_movies, left_on='name', right_on='c_name')[
+        ['c_name', 'c_place_of_birth', 'popularity']].drop_duplicates()
+    composer_place_of_birth_df = composer_place_of_birth_df[composer_place_of_birth_df['c_place_of_birth'].notna()]
+
+    # Number of composer per location within the selected range of composer's popularity
+    in_popularity_range = composer_place_of_birth_df['popularity'].between(0, 100)
+    number_composer_per_location = composer_place_of_birth_df[in_popularity_range].groupby(
+        'c_place_of_birth').count()['c_name']
+
+    location_to_country = pd.DataFrame({'location': number_composer_per_location.index})
+    location_to_country['country'] = gazetteer.resolve(location_to_country['location'])
+    number_composer_per_country = pd.merge(left=number_composer_per_location, right=location_to_country,
+                                           left_on='c_place_of_birth', right_on='location',
+                                           how='outer').groupby('country').count()['location']
+
+    fig = px.choropleth(data_frame=number_composer_per_country.reset_index(), locations='country',
+                        locationmode='country names', color='location', color_continuous_scale='peach',
+                        title='Heat Map of Locations', labels={'location': 'Number of Composers'})
+    fig.update_layout(template='plotly')
+    return {'countries': len(number_composer_per_country),
+            'unmapped_locations': int(location_to_country['country'].isna().sum()),
+            'figures': [output.write(fig, 'Q4_birthplace_map.html')]}
+
+
+@question('composers_data')
+def gender_split(output: FigureOutput, composers_data: pd.DataFrame) -> dict:
+    """Q5: Does composer's gender matter ?"""
+    # Drop the rows with 'undefined' gender, and map the others to meaningful strings
+    cleaned_composers = composers_data[composers_data['c_gender'] != 0][['release_date', 'c_gender']]
+    cleaned_composers['c_gender'] = cleaned_composers['c_gender'].replace({1: 'Female', 2: 'Male'})
+
+    gender_counts = cleaned_composers['c_gender'].value_counts().rename_axis('gender').reset_index(name='count')
+    counts_fig = px.bar(gender_counts, x='gender', y='count', text='count',
+                        title='Number of Male vs Female movie composers from 1915 to 2014')
+
+    # Proportion of the composers of each gender per year
+    gender_prop_by_year = pd.crosstab(index=cleaned_composers['release_date'], columns=cleaned_composers['c_gender'],
+                                      normalize='index')
+    proportion_fig = px.bar(gender_prop_by_year, color_discrete_map={'Female': 'red', 'Male': 'blue'},
+                            title='Proportion of Female vs Male composers across years',
+                            labels={'release_date': 'Year', 'value': 'Percentage'})
+    return {**dict(zip(gender_counts['gender'], gender_counts['count'].tolist())),
+            'figures': [output.write(counts_fig, 'Q5_gender_counts.html'),
+                        output.write(proportion_fig, 'Q5_gender_proportion_by_year.html')]}
+
+
+@question('composers_data')
+def website_correlation(output: FigureOutput, composers_data: pd.DataFrame) -> dict:
+    """Q6: Does having a personal website correlate with the composers' success ?"""
+    # Only needed by this question, whose failure does not prevent the others from being answered
+    from scipy.stats import pearsonr
+
+    composers_website = composers_data[['c_id', 'box_office_revenue', 'c_homepage', 'tmdb_id']].drop_duplicates()
+    composers_website = composers_website.assign(has_website=composers_website['c_homepage'].notna())
+    composers_website_agg = composers_website.groupby('c_id').agg(
+        total_box_office=pd.NamedAgg(column='box_office_revenue', aggfunc='sum'),
+        has_website=pd.NamedAgg(column='has_website', aggfunc='any')
+    ).reset_index()
+    composers_website_agg['website'] = np.where(composers_website_agg['has_website'], 'Has a website',
+                                                'Does not have a website')
+
+    fig = px.box(composers_website_agg, x='website', y='total_box_office', log_y=True,
+                 title='Boxplot of Total Box Office with Logarithmic Y-axis',
+                 labels={'website': '', 'total_box_office': 'Total Box Office (log scale)'})
+
+    correlation_coefficient, p_value = pearsonr(composers_website_agg['total_box_office'],
+                                                composers_website_agg['has_website'])
+    return {'correlation': correlation_coefficient, 'p_value': p_value,
+            'figures': [output.write(fig, 'Q6_website_box_office.html')]}
+
+
+@question('popularity_revenue')
+def popularity_vs_revenue(output: FigureOutput, popularity_revenue: pd.DataFrame) -> dict:
+    """Q7: Is there a correlation between box office revenue and movie's playlist popularity ?"""
+    overall_path = output.path('Q7_scatter_popularity_revenue.html')
+    by_year_path = output.path('Q7_scatter_popularity_revenue_by_year.html')
+    heatmap_path = output.path('Q7_correlation_heatmap.html')
+
+    plotly_graph.plot_scatter_popularity_revenue_overall(popularity_revenue, overall_path, output.lightweight)
+
+    # Only the movies with a revenue and a popularity, by year
+    merged_df = popularity_revenue.dropna()
+    merged_df = merged_df[(merged_df['movie_revenue'] > 0) & (merged_df['popularity'] > 0)]
+    plotly_graph.plot_scatter_popularity_revenue_by_year(merged_df, by_year_path, output.lightweight)
+
+    plotly_graph.plot_heatmap_correlation(popularity_revenue, output.lightweight, heatmap_path, show=False)
+    return {'correlation': popularity_revenue['popularity'].corr(popularity_revenue['movie_revenue']),
+            'figures': [overall_path, by_year_path, heatmap_path]}
@@ -0,0 +1,129 @@
+"""Headless runner answering the questions of milestone_3.ipynb and saving their figures
+
+The questions and the datasets they require form a DAG (see question_script.questions). Each dataset is loaded once,
+in the main process, as soon as the datasets it requires are loaded, and the questions are answered in parallel by a
+pool of worker processes as soon as their datasets are loaded, so that regenerating every figure is one command which
+scales with the number of cores:
+
+    python -m question_script.runner [--questions gender_split birthplace_map] [--workers 4]
+"""
+import argparse
+import multiprocessing
+import os
+import sys
+import time
+import traceback
+from concurrent.futures import FIRST_COMPLETED, Executor, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from graphlib import TopologicalSorter
+
+from question_script.questions import DATASETS, FIGURES_PATH, QUESTIONS, FigureOutput, Task
+
+# Number of datasets loaded at the same time, mostly waiting for the disk
+DATASET_WORKERS = 4
+
+
+def _timed_call(task: Task, args: tuple, kwargs: dict) -> tuple[object, float]:
+    """Run a task, in a worker for the questions, and return its result with the time it took"""
+    start_time = time.perf_counter()
+    result = task.func(*args, **kwargs)
+    return result, time.perf_counter() - start_time
+
+
+def _required_tasks(names: list[str]) -> dict[str, Task]:
+    """The questions of the names with all the datasets they require, directly or not"""
+    tasks = {}
+    to_visit = [QUESTIONS[name] for name in names]
+    while to_visit:
+        task = to_visit.pop()
+        if task.name not in tasks:
+            tasks[task.name] = task
+            to_visit.extend(DATASETS[name] for name in task.requires)
+    return tasks
+
+
+def run_questions(names: list[str] = None, workers: int = None,
+                  output: FigureOutput = FigureOutput()) -> tuple[dict[str, object], dict[str, BaseException]]:
+    """Answer the questions, loading each dataset they require once and answering them in parallel
+
+    Parameters
+    ----------
+    names: names of the questions to answer, all of them if None
+    workers: number of processes answering the questions at the same time, the number of cores if None. With 1, they
+    are answered one after the other in the main process
+    output: where and how the questions save their figures
+
+    Returns
+    -------
+    The results of the tasks (datasets and questions) that succeeded, and the errors of those that failed, a task whose
+    datasets failed failing too
+    """
+    tasks = _required_tasks(names if names is not None else list(QUESTIONS))
+    workers = workers if workers is not None else os.cpu_count() or 1
+
+    sorter = TopologicalSorter({name: task.requires for name, task in tasks.items()})
+    sorter.prepare()
+    results, errors = {}, {}
+
+    # The workers are started with spawn rather than fork, as datasets may be loading in threads of the main process
+    question_pool = (ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context('spawn')) if workers > 1
+                     else ThreadPoolExecutor(1))
+    with ThreadPoolExecutor(DATASET_WORKERS) as dataset_pool, question_pool:
+        running = {}
+        while sorter.is_active():
+            for name in sorter.get_ready():
+                task = tasks[name]
+                failed = [required for required in task.requires if required in errors]
+                if failed:
+                    errors[name] = RuntimeError(f'Required datasets failed: {", ".join(failed)}')
+                    sorter.done(name)
+                    continue
+
+                kwargs = {required: results[required] for required in task.requires}
+                pool: Executor = dataset_pool if task.is_dataset else question_pool
+                args = () if task.is_dataset else (output,)
+                running[pool.submit(_timed_call, task, args, kwargs)] = name
+
+            if not running:
+                continue
+
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                name = running.pop(future)
+                try:
+                    results[name], elapsed = future.result()
+                    print(f'{name}: done in {elapsed:.2f}s')
+                except Exception as e:
+                    errors[name] = e
+                    print(f'{name}: failed, {"".join(traceback.format_exception_only(e)).strip()}')
+                sorter.done(name)
+
+    return results, errors
+
+
+def print_answers(results: dict[str, object], errors: dict[str, BaseException]):
+    """Print the answer of each question, or why it failed"""
+    for name in QUESTIONS:
+        if name in results:
+            print(f'\n{name}:')
+            for key, value in results[name].items():
+                print(f'\t{key}: {value}')
+        elif name in errors:
+            print(f'\n{name}: failed, {errors[name]!r}')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Answer the questions of milestone_3.ipynb and save their figures')
+    parser.add_argument('--questions', nargs='+', choices=list(QUESTIONS), help='questions to answer, all by default')
+    parser.add_argument('--workers', type=int, help='processes answering the questions, the number of cores by default')
+    parser.add_argument('--output', default=FIGURES_PATH, help='directory of the figures')
+    parser.add_argument('--embed-plotlyjs', action='store_true',
+                        help='embed plotly.js in every html file instead of sharing one file')
+    args = parser.parse_args()
+
+    start_time = time.perf_counter()
+    question_results, question_errors = run_questions(args.questions, args.workers,
+                                                      FigureOutput(args.output, not args.embed_plotlyjs))
+    print_answers(question_results, question_errors)
+    print(f'\n{len(question_results)} tasks done and {len(question_errors)} failed in '
+          f'{time.perf_counter() - start_time:.2f}s')
+    sys.exit(1 if question_errors else 0)
@@ -0,0 +1,128 @@
+"""
+Columnar ("struct of arrays") representation of the record dataclasses (Composer, ComposerSpotify, Music).
+
+The records are stored one instance per cell in object columns of the dataframes. Extracting their attributes used to
+take a Python lambda per row. RecordColumns instead keeps one array per attribute. It is built from the records by
+reading the attributes of each distinct instance only once: the many rows sharing the same instance, e.g. the
+composers of the movies rebuilt by storage.load_movies_with_composers, are gathered with numpy. It then converts to a
+DataFrame, and back to records, without any other per-object attribute access.
+
+e.g. composers = RecordColumns.from_records(Composer, exploded_movies['composers'])
+     composers.to_frame(prefix='c_')
+"""
+from dataclasses import fields
+from operator import attrgetter
+from typing import Any, Iterable
+
+import numpy as np
+import pandas as pd
+
+
+def restore_record_state(record, state):
+    """__setstate__ of the slotted record dataclasses, which also accepts the __dict__ state pickled by their previous
+    version without slots, so that the legacy pickles can still be loaded
+
+    Parameters
+    ----------
+    record: the record being unpickled
+    state: tuple of the values of its fields, or dict of its attributes
+    """
+    if isinstance(state, dict):
+        state = [state.get(field.name, field.default) for field in fields(record)]
+    for field, value in zip(fields(record), state):
+        object.__setattr__(record, field.name, value)
+
+
+def _infer_dtype(column: np.ndarray) -> np.ndarray:
+    """Convert the object column to the numeric dtype of its values if they all are numbers (None being nan), as
+    pandas does when building a dataframe from tuples"""
+    return pd.Series(column, copy=False).infer_objects().to_numpy()
+
+
+class RecordColumns:
+    """
+    The attributes of a sequence of records of a dataclass, stored as one numpy array per attribute
+    """
+
+    def __init__(self, record_type: type, columns: dict[str, np.ndarray]):
+        """
+        Parameters
+        ----------
+        record_type: the dataclass of the records
+        columns: one array per field of the dataclass, all of the same length
+        """
+        self.record_type = record_type
+        self.names = [field.name for field in fields(record_type)]
+        self.columns = {name: columns[name] for name in self.names}
+
+    @classmethod
+    def from_records(cls, record_type: type, records: Iterable) -> 'RecordColumns':
+        """Build the columns from the records, reading the attributes of each distinct instance once
+
+        Parameters
+        ----------
+        record_type: the dataclass of the records
+        records: the records, without missing values
+
+        Returns
+        -------
+        The columns of the records
+        """
+        records = np.fromiter(records, dtype=object) if not isinstance(records, np.ndarray) else records
+        names = [field.name for field in fields(record_type)]
+
+        # Identity of the instances, to read the attributes of the instances shared by several rows only once
+        identities = np.fromiter(map(id, records), dtype=np.uint64, count=len(records))
+        _, first, inverse = np.unique(identities, return_index=True, return_inverse=True)
+
+        # Transposed with zip, and stored with fromiter so that the list attributes are kept as objects
+        values = zip(*map(attrgetter(*names), records[first])) if len(first) else [()] * len(names)
+        return cls(record_type, {name: _infer_dtype(np.fromiter(column, dtype=object, count=len(first)))[inverse]
+                                 for name, column in zip(names, values)})
+
+    @classmethod
+    def from_frame(cls, record_type: type, df: pd.DataFrame, prefix: str = '') -> 'RecordColumns':
+        """Build the columns from the columns of a dataframe
+
+        Parameters
+        ----------
+        record_type: the dataclass of the records
+        df: dataframe with one column per field of the dataclass
+        prefix: prefix of the names of the columns in the dataframe
+
+        Returns
+        -------
+        The columns of the records
+        """
+        return cls(record_type, {field.name: df[f'{prefix}{field.name}'].to_numpy()
+                                 for field in fields(record_type)})
+
+    def __len__(self) -> int:
+        return len(self.columns[self.names[0]])
+
+    def __getitem__(self, name: str) -> np.ndarray:
+        return self.columns[name]
+
+    def to_frame(self, prefix: str = '', index: pd.Index = None) -> pd.DataFrame:
+        """Convert the columns to a dataframe, with one column per field
+
+        Parameters
+        ----------
+        prefix: prefix of the names of the columns
+        index: Optional index of the dataframe
+
+        Returns
+        -------
+        The dataframe
+        """
+        return pd.DataFrame({f'{prefix}{name}': column for name, column in self.columns.items()}, index=index)
+
+    def to_records(self) -> list[Any]:
+        """Create the records
+
+        Returns
+        -------
+        One instance of the dataclass per row
+        """
+        # tolist converts the numpy scalars to Python ones
+        return list(map(self.record_type, *(column.tolist() for column in self.columns.values())))
@@ -1,10 +1,12 @@
 from dataclasses import dataclass
 
+from records import restore_record_state
 
-@dataclass
+
+@dataclass(frozen=True, slots=True)
 class ComposerSpotify:
     """
-    Data class that represent a composer from Spotify
+    Immutable and slotted (without a per instance __dict__) data class that represent a composer from Spotify
     This class contains the composer id, name, genres and albums ids
     """
     id: str
@@ -12,3 +14,6 @@ class ComposerSpotify:
     genres: list[str]
     followers: int
     popularity: int
+
+    # Also loads the composers pickled before they were slotted
+    __setstate__ = restore_record_state
@@ -1,13 +1,18 @@
 from dataclasses import dataclass
 
+from records import restore_record_state
 
-@dataclass
+
+@dataclass(frozen=True, slots=True)
 class Music:
     """
-    Data class that represent a music track from Spotify presented in a movie
+    Immutable and slotted (without a per instance __dict__) data class that represent a music track from Spotify presented in a movie
     """
     id: str
     name: str
     genre: list[str]
     composer_id: int
     popularity: int
+
+    # Also loads the musics pickled before they were slotted
+    __setstate__ = restore_record_state
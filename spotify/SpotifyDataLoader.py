@@ -1,27 +1,57 @@
-import asyncio
+import re
 import urllib.parse
+from dataclasses import replace
 from typing import Any
 
 import aiohttp
 import pandas as pd
 from aiohttp import ClientResponseError
 
-from config import config, reload_env_config
+from config import reload_env_config
+from loader_utils.metrics import LoaderMetrics
+from loader_utils.rate_limiter import AdaptiveRateLimiter
+from loader_utils.retry import RetryPolicy
+from loader_utils.work_pool import WorkPool
 from spotify.Composer_Spotify import ComposerSpotify
 from spotify.Music import Music
+from spotify.SpotifyTokenProvider import SpotifyTokenProvider
 
 
 class SpotifyDataLoader:
-    def __init__(self):
+    def __init__(self, token_provider: SpotifyTokenProvider = None, base_url: str = 'https://api.spotify.com/v1/',
+                 metrics: LoaderMetrics = None, retry_policy: RetryPolicy = RetryPolicy()):
+        """
+        Parameters
+        ----------
+        token_provider: provider of the bearer token, created from the config by default
+        base_url: root url of the Spotify API, e.g. to target a local stand-in server
+        metrics: metrics recording the requests, possibly shared with other loaders. A new one by default
+        retry_policy: decides which failed requests are retried, and after how long. Its max_attempts also bounds the
+        attempts of a throttled request
+        """
         reload_env_config()
+        self._token_provider = token_provider if token_provider is not None else SpotifyTokenProvider.from_config()
         self._tcp_connector = aiohttp.TCPConnector(limit=50)
+        # The Authorization header is set from the token provider before the requests
         self._header = {
-            'Authorization': f'Bearer {config["SPOTIFY_ACCESS_TOKEN"]}',
             'Content-Type': 'application/json',
         }
         timeout = aiohttp.ClientTimeout(total=None)
         self._session = aiohttp.ClientSession(connector=self._tcp_connector, headers=self._header, timeout=timeout)
-        self._base_url = 'https://api.spotify.com/v1/'
+        self._base_url = base_url
+        # Shared by every request, so that the whole loader stays under the rate ceiling of the API
+        self._limiter = AdaptiveRateLimiter(rate=self._REQUESTS_PER_SECOND, burst=5,
+                                            max_concurrency=self._tcp_connector.limit,
+                                            min_rate=self._MIN_REQUESTS_PER_SECOND,
+                                            max_rate=self._MAX_REQUESTS_PER_SECOND,
+                                            rate_increase=self._REQUESTS_PER_SECOND_INCREASE)
+        # Throttled requests are retried by _perform_async_request itself, up to max_attempts times, the pool retries the
+        # other transient errors
+        self._max_attempts = retry_policy.max_attempts
+        self._pool = WorkPool(max_in_flight=self._tcp_connector.limit,
+                              retry_policy=replace(retry_policy,
+                                                   retryable_statuses=retry_policy.retryable_statuses - {429}))
+        self.metrics = metrics if metrics is not None else LoaderMetrics('spotify')
 
     async def __aenter__(self):
         return self
@@ -30,10 +60,48 @@ class SpotifyDataLoader:
         await self._session.close()
 
     _REQUESTS_LIMIT = 49
+    # Maximum number of ids of the multi-get endpoints
+    _ALBUMS_REQUESTS_LIMIT = 20
+    _ARTISTS_REQUESTS_LIMIT = 50
+    # Initial rate, raised additively until the API throttles us, then halved, between the minimum and maximum rates
+    _REQUESTS_PER_SECOND = 20
+    _MIN_REQUESTS_PER_SECOND = 1
+    _MAX_REQUESTS_PER_SECOND = 200
+    _REQUESTS_PER_SECOND_INCREASE = 5
+    # Used if a throttled response does not come with a Retry-After header
+    _DEFAULT_RETRY_AFTER = 30
+
+    async def _authorize(self) -> str:
+        """Make sure the session sends a valid token, swapping the Authorization header of the live session when the
+        token is refreshed, without closing its connections
 
-    def reload_config(self):
-        """Reload the config file"""
-        self.__init__()
+        Return
+        ------
+        The token sent by the next requests
+        """
+        token = await self._token_provider.get_token()
+        authorization = f'Bearer {token}'
+        if self._session.headers.get('Authorization') != authorization:
+            self._session.headers['Authorization'] = authorization
+        return token
+
+    @staticmethod
+    def _endpoint_class(url: str) -> str:
+        """Classify the url into the endpoint class used to group the metrics of its requests
+
+        Parameters
+        ----------
+        url: the url of the request
+
+        Return
+        ------
+        e.g. 'search', 'albums', 'album_tracks', 'tracks' or 'artists'
+        """
+        path = urllib.parse.urlsplit(url).path
+        if re.search(r'/albums/[^/]+/tracks/?$', path):
+            return 'album_tracks'
+        return path.rstrip('/').split('/')[-1] if re.search(r'/(search|albums|tracks|artists)/?$', path) else \
+            path.rstrip('/').split('/')[-2]
 
     async def _perform_async_request(self, url: str):
         """Perform specific request asynchronously given a URL
@@ -45,29 +113,51 @@ class SpotifyDataLoader:
         Return
         ------
         Result of the request
+
+        Raises
+        ------
+        ClientResponseError with the status 429 if the request is still throttled after max_attempts attempts
         """
 
-        try:
-            async with self._session.get(url) as response:
+        endpoint = self._endpoint_class(url)
+        refreshed = False
+        throttled_attempts = 0
+        while True:
+            token = await self._authorize()
+            async with self._limiter:
                 try:
-                    response.raise_for_status()
+                    with self.metrics.track(endpoint) as request:
+                        async with self._session.get(url) as response:
+                            request.status = response.status
+                            if response.status == 401 and not refreshed:
+                                # The token was rejected before its expected expiry: refresh it once, then retry
+                                await self._token_provider.refresh(stale_token=token)
+                                refreshed = True
+                                self.metrics.retried(endpoint)
+                                continue
+
+                            if response.status == 429:
+                                throttled_attempts += 1
+                                if throttled_attempts >= self._max_attempts:
+                                    # Persistently throttled, e.g. by a proxy always answering 429: give up
+                                    response.raise_for_status()
+                                # Throttled: every request waits for exactly the delay asked by the API, then this
+                                # request is retried
+                                retry_after = float(response.headers.get('Retry-After', self._DEFAULT_RETRY_AFTER))
+                                print(f'Spotify API threshold reached:\n\tSleeping for {retry_after} seconds!')
+                                self._limiter.throttled(retry_after)
+                                self.metrics.retried(endpoint)
+                                continue
+
+                            response.raise_for_status()
+                            self._limiter.succeeded()
+                            request.nb_bytes = len(await response.read())
+                            return await response.json()
                 except ClientResponseError as e:
                     print(f'Error while performing request: {e}')
-                    if response.headers.get("Retry-After"):
-                        print(f"Sleeping for {response.headers.get('Retry-After')} seconds")
-                        await asyncio.sleep(int(response.headers.get('Retry-After')))
-                        raise e
-                    else:
-                        raise e
-
-                await asyncio.sleep(2)
-                return await response.json()
-        except ClientResponseError as e:
-            if e.status == 400:
-                print(f'Error while performing request: {e}')
-                return None
-            print(f'Error while performing request: {e}')
-            raise e
+                    if e.status == 400:
+                        return None
+                    raise e
 
     async def _perform_async_batch_request(self, url: str, args: list, batch_size: int = 100, lists=False) -> list:
         """Perform specific request asynchronously given a URL
@@ -78,32 +168,29 @@ class SpotifyDataLoader:
 
         *args: list of arguments to pass to the url
 
-        batch_size: size of the batch
+        batch_size: size of the batch, only used to group the results if lists is True
+
+        lists: if True, return the results grouped in lists of batch_size
 
         Return
         ------
         Result of the request
         """
-        result = []
-        for i in range(0, len(args), batch_size):
-            success = False
-            batch_items = args[i:i + batch_size]
-            while not success:
-                try:
-                    print(f'Performing request for {len(args)} requests')
-                    if not lists:
-                        result += await asyncio.gather(
-                            *[self._perform_async_request(url % batch_item) for batch_item in batch_items])
-                    else:
-                        result.append(await asyncio.gather(
-                            *[self._perform_async_request(url % batch_item) for batch_item in batch_items]))
-                    success = True
-                except ClientResponseError as e:
-                    if e.status == 429:
-                        print("Spotify API threshold reached:\n\tSleeping for 30 seconds!")
-                        await asyncio.sleep(30)
-                    else:
-                        raise e
+        print(f'Performing request for {len(args)} requests')
+        # The pool keeps a bounded number of requests in flight and retries the transient errors one by one, and
+        # throttled requests are retried in _perform_async_request, so a batch never has to be re-sent
+        results = {}
+        async for work in self._pool.stream(lambda arg: self._perform_async_request(url % arg), enumerate(args)):
+            self.metrics.retried(self._endpoint_class(url % work.arg), work.attempts - 1)
+            if work.error is not None:
+                raise work.error
+            results[work.key] = work.result
+        print(f'Achieved rate: {self._limiter.requests_per_second:.2f} requests/sec '
+              f'(rate: {self._limiter.rate:.2f} requests/sec, concurrency: {self._limiter.concurrency})')
+
+        result = [results[i] for i in range(len(args))]
+        if lists:
+            result = [result[i:i + batch_size] for i in range(0, len(result), batch_size)]
 
         return result
 
@@ -118,13 +205,31 @@ class SpotifyDataLoader:
 
         Return
         ------
-        tracks_ids: list[str]
-            List of tracks ids
+        tracks_ids: list[list[str]]
+            List of tracks ids of each album
         """
-        tracks = await self._perform_async_batch_request(f'{self._base_url}albums/%s/tracks',
-                                                         [album_id for album_id in albums_ids])
-
-        tracks_items = [t['items'] for t in tracks if t['items']]
+        # Albums are requested by batches of 20 ids, each album coming with its first 50 tracks
+        batched_album_ids = [albums_ids[i:i + self._ALBUMS_REQUESTS_LIMIT] for i in
+                             range(0, len(albums_ids), self._ALBUMS_REQUESTS_LIMIT)]
+        responses = await self._perform_async_batch_request(f'{self._base_url}albums?ids=%s',
+                                                            [",".join(batch) for batch in batched_album_ids])
+
+        # Keep one (possibly empty) list per album, so that the result stays aligned with albums_ids
+        albums = [album for batch, response in zip(batched_album_ids, responses)
+                  for album in (response['albums'] if response else [None] * len(batch))]
+        tracks_items = [list(album['tracks']['items']) if album else [] for album in albums]
+
+        # Follow the pagination of the albums of more than 50 tracks
+        next_pages = {i: album['tracks']['next'] for i, album in enumerate(albums) if album and album['tracks']['next']}
+        while next_pages:
+            indices = list(next_pages)
+            pages = await self._perform_async_batch_request('%s', [next_pages[i] for i in indices])
+            next_pages = {}
+            for i, page in zip(indices, pages):
+                if page:
+                    tracks_items[i].extend(page['items'])
+                    if page['next']:
+                        next_pages[i] = page['next']
 
         tracks_ids = []
         ban_words = ["Remastered", "Remaster", "remaster", "live", "Live", "Bonus"]
@@ -153,6 +258,8 @@ class SpotifyDataLoader:
         ------
         tracks: list[dict]
             List of tracks
+        genres: list[list[str]]
+            The genres of the artist of each track, if they are known (empty if genre is False)
         """
         tracks_ids = tracks_ids.astype(str)
 
@@ -164,11 +271,18 @@ class SpotifyDataLoader:
 
         genres = []
         if genre:
-            artist_id = [artist["id"] for batch in tracks for track in batch if track for artist in track['artists']]
-            genres = await self._perform_async_batch_request(f'{self._base_url}artists/%s',
-                                                             [a_id for a_id in artist_id])
-            if genres:
-                genres = [g['genres'] for g in genres if g['genres']]
+            artist_id = [artist["id"] for response in tracks if response for track in response['tracks'] if track
+                         for artist in track['artists']]
+
+            # Every artist is requested once, by batches of 50 ids
+            unique_artist_id = list(dict.fromkeys(artist_id))
+            batched_artist_ids = [",".join(unique_artist_id[i:i + self._ARTISTS_REQUESTS_LIMIT]) for i in
+                                  range(0, len(unique_artist_id), self._ARTISTS_REQUESTS_LIMIT)]
+            responses = await self._perform_async_batch_request(f'{self._base_url}artists?ids=%s', batched_artist_ids)
+
+            genres_by_artist = {artist['id']: artist['genres'] for response in responses if response
+                                for artist in response['artists'] if artist}
+            genres = [genres_by_artist[a_id] for a_id in artist_id if genres_by_artist.get(a_id)]
 
         return tracks, genres
 
@@ -217,7 +331,8 @@ class SpotifyDataLoader:
                                                           [urllib.parse.quote(name) for name in names], lists=True)
         albums = []
         for result in results:
-            albums.append([result1['albums']['items'] for result1 in result if result1['albums']['items']])
+            # Keep one (possibly empty) list per name, so that the result stays aligned with names
+            albums.append([result1['albums']['items'] if result1 else [] for result1 in result])
         return albums[0]
 
     async def search_composers_by_name(self, names: list[str]) -> list[str]:
@@ -0,0 +1,100 @@
+import asyncio
+import time
+
+import aiohttp
+
+from config import config
+
+
+class SpotifyTokenProvider:
+    """
+    Provide the bearer token of the Spotify API, kept in memory and refreshed with the client credentials flow shortly
+    before it expires, instead of being written to the .env file and reloaded from it.
+
+    Without client credentials, the SPOTIFY_ACCESS_TOKEN of the config is used as is and can never be refreshed.
+    """
+    _AUTH_URL = 'https://accounts.spotify.com/api/token'
+
+    def __init__(self, client_id: str = None, client_secret: str = None, access_token: str = None,
+                 refresh_margin: float = 60):
+        """
+        Parameters
+        ----------
+        client_id: the client id of the Spotify application
+        client_secret: the client secret of the Spotify application
+        access_token: a token to use until the first refresh, mandatory without client credentials
+        refresh_margin: number of seconds before the expiry of the token at which it is refreshed
+        """
+        self._client_id = client_id
+        self._client_secret = client_secret
+        self._refresh_margin = refresh_margin
+
+        self._token = access_token
+        # Without credentials, the token is used until the API rejects it. With credentials, a token given without its
+        # expiry is refreshed right away
+        self._expires_at = float('inf') if not self.can_refresh else 0.0
+        self._lock = asyncio.Lock()
+
+        self.refresh_count = 0
+
+    @classmethod
+    def from_config(cls) -> 'SpotifyTokenProvider':
+        """Create the provider from the SPOTIFY_CLIENT_ID, SPOTIFY_CLIENT_SECRET and SPOTIFY_ACCESS_TOKEN of the
+        config
+
+        Returns
+        -------
+        The token provider
+        """
+        return cls(config.get('SPOTIFY_CLIENT_ID'), config.get('SPOTIFY_CLIENT_SECRET'),
+                   config.get('SPOTIFY_ACCESS_TOKEN'))
+
+    @property
+    def can_refresh(self) -> bool:
+        """Whether client credentials are available to get new tokens"""
+        return bool(self._client_id and self._client_secret)
+
+    async def get_token(self) -> str:
+        """Return a valid token, refreshing it first if it expires in less than refresh_margin seconds
+
+        Returns
+        -------
+        The bearer token
+        """
+        if self._token is None or time.monotonic() >= self._expires_at - self._refresh_margin:
+            return await self.refresh(stale_token=self._token)
+        return self._token
+
+    async def refresh(self, stale_token: str = None) -> str:
+        """Get a new token, unless the stale token has already been replaced by a concurrent refresh
+
+        Parameters
+        ----------
+        stale_token: the token found to be expired or rejected by the API
+
+        Returns
+        -------
+        The new bearer token
+        """
+        async with self._lock:
+            if self._token is not None and self._token != stale_token:
+                return self._token
+
+            if not self.can_refresh:
+                raise RuntimeError('The Spotify access token expired, and no SPOTIFY_CLIENT_ID and '
+                                   'SPOTIFY_CLIENT_SECRET are configured to get a new one')
+
+            async with aiohttp.ClientSession() as session:
+                async with session.post(self._AUTH_URL, data={
+                    'grant_type': 'client_credentials',
+                    'client_id': self._client_id,
+                    'client_secret': self._client_secret,
+                }) as response:
+                    response.raise_for_status()
+                    auth_response_data = await response.json()
+
+            self._token = auth_response_data['access_token']
+            self._expires_at = time.monotonic() + auth_response_data['expires_in']
+            self.refresh_count += 1
+            print(f'Spotify token refreshed, valid for {auth_response_data["expires_in"]} seconds')
+            return self._token
@@ -0,0 +1,318 @@
+"""
+Columnar storage of the enriched datasets.
+
+Instead of pickling dataframes holding Composer and Music objects (and writing a CSV copy of them), the datasets are
+normalized into flat tables, persisted as compressed Parquet files with a fixed schema:
+    - movie: one row per movie
+    - composer: one row per tmdb composer
+    - movie_composer: link between the movies and their composers
+    - spotify_composer: one row per Spotify artist
+    - movie_album: the Spotify album matched to each movie (if any)
+    - album_track: link between the albums and their tracks
+    - track: one row per Spotify track
+
+Tables are loaded with column projection and predicate pushdown, e.g.
+    load_table('movie', columns=['name', 'box_office_revenue'], filters=[('release_date', '>=', '2000')])
+and the previous object-based dataframes can still be rebuilt with load_movies_with_composers and load_tracks.
+"""
+import os
+from os.path import join
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from records import RecordColumns
+from spotify.Music import Music
+from tmdb.Composer import Composer
+
+PARQUET_PATH = join('dataset', 'parquet')
+
+SCHEMAS = {
+    'movie': pa.schema([
+        ('tmdb_id', pa.int64()),
+        ('name', pa.string()),
+        ('release_date', pa.string()),
+        ('box_office_revenue', pa.float64()),
+        ('countries', pa.list_(pa.string())),
+        ('genres', pa.list_(pa.string())),
+    ]),
+    'composer': pa.schema([
+        ('id', pa.int64()),
+        ('name', pa.string()),
+        ('birthday', pa.string()),
+        # 0 = Undefined, 1 = Female, 2 = Male
+        ('gender', pa.int8()),
+        ('homepage', pa.string()),
+        ('place_of_birth', pa.string()),
+        ('date_first_appearance', pa.string()),
+    ]),
+    'movie_composer': pa.schema([
+        ('tmdb_id', pa.int64()),
+        ('composer_id', pa.int64()),
+        # Position of the composer in the list of composers of the movie
+        ('position', pa.int16()),
+    ]),
+    'spotify_composer': pa.schema([
+        ('id', pa.string()),
+        ('name', pa.string()),
+        ('genres', pa.list_(pa.string())),
+        ('followers', pa.int64()),
+        ('popularity', pa.int64()),
+    ]),
+    'movie_album': pa.schema([
+        ('movie_name', pa.string()),
+        ('release_date', pa.string()),
+        ('movie_revenue', pa.float64()),
+        ('composer_name', pa.string()),
+        ('album_id', pa.string()),
+    ]),
+    'album_track': pa.schema([
+        ('album_id', pa.string()),
+        ('track_id', pa.string()),
+        ('position', pa.int32()),
+    ]),
+    'track': pa.schema([
+        ('track_id', pa.string()),
+        ('album_id', pa.string()),
+        ('name', pa.string()),
+        ('genre', pa.list_(pa.string())),
+        ('composer_id', pa.string()),
+        ('popularity', pa.int64()),
+    ]),
+}
+
+
+def _table_path(table: str, path: str) -> str:
+    return join(path, f'{table}.parquet')
+
+
+def table_exists(table: str, path: str = PARQUET_PATH) -> bool:
+    """Whether the table has already been written
+
+    Parameters
+    ----------
+    table: name of the table, one of SCHEMAS
+    path: directory of the parquet files
+
+    Returns
+    -------
+    True if the parquet file of the table exists
+    """
+    return os.path.isfile(_table_path(table, path))
+
+
+def table_version(table: str, path: str = PARQUET_PATH) -> tuple[int, int]:
+    """Version of the table on disk, which changes whenever the table is written again, e.g. to key in-memory caches
+    of data derived from it
+
+    Parameters
+    ----------
+    table: name of the table, one of SCHEMAS
+    path: directory of the parquet files
+
+    Returns
+    -------
+    The modification time in nanoseconds and the size of the parquet file of the table
+    """
+    stat = os.stat(_table_path(table, path))
+    return stat.st_mtime_ns, stat.st_size
+
+
+def write_table(df: pd.DataFrame, table: str, path: str = PARQUET_PATH):
+    """Write the dataframe as a zstd compressed parquet file, after casting it to the schema of the table
+
+    Parameters
+    ----------
+    df: dataframe holding at least the columns of the schema of the table
+    table: name of the table, one of SCHEMAS
+    path: directory of the parquet files
+    """
+    schema = SCHEMAS[table]
+    os.makedirs(path, exist_ok=True)
+    arrow_table = pa.Table.from_pandas(df[schema.names], schema=schema, preserve_index=False)
+    pq.write_table(arrow_table, _table_path(table, path), compression='zstd', row_group_size=64 * 1024)
+
+
+def load_table(table: str, columns: list[str] = None, filters: list = None, path: str = PARQUET_PATH) -> pd.DataFrame:
+    """Load a table, reading only the requested columns and the row groups that can match the filters
+
+    Parameters
+    ----------
+    table: name of the table, one of SCHEMAS
+    columns: columns to load, all of them if None
+    filters: predicates in the pyarrow DNF format, e.g. [('release_date', '>=', '2000'), ('gender', '==', 1)]
+    path: directory of the parquet files
+
+    Returns
+    -------
+    The loaded dataframe
+    """
+    return pq.read_table(_table_path(table, path), columns=columns, filters=filters).to_pandas()
+
+
+def save_movies(movies: pd.DataFrame, path: str = PARQUET_PATH):
+    """Normalize the enriched movies dataframe (with a 'composers' column holding lists of Composer) into the movie,
+    composer and movie_composer tables
+
+    Parameters
+    ----------
+    movies: the enriched movies dataframe
+    path: directory of the parquet files
+    """
+    write_table(movies, 'movie', path)
+
+    exploded = movies[['tmdb_id', 'composers']].dropna(subset='composers').explode('composers')
+    exploded = exploded.dropna(subset='composers')
+
+    composers = RecordColumns.from_records(Composer, exploded['composers']).to_frame()
+
+    movie_composer = pd.DataFrame({
+        'tmdb_id': exploded['tmdb_id'].to_numpy(),
+        'composer_id': composers['id'].to_numpy(),
+        'position': exploded.groupby(level=0).cumcount().to_numpy(),
+    })
+
+    write_table(composers.drop_duplicates(subset='id'), 'composer', path)
+    write_table(movie_composer, 'movie_composer', path)
+
+
+def load_movies_with_composers(columns: list[str] = None, filters: list = None,
+                               path: str = PARQUET_PATH) -> pd.DataFrame:
+    """Rebuild the enriched movies dataframe, with its 'composers' column holding lists of Composer (or nan if the
+    movie has no composer)
+
+    Parameters
+    ----------
+    columns: columns of the movie table to load (tmdb_id is always loaded), all of them if None
+    filters: predicates on the movie table in the pyarrow DNF format
+    path: directory of the parquet files
+
+    Returns
+    -------
+    The enriched movies dataframe
+    """
+    if columns is not None and 'tmdb_id' not in columns:
+        columns = ['tmdb_id'] + columns
+    movies = load_table('movie', columns, filters, path)
+
+    composers = load_table('composer', path=path)
+    composers_by_id = dict(zip(composers['id'], RecordColumns.from_frame(Composer, composers).to_records()))
+
+    movie_composer = load_table('movie_composer', path=path).sort_values(['tmdb_id', 'position'])
+    movie_composer['composer'] = movie_composer['composer_id'].map(composers_by_id)
+    composers_by_movie = movie_composer.groupby('tmdb_id')['composer'].agg(list)
+
+    movies['composers'] = movies['tmdb_id'].map(composers_by_movie)
+    return movies
+
+
+def save_movie_albums(movie_albums: pd.DataFrame, path: str = PARQUET_PATH):
+    """Save the album matched to each movie
+
+    Parameters
+    ----------
+    movie_albums: dataframe with movie_name, release_date, movie_revenue, composer_name and album_id columns
+    path: directory of the parquet files
+    """
+    write_table(movie_albums, 'movie_album', path)
+
+
+def save_album_tracks(albums_with_track_ids: pd.DataFrame, path: str = PARQUET_PATH):
+    """Normalize the track ids of the albums into the album_track table
+
+    Parameters
+    ----------
+    albums_with_track_ids: dataframe with an album_id column and a track_ids column holding the list of track ids of
+    the album
+    path: directory of the parquet files
+    """
+    album_tracks = albums_with_track_ids[['album_id', 'track_ids']].dropna().drop_duplicates(subset='album_id')
+    album_tracks = album_tracks.explode('track_ids').dropna()
+    album_tracks['position'] = album_tracks.groupby(level=0).cumcount()
+    write_table(album_tracks.rename(columns={'track_ids': 'track_id'}), 'album_track', path)
+
+
+def load_movie_albums(with_track_ids: bool = False, path: str = PARQUET_PATH) -> pd.DataFrame:
+    """Load the album matched to each movie
+
+    Parameters
+    ----------
+    with_track_ids: whether to append the track_ids column holding the list of track ids of each album (nan if they
+    have not been retrieved)
+    path: directory of the parquet files
+
+    Returns
+    -------
+    The movie albums dataframe
+    """
+    movie_albums = load_table('movie_album', path=path)
+    if with_track_ids:
+        album_tracks = load_table('album_track', path=path).sort_values(['album_id', 'position'])
+        movie_albums['track_ids'] = movie_albums['album_id'].map(
+            album_tracks.groupby('album_id')['track_id'].agg(list))
+    return movie_albums
+
+
+def save_tracks(albums_with_tracks: pd.DataFrame, path: str = PARQUET_PATH):
+    """Flatten the Music objects of the 'track' column into the track table
+
+    Parameters
+    ----------
+    albums_with_tracks: dataframe with an album_id column and a track column holding a Music (or nan)
+    path: directory of the parquet files
+    """
+    found = albums_with_tracks.dropna(subset='track')
+    tracks = RecordColumns.from_records(Music, found['track']).to_frame()
+    tracks.insert(1, 'album_id', found['album_id'].to_numpy())
+    write_table(tracks.rename(columns={'id': 'track_id'}), 'track', path)
+
+
+def load_tracks(columns: list[str] = None, filters: list = None, as_music: bool = False,
+                path: str = PARQUET_PATH) -> pd.DataFrame:
+    """Load the tracks
+
+    Parameters
+    ----------
+    columns: columns of the track table to load, all of them if None
+    filters: predicates in the pyarrow DNF format
+    as_music: whether to return the previous album_id / track_ids / track (Music object) dataframe instead
+    path: directory of the parquet files
+
+    Returns
+    -------
+    The tracks dataframe
+    """
+    if not as_music:
+        return load_table('track', columns, filters, path)
+
+    tracks = load_table('track', filters=filters, path=path)
+    tracks['genre'] = tracks['genre'].map(list)
+    musics = RecordColumns.from_frame(Music, tracks.rename(columns={'track_id': 'id'})).to_records()
+    return pd.DataFrame({'album_id': tracks['album_id'], 'track_ids': tracks['track_id'], 'track': musics})
+
+
+def convert_legacy_pickles(dataset_path: str = 'dataset', path: str = PARQUET_PATH):
+    """Convert the pickled datasets written by the previous version of the enrichment scripts into parquet tables
+
+    Parameters
+    ----------
+    dataset_path: directory of the pickle files
+    path: directory of the parquet files
+    """
+    legacy = {
+        'clean_enrich_movies.pickle': lambda df: save_movies(df, path),
+        'spotify_composers_dataset.pickle': lambda df: write_table(df, 'spotify_composer', path),
+        'movie_album_and_revenue.pickle': lambda df: save_movie_albums(df, path),
+        'movie_album_and_revenue_with_track_ids.pickle': lambda df: save_album_tracks(df, path),
+        'album_id_and_musics.pickle': lambda df: save_tracks(df, path),
+    }
+
+    for file, save in legacy.items():
+        if os.path.isfile(join(dataset_path, file)):
+            print(f'Converting {file}')
+            save(pd.read_pickle(join(dataset_path, file)))
+
+
+if __name__ == '__main__':
+    convert_legacy_pickles()
@@ -0,0 +1,23 @@
+import pytest
+
+from benchmarks.album_scoring_reference import best_matching_album_ids_reference, fixture_columns, load_fixture
+from enrich_with_spotify_data import find_best_matching_album_ids
+
+
+@pytest.fixture(scope='module')
+def fixture() -> list[dict]:
+    return load_fixture()
+
+
+def test_batched_scoring_chooses_the_albums_of_the_previous_implementation(fixture):
+    expected = [movie['expected_album_id'] for movie in fixture]
+    assert find_best_matching_album_ids(*fixture_columns(fixture)) == expected
+
+
+def test_reference_implementation_still_matches_the_fixture(fixture):
+    expected = [movie['expected_album_id'] for movie in fixture]
+    assert best_matching_album_ids_reference(*fixture_columns(fixture)) == expected
+
+
+def test_movies_without_candidate_albums():
+    assert find_best_matching_album_ids([[], []], ['2000', '2001'], ['Movie', 'Other Movie'], ['A', 'B']) == [None, None]
@@ -0,0 +1,28 @@
+import json
+
+import pandas as pd
+import pytest
+
+import helpers
+from benchmarks.clean_movies_reference import (clean_movies_apply, clean_movies_revenue_apply, synthetic_metadata,
+                                               with_tmdb_revenue)
+from helpers import clean_movies, clean_movies_revenue, load_movies
+
+
+@pytest.fixture(params=[0, 1, 2])
+def raw_movies(request, tmp_path) -> pd.DataFrame:
+    path = str(tmp_path / 'movie.metadata.tsv')
+    synthetic_metadata(path, 5_000, seed=request.param)
+    return load_movies(path)
+
+
+@pytest.mark.parametrize('json_loads', [helpers.json_loads, json.loads], ids=['default', 'json'])
+def test_clean_movies_matches_the_previous_implementation(raw_movies, json_loads, monkeypatch):
+    # Without orjson, the standard json module parses the Freebase dictionaries
+    monkeypatch.setattr(helpers, 'json_loads', json_loads)
+    pd.testing.assert_frame_equal(clean_movies(raw_movies), clean_movies_apply(raw_movies))
+
+
+def test_clean_movies_revenue_matches_the_previous_implementation(raw_movies):
+    movies = with_tmdb_revenue(clean_movies_apply(raw_movies))
+    pd.testing.assert_frame_equal(clean_movies_revenue(movies), clean_movies_revenue_apply(movies))
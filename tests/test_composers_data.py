@@ -0,0 +1,55 @@
+import numpy as np
+import pandas as pd
+
+import storage
+from question_script.question_helper import MOVIE_COLUMNS, extract_composers_data, load_composers_data
+from tmdb.Composer import Composer
+
+WILLIAMS = Composer(id=491, name='John Williams', birthday='1932-02-08', gender=2, homepage=None,
+                    place_of_birth='Floral Park, New York, USA', date_first_appearance='1958')
+ZIMMER = Composer(id=947, name='Hans Zimmer', birthday='1957-09-12', gender=2, homepage='https://hans-zimmer.com',
+                  place_of_birth='Frankfurt am Main, Germany', date_first_appearance='1982')
+NEWMAN = Composer(id=153, name='Alfred Newman', birthday=None, gender=None, homepage=None, place_of_birth=None,
+                  date_first_appearance='1930')
+
+
+def enriched_movies() -> pd.DataFrame:
+    """Movies in the layout of clean_enrich_movies.pickle, whose tmdb ids are floats"""
+    return pd.DataFrame({
+        'release_date': ['1977', '2010', '1976', '1940'],
+        'tmdb_id': [11.0, 27205.0, 13.0, 14.0],
+        'name': ['Star Wars', 'Inception', 'Silent Movie', 'The Mark of Zorro'],
+        'countries': [['United States of America'], ['United States of America', 'United Kingdom'], [], []],
+        'box_office_revenue': [775e6, 836e6, np.nan, 1e6],
+        'genres': [['Science Fiction'], ['Thriller', 'Science Fiction'], ['Comedy'], ['Adventure']],
+        'composers': [[WILLIAMS], [ZIMMER, WILLIAMS], np.nan, [NEWMAN]],
+    }).astype({'release_date': 'string', 'name': 'string'})
+
+
+def test_composers_data_matches_extract_composers_data(tmp_path):
+    movies = enriched_movies()
+    storage.save_movies(movies, str(tmp_path))
+
+    result = load_composers_data(path=str(tmp_path))
+
+    expected = extract_composers_data(movies)
+    assert list(result.columns) == MOVIE_COLUMNS + ['c_id', 'c_name', 'c_birthday', 'c_gender', 'c_homepage',
+                                                    'c_place_of_birth', 'c_date_first_appearance']
+    assert result['tmdb_id'].dtype == 'float64'
+    pd.testing.assert_frame_equal(result, expected, check_dtype=True)
+
+
+def test_composers_data_columns_and_grouping(tmp_path):
+    movies = enriched_movies()
+    storage.save_movies(movies, str(tmp_path))
+    expected = extract_composers_data(movies)
+
+    columns = ['release_date', 'c_name', 'box_office_revenue']
+    pd.testing.assert_frame_equal(load_composers_data(columns, path=str(tmp_path)), expected[columns])
+
+    grouped = load_composers_data(['c_name'], group_by_composer_id=True, path=str(tmp_path))
+    assert grouped.size().to_dict() == {153: 1, 491: 2, 947: 1}
+
+    # The cached table is not modified through the returned copies
+    load_composers_data(path=str(tmp_path)).drop(columns='c_name', inplace=True)
+    assert 'c_name' in load_composers_data(path=str(tmp_path)).columns
@@ -0,0 +1,65 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from location.gazetteer import Gazetteer, location_components
+
+
+@pytest.fixture(scope='module')
+def gazetteer() -> Gazetteer:
+    return Gazetteer.load(mapping_path=None)
+
+
+def test_location_components():
+    assert location_components('brooklyn, new york, usa') == ['usa', 'new york', 'brooklyn']
+    assert location_components('buffalo - new york - usa') == ['usa', 'new york', 'buffalo']
+    assert location_components('west germany (now germany)') == ['germany', 'west germany']
+    assert location_components('the netherlands.') == ['netherlands']
+
+
+@pytest.mark.parametrize('location, country', [
+    ('Paris, France', 'France'),
+    # Country name overridden for plotly
+    ('London, England, UK', 'United Kingdom'),
+    # Aliases and historical names
+    ('Brooklyn, New York, USA', 'United States'),
+    ('Vienna, Austria-Hungary', 'Austria'),
+    ('U.A.E', 'United Arab Emirates'),
+    # Subdivisions, and separators other than commas
+    ('Los Angeles, California', 'United States'),
+    ('Buffalo - New York - USA', 'United States'),
+    # The text between parentheses comes before the component
+    ('Bonn, West Germany (now Germany)', 'Germany'),
+])
+def test_names_of_the_index(gazetteer, location, country):
+    assert gazetteer.resolve([location]).tolist() == [country]
+
+
+def test_typos_fall_back_to_the_closest_name(gazetteer):
+    assert gazetteer.country_code('Recife, Brazl') is None
+    assert gazetteer.resolve(['Recife, Brazl']).tolist() == ['Brazil']
+    assert gazetteer.resolve(['Recife, Brazl'], fuzzy=False).isna().all()
+    # Short components are not matched approximately
+    assert gazetteer.resolve(['Pariz']).isna().all()
+
+
+def test_resolve_keeps_the_alignment_of_the_locations(gazetteer):
+    locations = pd.Series(['Tokyo, Japan', np.nan, 'Atlantis', 'Tokyo, Japan'], index=[10, 11, 12, 13])
+
+    pd.testing.assert_series_equal(gazetteer.resolve(locations),
+                                   pd.Series(['Japan', np.nan, np.nan, 'Japan'], index=[10, 11, 12, 13]))
+
+
+def test_components_are_learned_from_the_mapping(tmp_path):
+    path = tmp_path / 'mapping.csv'
+    path.write_text('location,country\n'
+                    '"Springfield, Freedonia",United States\n'
+                    '"Shelbyville, Freedonia",United States\n'
+                    # Mapped to several countries, so not learned
+                    '"Rome, Sylvania",Italy\n'
+                    '"Paris, Sylvania",France\n', encoding='utf-8')
+
+    gazetteer = Gazetteer.load(mapping_path=str(path))
+
+    countries = gazetteer.resolve(['Capital City, Freedonia', 'Springfield, Sylvania'], fuzzy=False)
+    assert countries[0] == 'United States' and pd.isna(countries[1])
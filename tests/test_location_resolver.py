@@ -0,0 +1,111 @@
+import asyncio
+from contextlib import contextmanager
+
+import pytest
+
+from loader_utils.retry import RetryPolicy
+from location.country_backends import CountryBackend, StaticCountryBackend
+from location.location_resolver import LocationResolver, normalize_location
+
+
+class ScriptedCountryBackend(CountryBackend):
+    """Backend giving, for each batch, the answer built by a function of the batch"""
+
+    def __init__(self, answer):
+        self._answer = answer
+        self.requested: list[list[str]] = []
+
+    async def countries(self, locations: list[str]):
+        self.requested.append(list(locations))
+        return self._answer(locations)
+
+
+def resolve(resolver: LocationResolver, locations: list[str]) -> dict:
+    return asyncio.run(resolver.resolve(locations))
+
+
+@contextmanager
+def in_memory_resolver(backend: CountryBackend, **kwargs):
+    resolver = LocationResolver(backend, cache_path=':memory:', **kwargs)
+    try:
+        yield resolver
+    finally:
+        resolver.close()
+
+
+def test_normalize_location():
+    assert normalize_location(' Paris ,France.') == normalize_location('paris,  france') == 'paris, france'
+    assert normalize_location(' , ') == ''
+
+
+def test_only_the_locations_missing_from_the_cache_are_sent_to_the_backend():
+    backend = StaticCountryBackend({'paris, france': 'France', 'houston, texas, u.s': 'United States'})
+    with in_memory_resolver(backend, batch_size=2) as resolver:
+        assert resolve(resolver, ['Paris, France', ' paris ,France', 'Houston, Texas, U.S.', 'Atlantis', None]) == {
+            'Paris, France': 'France', ' paris ,France': 'France', 'Houston, Texas, U.S.': 'United States',
+            'Atlantis': None}
+        assert sorted(location for batch in backend.requested for location in batch) == [
+            'atlantis', 'houston, texas, u.s', 'paris, france']
+        assert max(len(batch) for batch in backend.requested) == 2
+
+        assert resolve(resolver, ['Paris, France', 'Rome, Italy']) == {'Paris, France': 'France', 'Rome, Italy': None}
+        assert backend.requested[-1] == ['rome, italy']
+        assert (resolver.cache_hits, resolver.requested) == (1, 4)
+
+
+def test_answers_are_matched_to_the_requested_locations():
+    # Locations returned with another case or spacing, unrequested ones, and empty countries
+    backend = ScriptedCountryBackend(lambda locations: {
+        'Paris,France': ' France ', 'Berlin, Germany': 'Germany', 'atlantis': ''})
+    with in_memory_resolver(backend) as resolver:
+        assert resolve(resolver, ['Paris, France', 'Atlantis']) == {'Paris, France': 'France', 'Atlantis': None}
+        assert resolve(resolver, ['Berlin, Germany'])['Berlin, Germany'] == 'Germany'
+        # Berlin was not kept from the first answer
+        assert backend.requested[-1] == ['berlin, germany']
+
+
+def test_locations_missing_from_the_answer_are_retried_by_the_next_call():
+    answers = iter([{'paris, france': 'France'}, {'rome, italy': 'Italy'}])
+    backend = ScriptedCountryBackend(lambda locations: next(answers))
+    with in_memory_resolver(backend) as resolver:
+        assert resolve(resolver, ['Paris, France', 'Rome, Italy']) == {'Paris, France': 'France'}
+        assert resolve(resolver, ['Paris, France', 'Rome, Italy']) == {'Paris, France': 'France',
+                                                                         'Rome, Italy': 'Italy'}
+        assert backend.requested == [['paris, france', 'rome, italy'], ['rome, italy']]
+
+
+@pytest.mark.parametrize('answer', [
+    ['France'],
+    {'paris, france': 1},
+    {('paris', 'france'): 'France'},
+])
+def test_invalid_answers_fail_the_whole_batch(answer):
+    backend = ScriptedCountryBackend(lambda locations: answer)
+    with in_memory_resolver(backend) as resolver:
+        assert resolve(resolver, ['Paris, France', 'Rome, Italy']) == {}
+        # Nothing was recorded, the batch is sent again
+        resolve(resolver, ['Paris, France', 'Rome, Italy'])
+        assert backend.requested == [['paris, france', 'rome, italy']] * 2
+
+
+def test_failed_batches_are_left_out():
+    def answer(locations):
+        if 'atlantis' in locations:
+            raise ConnectionError('Backend unavailable')
+        return {location: 'France' for location in locations}
+
+    backend = ScriptedCountryBackend(answer)
+    with in_memory_resolver(backend, batch_size=1, retry_policy=RetryPolicy(max_attempts=1)) as resolver:
+        assert resolve(resolver, ['Paris, France', 'Atlantis']) == {'Paris, France': 'France'}
+
+
+def test_seed_from_csv(tmp_path):
+    path = tmp_path / 'mapping.csv'
+    path.write_text('location,country\n" Paris ,France",France\n"paris, france",Italy\nAtlantis,\n', encoding='utf-8')
+
+    backend = StaticCountryBackend()
+    with in_memory_resolver(backend) as resolver:
+        assert resolver.seed_from_csv(str(path)) == 2
+        assert resolver.seed_from_csv(str(path)) == 0
+        assert resolve(resolver, ['Paris, France', 'Atlantis']) == {'Paris, France': 'France', 'Atlantis': None}
+        assert backend.requested == []
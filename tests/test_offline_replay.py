@@ -0,0 +1,52 @@
+import asyncio
+import sqlite3
+from functools import partial
+
+import pytest
+
+import enrich_movie_data
+import storage
+from benchmarks.mock_api import MockAPIServer, MockBehaviour, synthetic_movies
+from config import config
+from loader_utils.response_cache import CacheMissError, ResponseCache
+from tmdb.tmdbDataLoader import CACHE_TTL, TMDBDataLoader
+
+
+def test_offline_replay_of_an_incomplete_cache_raises_and_keeps_the_tables(tmp_path, monkeypatch):
+    movies = synthetic_movies(200)
+    cache_path = tmp_path / 'tmdb_responses.sqlite'
+    parquet_path = tmp_path / 'parquet'
+
+    monkeypatch.setitem(config, 'TMDB_BEARER_TOKEN', 'mock')
+    monkeypatch.setattr(enrich_movie_data, 'TMDB_CACHE_PATH', str(cache_path))
+    monkeypatch.setattr(enrich_movie_data, 'TMDB_METRICS_PATH', str(tmp_path / 'tmdb.json'))
+    monkeypatch.setattr(enrich_movie_data, 'load_movies', lambda path: movies.copy())
+    monkeypatch.setattr(enrich_movie_data, 'clean_movies', lambda df: df)
+    # The ids come back as floats from append_movie_revenue, which the stand-in server does not accept in its urls
+    clean_movies_revenue = enrich_movie_data.clean_movies_revenue
+    monkeypatch.setattr(enrich_movie_data, 'clean_movies_revenue',
+                        lambda df: clean_movies_revenue(df).astype({'tmdb_id': 'int64'}))
+    monkeypatch.setattr(enrich_movie_data, 'save_movies', partial(storage.save_movies, path=str(parquet_path)))
+
+    async def enrich_online():
+        # The offline run keeps requesting the urls of the stand-in server, which is stopped by then
+        async with MockAPIServer(MockBehaviour(latency=0, latency_jitter=0)) as server:
+            monkeypatch.setattr(enrich_movie_data, 'TMDBDataLoader',
+                                partial(TMDBDataLoader, debug=False, base_url=server.tmdb_url))
+            with ResponseCache(str(cache_path), ttl=CACHE_TTL) as cache:
+                enriched = await enrich_movie_data.enhanced_with_revenue(movies, cache=cache)
+                await enrich_movie_data.enhanced_with_composer(enrich_movie_data.clean_movies_revenue(enriched),
+                                                               cache=cache)
+
+    asyncio.run(enrich_online())
+    tables = {table: (parquet_path / f'{table}.parquet').read_bytes()
+              for table in ['movie', 'composer', 'movie_composer']}
+
+    with sqlite3.connect(cache_path) as connection:
+        assert connection.execute("DELETE FROM responses WHERE endpoint = 'person'").rowcount > 0
+
+    with pytest.raises(CacheMissError):
+        enrich_movie_data.create_enhanced_movie_dataset(offline=True)
+
+    for table, content in tables.items():
+        assert (parquet_path / f'{table}.parquet').read_bytes() == content
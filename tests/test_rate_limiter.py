@@ -0,0 +1,83 @@
+import asyncio
+import time
+
+import pytest
+
+from loader_utils.rate_limiter import AdaptiveRateLimiter
+
+
+def test_rate_and_concurrency_increase_additively_up_to_their_maximum():
+    limiter = AdaptiveRateLimiter(rate=10, initial_concurrency=4, max_concurrency=5, max_rate=12, rate_increase=1)
+
+    # One second of successful requests at 10 per second adds rate_increase to the rate
+    for _ in range(10):
+        limiter.succeeded()
+    assert limiter.rate == pytest.approx(11, abs=0.05)
+    assert limiter.concurrency == 5
+
+    for _ in range(100):
+        limiter.succeeded()
+    assert limiter.rate == 12
+    assert limiter.concurrency == 5
+    assert limiter.completed == 110
+
+
+def test_throttling_halves_the_rate_and_concurrency_once_per_pause():
+    limiter = AdaptiveRateLimiter(rate=40, initial_concurrency=16, min_rate=15, min_concurrency=1)
+
+    limiter.throttled(retry_after=0.05)
+    # The requests in flight when the API started throttling are answered during the same pause
+    limiter.throttled(retry_after=0.05)
+    assert limiter.rate == 20
+    assert limiter.concurrency == 8
+    assert limiter.throttled_count == 2
+
+    time.sleep(0.06)
+    limiter.throttled(retry_after=0)
+    assert limiter.rate == 15
+    assert limiter.concurrency == 4
+
+
+def test_throttling_pauses_every_request_for_the_retry_after_delay():
+    async def run() -> float:
+        limiter = AdaptiveRateLimiter(rate=1000, burst=10)
+        async with limiter:
+            limiter.throttled(retry_after=0.2)
+        start = time.monotonic()
+        async with limiter:
+            pass
+        return time.monotonic() - start
+
+    assert asyncio.run(run()) >= 0.2
+
+
+def test_token_bucket_spaces_the_requests_at_the_rate():
+    async def run() -> float:
+        limiter = AdaptiveRateLimiter(rate=50, burst=1, rate_increase=0)
+        start = time.monotonic()
+        for _ in range(11):
+            async with limiter:
+                pass
+        return time.monotonic() - start
+
+    # The first token is in the bucket, the 10 next ones come every 20ms
+    assert asyncio.run(run()) >= 0.19
+
+
+def test_concurrency_window_bounds_the_requests_in_flight():
+    async def run() -> int:
+        limiter = AdaptiveRateLimiter(rate=1000, burst=100, initial_concurrency=3, max_concurrency=3)
+        in_flight, peak = 0, 0
+
+        async def request():
+            nonlocal in_flight, peak
+            async with limiter:
+                in_flight += 1
+                peak = max(peak, in_flight)
+                await asyncio.sleep(0.01)
+                in_flight -= 1
+
+        await asyncio.gather(*(request() for _ in range(12)))
+        return peak
+
+    assert asyncio.run(run()) == 3
@@ -0,0 +1,101 @@
+import pickle
+from dataclasses import FrozenInstanceError, astuple, dataclass
+
+import pandas as pd
+import pytest
+
+import spotify.Music
+import tmdb.Composer
+from records import RecordColumns
+from spotify.Music import Music
+from tmdb.Composer import Composer
+
+WILLIAMS = Composer(id=491, name='John Williams', birthday='1932-02-08', gender=2, homepage=None,
+                    place_of_birth='Floral Park, New York, USA', date_first_appearance='1958')
+ZIMMER = Composer(id=947, name='Hans Zimmer', birthday='1957-09-12', gender=2, homepage='https://hans-zimmer.com',
+                  place_of_birth='Frankfurt am Main, Germany', date_first_appearance='1982')
+
+
+@dataclass
+class LegacyComposer:
+    """Composer dataclass as it was pickled before it was slotted and frozen"""
+    __module__ = 'tmdb.Composer'
+    __qualname__ = 'Composer'
+    id: str
+    name: str
+    birthday: str = None
+    gender: int = None
+    homepage: str = None
+    place_of_birth: str = None
+    date_first_appearance: str = None
+
+
+@dataclass
+class LegacyMusic:
+    """Music dataclass as it was pickled before it was slotted and frozen"""
+    __module__ = 'spotify.Music'
+    __qualname__ = 'Music'
+    id: str
+    name: str
+    genre: list[str]
+    composer_id: int
+    popularity: int
+
+
+def legacy_pickle(monkeypatch, module, legacy_type: type, record) -> bytes:
+    """Pickle the record as an instance of the legacy dataclass, which has the name of the current one"""
+    with monkeypatch.context() as patch:
+        patch.setattr(module, legacy_type.__qualname__, legacy_type)
+        return pickle.dumps(legacy_type(*astuple(record)))
+
+
+def test_legacy_composer_pickle_is_loaded_into_the_slotted_dataclass(monkeypatch):
+    loaded = pickle.loads(legacy_pickle(monkeypatch, tmdb.Composer, LegacyComposer, WILLIAMS))
+
+    assert type(loaded) is Composer
+    assert astuple(loaded) == astuple(WILLIAMS)
+    assert not hasattr(loaded, '__dict__')
+    with pytest.raises(FrozenInstanceError):
+        loaded.name = 'Hans Zimmer'
+
+
+def test_legacy_music_pickle_is_loaded_into_the_slotted_dataclass(monkeypatch):
+    music = Music(id='4iV5W9uYEdYUVa79Axb7Rh', name='Main Title', genre=['soundtrack'], composer_id=491,
+                  popularity=62)
+    loaded = pickle.loads(legacy_pickle(monkeypatch, spotify.Music, LegacyMusic, music))
+
+    assert type(loaded) is Music
+    assert astuple(loaded) == astuple(music)
+
+
+def test_legacy_pickle_without_an_attribute_gets_its_default(monkeypatch):
+    # Pickled before date_first_appearance was added
+    legacy = LegacyComposer(*astuple(WILLIAMS))
+    del legacy.date_first_appearance
+    with monkeypatch.context() as patch:
+        patch.setattr(tmdb.Composer, 'Composer', LegacyComposer)
+        state = pickle.dumps(legacy)
+
+    assert astuple(pickle.loads(state)) == astuple(WILLIAMS)[:-1] + (None,)
+
+
+def test_slotted_records_pickle_round_trip():
+    loaded = pickle.loads(pickle.dumps([WILLIAMS, ZIMMER]))
+
+    assert [astuple(composer) for composer in loaded] == [astuple(WILLIAMS), astuple(ZIMMER)]
+
+
+def test_record_columns_round_trip():
+    # Shared instances, as in the rows of the exploded movies
+    records = [WILLIAMS, ZIMMER, WILLIAMS, WILLIAMS]
+    columns = RecordColumns.from_records(Composer, records)
+
+    assert len(columns) == 4
+    assert columns['id'].tolist() == [491, 947, 491, 491]
+    frame = columns.to_frame(prefix='c_')
+    assert list(frame.columns) == [f'c_{name}' for name in columns.names]
+    pd.testing.assert_series_equal(frame['c_homepage'], pd.Series([None, 'https://hans-zimmer.com', None, None],
+                                                                  name='c_homepage', dtype=object))
+
+    restored = RecordColumns.from_frame(Composer, frame, prefix='c_').to_records()
+    assert [astuple(composer) for composer in restored] == [astuple(composer) for composer in records]
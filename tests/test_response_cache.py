@@ -0,0 +1,90 @@
+import sqlite3
+import zlib
+
+import pytest
+
+from loader_utils import response_cache
+from loader_utils.response_cache import CacheMissError, ResponseCache
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """Fake time.time of the cache, moved forward by hand"""
+    now = [1_000_000.0]
+    monkeypatch.setattr(response_cache.time, 'time', lambda: now[0])
+    return now
+
+
+def payload_size(response) -> int:
+    return len(zlib.compress(response_cache.json.dumps(response, separators=(',', ':')).encode()))
+
+
+def test_hit_and_miss_with_normalized_url(tmp_path):
+    with ResponseCache(str(tmp_path / 'cache.sqlite')) as cache:
+        assert cache.get('https://api.example.com/search?b=2&a=1', 'search') is None
+        cache.set('https://API.example.com/search?b=2&a=1', 'search', {'results': [1, 2]})
+
+        assert cache.get('https://api.example.com/search?a=1&b=2', 'search') == {'results': [1, 2]}
+        assert (cache.hits, cache.misses) == (1, 1)
+        assert cache.hit_rate == 0.5
+
+
+def test_entries_expire_after_the_ttl_of_their_endpoint(tmp_path, clock):
+    with ResponseCache(str(tmp_path / 'cache.sqlite'), ttl={'search': 10}, default_ttl=None) as cache:
+        cache.set('https://api.example.com/search?q=a', 'search', {'q': 'a'})
+        cache.set('https://api.example.com/person/1', 'person', {'id': 1})
+
+        clock[0] += 11
+        assert cache.get('https://api.example.com/search?q=a', 'search') is None
+        # Endpoints without a ttl never expire
+        assert cache.get('https://api.example.com/person/1', 'person') == {'id': 1}
+
+
+def test_least_recently_used_entries_are_evicted(tmp_path, clock):
+    responses = {f'https://api.example.com/movie/{i}': {'value': str(i) * 50} for i in range(3)}
+    size = payload_size(next(iter(responses.values())))
+    path = str(tmp_path / 'cache.sqlite')
+    first, second, third = responses
+
+    with ResponseCache(path, max_size_bytes=int(size * 2.5)) as cache:
+        for url in [first, second]:
+            cache.set(url, 'movie', responses[url])
+            clock[0] += 1
+        # The first entry is now more recently used than the second one
+        assert cache.get(first, 'movie') is not None
+        clock[0] += 1
+        cache.set(third, 'movie', responses[third])
+
+        assert cache.get(second, 'movie') is None
+        assert cache.get(first, 'movie') == responses[first]
+        assert cache.get(third, 'movie') == responses[third]
+
+
+def test_access_times_are_written_on_close(tmp_path, clock):
+    path = str(tmp_path / 'cache.sqlite')
+    url = 'https://api.example.com/movie/1'
+    with ResponseCache(path) as cache:
+        cache.set(url, 'movie', {'id': 1})
+        clock[0] += 5
+        cache.get(url, 'movie')
+
+    with sqlite3.connect(path) as connection:
+        assert connection.execute('SELECT accessed_at FROM responses').fetchone()[0] == clock[0]
+
+
+def test_offline_replay_raises_on_miss_and_never_writes(tmp_path, clock):
+    path = str(tmp_path / 'cache.sqlite')
+    with ResponseCache(path, ttl={'search': 10}) as cache:
+        cache.set('https://api.example.com/search?q=a', 'search', {'q': 'a'})
+
+    clock[0] += 100
+    with ResponseCache(path, ttl={'search': 10}, read_only=True) as cache:
+        # An expired entry is still replayed
+        assert cache.get('https://api.example.com/search?q=a', 'search') == {'q': 'a'}
+        with pytest.raises(CacheMissError) as error:
+            cache.get('https://api.example.com/search?q=b', 'search')
+        assert error.value.url == 'https://api.example.com/search?q=b'
+
+        cache.set('https://api.example.com/search?q=b', 'search', {'q': 'b'})
+        with pytest.raises(CacheMissError):
+            cache.get('https://api.example.com/search?q=b', 'search')
@@ -0,0 +1,73 @@
+import asyncio
+
+import aiohttp
+import pytest
+
+from loader_utils import work_pool
+from loader_utils.retry import RetryPolicy
+from loader_utils.work_pool import WorkPool
+
+
+def response_error(status: int, headers: dict = None) -> aiohttp.ClientResponseError:
+    return aiohttp.ClientResponseError(request_info=None, history=(), status=status, headers=headers)
+
+
+@pytest.mark.parametrize('error, retryable', [
+    (response_error(429), True),
+    (response_error(503), True),
+    (response_error(404), False),
+    (response_error(401), False),
+    (aiohttp.ClientConnectionError(), True),
+    (asyncio.TimeoutError(), True),
+    (ValueError(), False),
+])
+def test_only_transient_errors_are_retried(error, retryable):
+    assert RetryPolicy().is_retryable(error) == retryable
+
+
+def test_backoff_grows_exponentially_with_full_jitter_up_to_the_maximum(monkeypatch):
+    # The upper bound of the jitter
+    monkeypatch.setattr('loader_utils.retry.random.uniform', lambda low, high: high)
+    policy = RetryPolicy(base_delay=0.5, max_delay=3)
+    assert [policy.delay(attempt) for attempt in range(1, 6)] == [0.5, 1, 2, 3, 3]
+
+    monkeypatch.setattr('loader_utils.retry.random.uniform', lambda low, high: low)
+    assert policy.delay(4) == 0
+
+
+def test_retry_after_header_is_honoured():
+    policy = RetryPolicy(max_delay=1)
+    assert policy.delay(1, response_error(429, {'Retry-After': '7'})) == 7
+    # An http date is not supported, the backoff is used instead
+    assert 0 <= policy.delay(1, response_error(429, {'Retry-After': 'Wed, 21 Oct 2015 07:28:00 GMT'})) <= 0.5
+
+
+def test_pool_retries_each_failed_item_until_the_maximum_attempts(monkeypatch):
+    delays = []
+
+    async def no_sleep(delay):
+        delays.append(delay)
+
+    monkeypatch.setattr(work_pool.asyncio, 'sleep', no_sleep)
+    calls = {'flaky': 0, 'broken': 0, 'missing': 0}
+
+    async def request(key):
+        calls[key] += 1
+        if key == 'flaky' and calls[key] < 3:
+            raise response_error(503, {'Retry-After': '2'})
+        if key == 'broken':
+            raise response_error(500)
+        if key == 'missing':
+            raise response_error(404)
+        return key
+
+    async def run() -> dict:
+        pool = WorkPool(max_in_flight=3, retry_policy=RetryPolicy(max_attempts=4))
+        return {work.key: work async for work in pool.stream(request, ((key, key) for key in calls))}
+
+    works = asyncio.run(run())
+    assert (works['flaky'].result, works['flaky'].attempts) == ('flaky', 3)
+    assert (works['broken'].error.status, works['broken'].attempts) == (500, 4)
+    assert (works['missing'].error.status, works['missing'].attempts) == (404, 1)
+    assert calls == {'flaky': 3, 'broken': 4, 'missing': 1}
+    assert delays.count(2.0) == 2
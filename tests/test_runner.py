@@ -0,0 +1,85 @@
+from collections import Counter
+
+import pytest
+
+from question_script import runner
+from question_script.questions import FigureOutput, Task
+
+# Number of times each task was run
+calls = Counter()
+
+
+def movies():
+    calls['movies'] += 1
+    return [1, 2, 3]
+
+
+def composers():
+    calls['composers'] += 1
+    raise OSError('composer.parquet not found')
+
+
+def composer_movies(movies, composers):
+    calls['composer_movies'] += 1
+    return list(zip(movies, composers))
+
+
+def movie_count(output: FigureOutput, movies) -> dict:
+    calls['movie_count'] += 1
+    return {'movies': len(movies), 'directory': output.directory}
+
+
+def composer_count(output: FigureOutput, composers) -> dict:
+    calls['composer_count'] += 1
+    return {'composers': len(composers)}
+
+
+def composer_movie_count(output: FigureOutput, composer_movies) -> dict:
+    calls['composer_movie_count'] += 1
+    return {'composer_movies': len(composer_movies)}
+
+
+def broken_question(output: FigureOutput, movies) -> dict:
+    calls['broken_question'] += 1
+    raise ValueError('No figure')
+
+
+@pytest.fixture(autouse=True)
+def registries(monkeypatch):
+    """A small DAG of tasks in place of the ones of the notebook"""
+    calls.clear()
+    monkeypatch.setattr(runner, 'DATASETS', {
+        'movies': Task('movies', movies, is_dataset=True),
+        'composers': Task('composers', composers, is_dataset=True),
+        'composer_movies': Task('composer_movies', composer_movies, ('movies', 'composers'), is_dataset=True),
+    })
+    monkeypatch.setattr(runner, 'QUESTIONS', {
+        'movie_count': Task('movie_count', movie_count, ('movies',)),
+        'composer_count': Task('composer_count', composer_count, ('composers',)),
+        'composer_movie_count': Task('composer_movie_count', composer_movie_count, ('composer_movies',)),
+        'broken_question': Task('broken_question', broken_question, ('movies',)),
+    })
+
+
+def test_failures_propagate_to_the_dependent_tasks_only(tmp_path):
+    results, errors = runner.run_questions(workers=1, output=FigureOutput(str(tmp_path)))
+
+    assert results.keys() == {'movies', 'movie_count'}
+    assert results['movie_count'] == {'movies': 3, 'directory': str(tmp_path)}
+
+    assert errors.keys() == {'composers', 'composer_movies', 'composer_count', 'composer_movie_count',
+                             'broken_question'}
+    assert isinstance(errors['composers'], OSError)
+    assert isinstance(errors['broken_question'], ValueError)
+    # Directly and transitively dependent tasks fail without being run
+    assert repr(errors['composer_count']) == repr(RuntimeError('Required datasets failed: composers'))
+    assert repr(errors['composer_movies']) == repr(RuntimeError('Required datasets failed: composers'))
+    assert repr(errors['composer_movie_count']) == repr(RuntimeError('Required datasets failed: composer_movies'))
+    assert calls == Counter(movies=1, composers=1, movie_count=1, broken_question=1)
+
+
+def test_only_the_required_datasets_are_loaded_once():
+    results, errors = runner.run_questions(['movie_count', 'broken_question'], workers=1)
+
+    assert set(results) == {'movies', 'movie_count'} and set(errors) == {'broken_question'}
+    assert calls == Counter(movies=1, movie_count=1, broken_question=1)
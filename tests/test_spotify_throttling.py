@@ -0,0 +1,24 @@
+import asyncio
+
+import pytest
+from aiohttp import ClientResponseError
+
+from benchmarks.mock_api import MockAPIServer, MockBehaviour
+from loader_utils.retry import RetryPolicy
+from spotify.SpotifyDataLoader import SpotifyDataLoader
+from spotify.SpotifyTokenProvider import SpotifyTokenProvider
+
+
+def test_persistently_throttled_request_gives_up_after_max_attempts():
+    async def run() -> int:
+        behaviour = MockBehaviour(latency=0, latency_jitter=0, throttle_rate=1.0, retry_after=0.01)
+        async with MockAPIServer(behaviour) as server:
+            async with SpotifyDataLoader(SpotifyTokenProvider(access_token='mock'), base_url=server.spotify_url,
+                                         retry_policy=RetryPolicy(max_attempts=3, base_delay=0.01)) as spotify:
+                with pytest.raises(ClientResponseError) as error:
+                    await spotify.search_albums_by_name(['Inception'])
+                assert error.value.status == 429
+            return server.stats[429]
+
+    # The pool does not retry the throttled request again on top of its own attempts
+    assert asyncio.run(run()) == 3
@@ -0,0 +1,106 @@
+from dataclasses import astuple
+
+import numpy as np
+import pandas as pd
+import pyarrow.parquet as pq
+
+import storage
+from spotify.Music import Music
+from tmdb.Composer import Composer
+
+WILLIAMS = Composer(id=491, name='John Williams', birthday='1932-02-08', gender=2, homepage=None,
+                    place_of_birth='Floral Park, New York, USA', date_first_appearance='1958')
+ZIMMER = Composer(id=947, name='Hans Zimmer', birthday='1957-09-12', gender=2, homepage='https://hans-zimmer.com',
+                  place_of_birth='Frankfurt am Main, Germany', date_first_appearance='1982')
+
+
+def enriched_movies() -> pd.DataFrame:
+    return pd.DataFrame({
+        'tmdb_id': [11, 12, 13],
+        'name': ['Star Wars', 'Inception', 'Silent Movie'],
+        'release_date': ['1977', '2010', '1976'],
+        'box_office_revenue': [775e6, 836e6, np.nan],
+        'countries': [['United States of America'], ['United States of America', 'United Kingdom'], []],
+        'genres': [['Science Fiction'], ['Thriller', 'Science Fiction'], ['Comedy']],
+        'composers': [[WILLIAMS], [ZIMMER, WILLIAMS], np.nan],
+        'tmdb_title': ['Star Wars', 'Inception', 'Silent Movie'],
+    })
+
+
+def test_tables_are_written_with_their_schema(tmp_path):
+    path = str(tmp_path)
+    storage.save_movies(enriched_movies(), path)
+
+    for table in ['movie', 'composer', 'movie_composer']:
+        assert pq.read_schema(tmp_path / f'{table}.parquet').remove_metadata() == storage.SCHEMAS[table]
+    # The columns outside of the schema are not stored
+    assert 'tmdb_title' not in storage.load_table('movie', path=path).columns
+    assert storage.table_exists('movie', path) and not storage.table_exists('track', path)
+
+
+def test_movies_with_composers_round_trip(tmp_path):
+    path = str(tmp_path)
+    movies = enriched_movies()
+    storage.save_movies(movies, path)
+
+    loaded = storage.load_movies_with_composers(path=path)
+    pd.testing.assert_frame_equal(loaded.drop(columns=['composers', 'countries', 'genres']),
+                                  movies.drop(columns=['composers', 'countries', 'genres', 'tmdb_title']),
+                                  check_dtype=False)
+    assert [list(values) for values in loaded['genres']] == movies['genres'].tolist()
+    assert [list(map(astuple, composers)) for composers in loaded['composers'][:2]] == \
+           [list(map(astuple, composers)) for composers in movies['composers'][:2]]
+    assert pd.isna(loaded['composers'][2])
+
+    assert storage.load_table('composer', path=path)['id'].tolist() == [491, 947]
+
+
+def test_projection_and_filters(tmp_path):
+    path = str(tmp_path)
+    storage.save_movies(enriched_movies(), path)
+
+    loaded = storage.load_movies_with_composers(['name'], filters=[('release_date', '>=', '2000')], path=path)
+    assert loaded.columns.tolist() == ['tmdb_id', 'name', 'composers']
+    assert loaded['name'].tolist() == ['Inception']
+
+
+def test_albums_and_tracks_round_trip(tmp_path):
+    path = str(tmp_path)
+    movie_albums = pd.DataFrame({
+        'movie_name': ['Star Wars', 'Inception'],
+        'release_date': ['1977', '2010'],
+        'movie_revenue': [775e6, 836e6],
+        'composer_name': ['John Williams', 'Hans Zimmer'],
+        'album_id': ['album1', 'album2'],
+        'track_ids': [['track2', 'track1'], []],
+    })
+    storage.save_movie_albums(movie_albums, path)
+    storage.save_album_tracks(movie_albums, path)
+
+    loaded = storage.load_movie_albums(with_track_ids=True, path=path)
+    assert loaded['track_ids'][0] == ['track2', 'track1']
+    # An album without any track has no row in album_track
+    assert pd.isna(loaded['track_ids'][1])
+
+    musics = [Music(id='track2', name='Main Title', genre=['soundtrack'], composer_id='artist1', popularity=70),
+              Music(id='track1', name='Cantina Band', genre=[], composer_id='artist1', popularity=55)]
+    storage.save_tracks(pd.DataFrame({'album_id': ['album1', 'album1', 'album2'],
+                                      'track': musics + [np.nan]}), path)
+
+    tracks = storage.load_tracks(as_music=True, path=path)
+    assert tracks['album_id'].tolist() == ['album1', 'album1']
+    assert tracks['track_ids'].tolist() == ['track2', 'track1']
+    assert list(map(astuple, tracks['track'])) == list(map(astuple, musics))
+
+
+def test_legacy_pickles_are_converted(tmp_path):
+    dataset_path, path = tmp_path / 'dataset', str(tmp_path / 'parquet')
+    dataset_path.mkdir()
+    enriched_movies().to_pickle(dataset_path / 'clean_enrich_movies.pickle')
+
+    storage.convert_legacy_pickles(str(dataset_path), path)
+
+    assert storage.load_table('movie', columns=['tmdb_id'], path=path)['tmdb_id'].tolist() == [11, 12, 13]
+    assert storage.load_table('movie_composer', path=path)[['tmdb_id', 'composer_id', 'position']].values.tolist() == \
+           [[11, 491, 0], [12, 947, 0], [12, 491, 1]]
+    assert not storage.table_exists('track', path)
@@ -0,0 +1,92 @@
+import asyncio
+from functools import partial
+
+import pandas as pd
+
+import enrich_with_spotify_data
+import storage
+from enrich_with_spotify_data import TRACK_IDS_STAGE, get_track_ids_into_df
+from loader_utils.work_ledger import WorkLedger
+
+
+def test_failed_and_new_keys_are_pending_after_a_restart(tmp_path):
+    path = str(tmp_path / 'work_ledger.sqlite')
+    with WorkLedger(path) as ledger:
+        assert ledger.pending('stage', ['a', 'b', 'c', 'a']) == ['a', 'b', 'c']
+        ledger.record_done('stage', [('a', {'id': 1}), ('b', None)])
+        ledger.record_failed('stage', ['c'], RuntimeError('503'))
+
+    with WorkLedger(path) as ledger:
+        assert ledger.pending('stage', ['a', 'b', 'c', 'd']) == ['c', 'd']
+        assert ledger.pending('stage') == ['c', 'd']
+        assert ledger.results('stage') == {'a': {'id': 1}, 'b': None}
+        assert ledger.counts('stage') == {'done': 2, 'failed': 1, 'pending': 1}
+        # The stages are independent
+        assert ledger.pending('other', ['a']) == ['a']
+
+
+class FakeSpotifyDataLoader:
+    """Stand-in for SpotifyDataLoader returning two track ids per album, and failing the batches of broken albums"""
+    requested = []
+    broken = set()
+
+    def __init__(self, **kwargs):
+        pass
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        pass
+
+    async def get_albums_tracks_async(self, album_ids: list[str]) -> list[list[str]]:
+        self.requested.extend(album_ids)
+        if self.broken.intersection(album_ids):
+            raise RuntimeError('503')
+        return [[f'{album_id}_1', f'{album_id}_2'] for album_id in album_ids]
+
+
+def test_track_ids_stage_resumes_without_requesting_the_done_albums(tmp_path, monkeypatch):
+    monkeypatch.setattr(enrich_with_spotify_data, 'SpotifyDataLoader', FakeSpotifyDataLoader)
+    monkeypatch.setattr(enrich_with_spotify_data, 'BATCH_SIZE', 2)
+    monkeypatch.setattr(enrich_with_spotify_data, 'save_album_tracks',
+                        partial(storage.save_album_tracks, path=str(tmp_path)))
+    movie_albums = pd.DataFrame({'movie_name': ['m1', 'm2', 'm3', 'm4'], 'album_id': ['a1', 'a2', 'a3', None]})
+    path = str(tmp_path / 'work_ledger.sqlite')
+
+    FakeSpotifyDataLoader.requested, FakeSpotifyDataLoader.broken = [], {'a3'}
+    with WorkLedger(path) as ledger:
+        result = asyncio.run(get_track_ids_into_df(movie_albums, ledger))
+    assert result['track_ids'][:2].tolist() == [['a1_1', 'a1_2'], ['a2_1', 'a2_2']]
+    assert result['track_ids'][2:].isna().all()
+
+    FakeSpotifyDataLoader.requested, FakeSpotifyDataLoader.broken = [], set()
+    with WorkLedger(path) as ledger:
+        result = asyncio.run(get_track_ids_into_df(movie_albums, ledger))
+        assert ledger.counts(TRACK_IDS_STAGE) == {'done': 3}
+    assert FakeSpotifyDataLoader.requested == ['a3']
+    assert result['track_ids'][2] == ['a3_1', 'a3_2']
+
+
+def test_ledger_is_seeded_from_the_tables_of_a_previous_run(tmp_path, monkeypatch):
+    path = str(tmp_path)
+    for name in ['table_exists', 'load_table', 'load_movie_albums', 'load_tracks']:
+        monkeypatch.setattr(enrich_with_spotify_data, name, partial(getattr(storage, name), path=path))
+
+    movie_albums = pd.DataFrame({
+        'movie_name': ['m1', 'm2', 'm3'],
+        'release_date': ['2000', '2001', '2002'],
+        'movie_revenue': [1.0, 2.0, 3.0],
+        'composer_name': ['c1', 'c2', 'c3'],
+        'album_id': ['a1', 'a2', None],
+        'track_ids': [['t1', 't2'], [], None],
+    })
+    storage.save_movie_albums(movie_albums, path)
+    storage.save_album_tracks(movie_albums, path)
+
+    with WorkLedger() as ledger:
+        enrich_with_spotify_data._seed_ledger_from_tables(ledger)
+        # The album without any track is done too, and is not requested again
+        assert ledger.results(TRACK_IDS_STAGE) == {'a1': ['t1', 't2'], 'a2': []}
+        assert ledger.pending(TRACK_IDS_STAGE, ['a1', 'a2']) == []
+        assert ledger.results(enrich_with_spotify_data.ALBUM_STAGE) == {'m1\tc1': 'a1', 'm2\tc2': 'a2', 'm3\tc3': None}
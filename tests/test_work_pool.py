@@ -0,0 +1,101 @@
+import asyncio
+
+import pytest
+
+from loader_utils.work_pool import WorkPool
+
+
+def test_results_are_yielded_in_completion_order_with_their_key():
+    async def run() -> list:
+        async def wait(delay):
+            await asyncio.sleep(delay)
+            return delay * 10
+
+        items = [('slow', 0.05), ('fast', 0.0), ('medium', 0.02)]
+        return [(work.key, work.arg, work.result) async for work in WorkPool(max_in_flight=3).stream(wait, items)]
+
+    assert asyncio.run(run()) == [('fast', 0.0, 0.0), ('medium', 0.02, 0.2), ('slow', 0.05, 0.5)]
+
+
+def test_in_flight_items_are_bounded_and_pulled_lazily():
+    async def run() -> tuple[int, int]:
+        in_flight, peak = 0, 0
+        pulled = 0
+
+        def items():
+            nonlocal pulled
+            for i in range(20):
+                pulled += 1
+                yield i, i
+
+        async def process(arg):
+            nonlocal in_flight, peak
+            in_flight += 1
+            peak = max(peak, in_flight)
+            await asyncio.sleep(0.001)
+            in_flight -= 1
+            return arg
+
+        pool = WorkPool(max_in_flight=4)
+        pulled_at_first_result = None
+        results = []
+        async for work in pool.stream(process, items()):
+            if pulled_at_first_result is None:
+                pulled_at_first_result = pulled
+            results.append(work.result)
+        assert sorted(results) == list(range(20))
+        return peak, pulled_at_first_result
+
+    peak, pulled_at_first_result = asyncio.run(run())
+    assert peak == 4
+    # Only the items in flight, and the ones refilling the pool, are pulled before the first result
+    assert pulled_at_first_result <= 8
+
+
+def test_failures_are_yielded_without_stopping_the_other_items():
+    async def run() -> dict:
+        async def process(arg):
+            if arg == 2:
+                raise ValueError('bad item')
+            return arg
+
+        return {work.key: work async for work in WorkPool(max_in_flight=2).stream(process, ((i, i) for i in range(4)))}
+
+    works = asyncio.run(run())
+    assert [works[i].result for i in [0, 1, 3]] == [0, 1, 3]
+    assert isinstance(works[2].error, ValueError)
+    assert works[2].result is None and works[2].attempts == 1
+
+
+def test_stopping_early_cancels_the_items_in_flight():
+    async def run() -> list:
+        cancelled = []
+
+        async def process(arg):
+            try:
+                await asyncio.sleep(0 if arg == 0 else 10)
+            except asyncio.CancelledError:
+                cancelled.append(arg)
+                raise
+            return arg
+
+        stream = WorkPool(max_in_flight=3).stream(process, ((i, i) for i in range(3)))
+        async for _ in stream:
+            break
+        await stream.aclose()
+        await asyncio.sleep(0)
+        return cancelled
+
+    assert sorted(asyncio.run(run())) == [1, 2]
+
+
+def test_map_returns_every_result_or_raises_the_first_error():
+    async def double(arg):
+        if arg < 0:
+            raise ValueError(arg)
+        return arg * 2
+
+    pool = WorkPool(max_in_flight=2)
+    assert asyncio.run(pool.map(double, ((i, i) for i in range(5)))) == {i: i * 2 for i in range(5)}
+    with pytest.raises(ValueError):
+        asyncio.run(pool.map(double, [('a', 1), ('b', -1)]))
@@ -1,10 +1,12 @@
 from dataclasses import dataclass
 
+from records import restore_record_state
 
-@dataclass
+
+@dataclass(frozen=True, slots=True)
 class Composer:
     """
-    Data class that represent a composer
+    Immutable and slotted (without a per instance __dict__) data class that represent a composer
     """
     id: str
     name: str
@@ -16,6 +18,9 @@ class Composer:
     # First appearance of composer in movie credits
     date_first_appearance: str = None
 
+    # Also loads the composers pickled before they were slotted
+    __setstate__ = restore_record_state
+
     def __hash__(self):
         return hash(self.id) ^ hash(self.name)
 
@@ -1,7 +1,9 @@
-import asyncio
 import datetime
+import re
 import urllib.parse
+from contextlib import aclosing
 from datetime import datetime
+from typing import AsyncIterator, Iterable
 
 import aiohttp
 import numpy as np
@@ -9,8 +11,23 @@ import pandas
 from requests.exceptions import HTTPError
 
 from config import config
+from loader_utils.coalescer import RequestCoalescer
+from loader_utils.metrics import LoaderMetrics
+from loader_utils.response_cache import CacheMissError, ResponseCache
+from loader_utils.retry import FailedRequest, RetryPolicy
+from loader_utils.work_pool import WorkPool, WorkResult
 from tmdb.Composer import Composer
-from rapidfuzz import fuzz
+from rapidfuzz import fuzz, process
+
+# Time to live of the cached responses per endpoint class. Search results may change when new movies are added to
+# tmdb, while credits and people are mostly stable
+DAY = 24 * 60 * 60
+CACHE_TTL = {
+    'search': 7 * DAY,
+    'movie': 30 * DAY,
+    'credits': 90 * DAY,
+    'person': 30 * DAY,
+}
 
 
 class TMDBDataLoader:
@@ -25,9 +42,22 @@ class TMDBDataLoader:
             ...
     """
 
-    def __init__(self, debug=True):
+    def __init__(self, debug=True, cache: ResponseCache = None, max_in_flight: int = 50,
+                 retry_policy: RetryPolicy = RetryPolicy(), base_url: str = "https://api.themoviedb.org/3",
+                 metrics: LoaderMetrics = None):
+        """
+        Parameters
+        ----------
+        debug: Whether to print the progress of the requests
+        cache: Optional on-disk response cache. If given in read-only mode, every request is replayed from the cache
+        and the network is never used
+        max_in_flight: Maximum number of requests in flight at the same time
+        retry_policy: Decides which failed requests are retried, and after how long
+        base_url: Root url of the tmdb API, e.g. to target a local stand-in server
+        metrics: Metrics recording the requests, possibly shared with other loaders. A new one by default
+        """
         # Create special connector to limit number of connection per host
-        self._tcp_connector = aiohttp.TCPConnector(limit_per_host=50)
+        self._tcp_connector = aiohttp.TCPConnector(limit_per_host=max_in_flight)
         # Create header to use with the session
         self._header = headers = {"accept": "application/json",
                                   "Authorization": f"Bearer {config['TMDB_BEARER_TOKEN']}"}
@@ -37,10 +67,27 @@ class TMDBDataLoader:
         # create the session
         self._session = aiohttp.ClientSession(headers=headers, connector=self._tcp_connector, timeout=timeout)
 
-        self._base_url = "https://api.themoviedb.org/3"
+        self._base_url = base_url
 
         self._debug = debug
 
+        self._cache = cache
+
+        # Deduplicate concurrent requests for the same url
+        self._coalescer = RequestCoalescer()
+
+        # Stream the requests with a bounded number in flight, instead of gathering all of them at once, and retry
+        # each failed request on its own
+        self._pool = WorkPool(max_in_flight=max_in_flight, retry_policy=retry_policy)
+
+        # Requests that still failed after all their attempts
+        self.dead_letters: list[FailedRequest] = []
+
+        self.metrics = metrics if metrics is not None else LoaderMetrics('tmdb')
+
+    # Number of search responses matched together against the expected titles
+    _MATCHING_BLOCK_SIZE = 1000
+
     async def __aenter__(self):
         """ Method called when entering the 'async with' block
 
@@ -70,31 +117,90 @@ class TMDBDataLoader:
         ------
         Result of the request
         """
+        endpoint = self._endpoint_class(url)
+        if self._cache is not None:
+            # Raises a CacheMissError in offline replay mode, so that the network is never touched
+            cached = self._cache.get(url, endpoint)
+            if cached is not None:
+                self.metrics.cache_hit(endpoint)
+                return cached
+            self.metrics.cache_miss(endpoint)
 
         try:
-            async with self._session.get(url) as response:
-                response.raise_for_status()
-                response = await response.json()
-                if self._debug and request_nb % 1000 == 0:
-                    print(f'{request_descr} - nb: {request_nb} - completed.')
-                return response
+            with self.metrics.track(endpoint) as request:
+                async with self._session.get(url) as response:
+                    request.status = response.status
+                    response.raise_for_status()
+                    request.nb_bytes = len(await response.read())
+                    response = await response.json()
+            if self._debug and request_nb % 1000 == 0:
+                print(f'{request_descr} - nb: {request_nb} - completed.')
+            if self._cache is not None:
+                self._cache.set(url, endpoint, response)
+            return response
         except HTTPError as e:
             print(f'Error while performing request: {e}')
             raise e
 
     @staticmethod
-    async def _async_sync_result(ret):
-        """ Helper function to simulate an asynchron function
+    def _endpoint_class(url: str) -> str:
+        """Classify the url into the endpoint class used to choose the time to live of its cached response
 
-        Parameter
-        ---------
-        ret: the parameter to return
+        Parameters
+        ----------
+        url: the url of the request
 
-        Return
+        Returns
+        -------
+        One of 'search', 'credits', 'movie', 'person' or 'other'
+        """
+        path = urllib.parse.urlsplit(url).path
+        if '/search/' in path:
+            return 'search'
+        if re.search(r'/movie/\d+/credits$', path):
+            return 'credits'
+        if re.search(r'/movie/\d+$', path):
+            return 'movie'
+        if re.search(r'/person/\d+$', path):
+            return 'person'
+        return 'other'
+
+    async def _stream_requests(self, requests: Iterable[tuple[int, str, int]], request_descr: str) \
+            -> AsyncIterator[WorkResult]:
+        """Perform the requests with a bounded number in flight, and yield their results in completion order.
+        Concurrent requests for the same url are coalesced into a single one. A request that still fails after all
+        its attempts is recorded in the dead letters and yielded with its error, without stopping the others, except
+        for a response missing from the cache in offline replay mode: replaying an incomplete cache would silently
+        degrade the dataset, so its CacheMissError is raised and the requests still in flight are cancelled
+
+        Parameters
+        ----------
+        requests: Iterable of (key, url, request_nb) tuples, where key identifies the request in the results
+        request_descr: A quick description of the requests, to have a context in the debug print
+
+        Returns
+        -------
+        An async iterator of WorkResult, whose result is the JSON response of the request
+
+        Raises
         ------
-        The ret parameter
+        CacheMissError if a response is not cached while the cache is in offline replay mode
         """
-        return ret
+        items = ((key, (url, request_nb)) for key, url, request_nb in requests)
+
+        works = self._pool.stream(
+            lambda url_nb: self._coalescer.run(
+                url_nb[0], lambda: self._perform_async_request(url_nb[0], url_nb[1], request_descr)),
+            items)
+        async with aclosing(works):
+            async for work in works:
+                self.metrics.retried(self._endpoint_class(work.arg[0]), work.attempts - 1)
+                if isinstance(work.error, CacheMissError):
+                    raise work.error
+                if work.error is not None:
+                    print(f'{request_descr} - key: {work.key} - failed after {work.attempts} attempts: {work.error}')
+                    self.dead_letters.append(FailedRequest(work.arg[0], request_descr, work.error, work.attempts))
+                yield work
 
     async def _search_all_movie_ids(self, urls: pandas.Series) -> (list[int], list[str]):
         """Search for all movies ids given the received urls.
@@ -110,68 +216,114 @@ class TMDBDataLoader:
         The list of movie ids along with the title of the found movie, duplicate element
         """
 
-        ids_requests_name_year = [(self._perform_async_request(url, int(idx), 'request movie id'), name, year)
-                                  for idx, (url, name, year) in urls.items()]
-
-        urls, names, years = zip(*ids_requests_name_year)
+        id_results = np.full(len(urls), -1)
+        name_results = np.full(len(urls), 'NOT_FOUND', dtype=object)
 
-        ids_responses = await asyncio.gather(*urls)
+        requests = ((pos, url, int(idx)) for pos, (idx, (url, _, _)) in enumerate(urls.items()))
 
-        results = map(lambda response: response['results'], ids_responses)
+        def match(keys: list[int], results: list[list[dict]]):
+            ids, names = self._get_best_match_movie_id(
+                zip(results, (urls.iloc[key][1] for key in keys), (urls.iloc[key][2] for key in keys)))
+            id_results[keys] = ids
+            name_results[keys] = names
 
-        results_name = zip(results, names, years)
+        # Match the responses by blocks as they arrive, so that only a block of responses is kept in memory
+        keys, results = [], []
+        async for work in self._stream_requests(requests, 'request movie id'):
+            if work.error is None:
+                keys.append(work.key)
+                results.append(work.result['results'])
+            if len(keys) >= self._MATCHING_BLOCK_SIZE:
+                match(keys, results)
+                keys, results = [], []
+        if keys:
+            match(keys, results)
 
-        return self._get_best_match_movie_id(results_name)  # [res[0]['id'] if res else -1 for res in results]
+        return list(id_results), list(name_results)
 
     @staticmethod
-    def _get_best_match_movie_id(results_with_expected_name: zip) -> tuple[list, list]:
+    def _get_best_match_movie_id(results_with_expected_name: Iterable) -> tuple[np.ndarray, np.ndarray]:
         """
         Return the list of movie ids along with a list of their names found on tmdb. The name will be useful
         later if there is still some duplicated id, we can filter out the name that are further away from the movie
         title we had
 
+        The titles are lowercased once, then every (expected title, candidate title) pair of the whole batch is scored
+        in a single parallel rapidfuzz call, and the best candidate of each movie is selected with numpy.
+
         Parameters
         ----------
-        results_with_expected_name: a zip containing the request, the name of the movie from the dataframe, and the
-        year of the movie from the dataframe as well
+        results_with_expected_name: an iterable (e.g. a zip) containing the request, the name of the movie from the
+        dataframe, and the year of the movie from the dataframe as well
 
         Returns
         -------
-        A tuple containing the list of movie ids found and a list of the movie names coming from tmdb
+        A tuple containing the array of movie ids found and the array of the movie names coming from tmdb
         """
-        id_results = []
-        name_results = []
+        candidate_ids = []
+        candidate_titles = []
+        candidate_dates = []
+        titles = []
+        years = []
+        sizes = []
 
         for movies, title, year in results_with_expected_name:
-            if movies:
-                movies_titles = [movie['title'] for movie in movies]  # append all title
-                # Need original title, as some movies are given with original title and some not
-                movies_titles += [movie['original_title'] for movie in movies]  # append all original titles
-                comparison_ratio = [fuzz.ratio(t.lower(), title.lower()) for t in movies_titles]
-
-                # As we now concatenate title with original_title, we have to duplicate the movies list as well
-                movies += movies
-                max_ratio = np.argmax(comparison_ratio)
-                max_ratio_occurrences = np.where(np.array(comparison_ratio) == comparison_ratio[max_ratio])[0]
-                if len(max_ratio_occurrences) > 1:
-                    movies_subset = np.array(movies)[max_ratio_occurrences]
-                    # If same ratio occurs more than once, check year to choose
-                    matching_years = [year in movie['release_date'] for movie in movies_subset]
-                    date_occurrence = np.where(np.array(matching_years))[0]
-                    if len(date_occurrence) > 0:
-                        # take the first date occurrence
-                        id_results.append(movies_subset[date_occurrence[0]]['id'])
-                        name_results.append(movies_titles[date_occurrence[0]])
-                    else:
-                        # If the year did not match any movies then append -1
-                        id_results.append(-1)
-                        name_results.append('NOT_FOUND')
-                else:
-                    id_results.append(movies[max_ratio]['id'])
-                    name_results.append(movies_titles[max_ratio])
-            else:
-                id_results.append(-1)
-                name_results.append('NOT_FOUND')
+            # Need original title, as some movies are given with original title and some not, so each movie is a
+            # candidate twice: once with its title, once with its original title
+            candidate_titles += [movie['title'] for movie in movies]
+            candidate_titles += [movie['original_title'] for movie in movies]
+            candidate_ids += [movie['id'] for movie in movies] * 2
+            candidate_dates += [movie['release_date'] or '' for movie in movies] * 2
+            titles.append(title)
+            years.append(str(year))
+            sizes.append(2 * len(movies))
+
+        sizes = np.array(sizes, dtype=int)
+        id_results = np.full(len(sizes), -1)
+        name_results = np.full(len(sizes), 'NOT_FOUND', dtype=object)
+
+        if not candidate_titles:
+            return id_results, name_results
+
+        candidate_titles = np.array(candidate_titles, dtype=object)
+
+        # Each expected title is compared to the candidates of its own movie only
+        queries = np.repeat([title.lower() for title in titles], sizes)
+        comparison_ratio = process.cpdist(queries, [title.lower() for title in candidate_titles],
+                                          scorer=fuzz.ratio, workers=-1, dtype=np.float64)
+
+        # Index of the movie each candidate belongs to, and start of each non-empty group of candidates
+        found = sizes > 0
+        movie_idx = np.repeat(np.arange(len(sizes)), sizes)
+        starts = np.concatenate(([0], np.cumsum(sizes[found])[:-1]))
+
+        max_ratio = np.maximum.reduceat(comparison_ratio, starts)
+        is_max = comparison_ratio == np.repeat(max_ratio, sizes[found])
+        max_ratio_occurrences = np.add.reduceat(is_max, starts)
+
+        # If same ratio occurs more than once, check year to choose (only the candidates with the maximum ratio matter)
+        max_pos = np.flatnonzero(is_max)
+        is_max_same_year = np.zeros_like(is_max)
+        is_max_same_year[max_pos] = [years[movie_idx[pos]] in candidate_dates[pos] for pos in max_pos]
+
+        # Position of the first candidate with the maximum ratio of each movie, and of the first one with the maximum
+        # ratio and the expected year
+        found_idx = np.flatnonzero(found)
+        first_max = max_pos[np.unique(movie_idx[max_pos], return_index=True)[1]]
+        movie_same_year, first_same_year = np.unique(movie_idx[is_max_same_year], return_index=True)
+        first_same_year = np.flatnonzero(is_max_same_year)[first_same_year]
+
+        candidate_ids = np.array(candidate_ids)
+
+        # Unique maximum: take it
+        unique_max = max_ratio_occurrences == 1
+        id_results[found_idx[unique_max]] = candidate_ids[first_max[unique_max]]
+        name_results[found_idx[unique_max]] = candidate_titles[first_max[unique_max]]
+
+        # Tied maximum: take the first one released the expected year, otherwise leave it not found (-1)
+        tied_max = np.isin(movie_same_year, found_idx[max_ratio_occurrences > 1])
+        id_results[movie_same_year[tied_max]] = candidate_ids[first_same_year[tied_max]]
+        name_results[movie_same_year[tied_max]] = candidate_titles[first_same_year[tied_max]]
 
         return id_results, name_results
 
@@ -188,61 +340,66 @@ class TMDBDataLoader:
         The list of composers
         """
 
-        # request the cast to retrieve the ids of the composer
-        requests_cast = [self._perform_async_request(url, int(row_idx), 'request movie composer')
-                         if idx != -1 else self._async_sync_result([])
-                         for row_idx, (idx, url) in ids_urls.items()]
-
-        responses_cast = await asyncio.gather(*requests_cast)
+        list_composer_ids = [[] for _ in range(len(ids_urls))]
 
-        # map cast to only crew
-        crews = map(lambda res: res['crew'] if res else [], responses_cast)
-
-        # Extract composer id from crew
-        list_composer_ids = map(
-            lambda crew: [person['id'] for person in crew if person and 'composer' in person['job'].lower()],
-            crews)
-
-        # request the composer from his id
-        requests_composer = [self._search_all_composers(person_ids, idx)
-                             if person_ids else self._async_sync_result([])
-                             for idx, person_ids in enumerate(list_composer_ids)]
-
-        responses_composer = await asyncio.gather(*requests_composer)
-
-        # map empty list to nan values
-        composers_nan = map(lambda composers: composers if composers else np.nan, responses_composer)
+        # request the cast to retrieve the ids of the composer
+        requests_cast = ((pos, url, int(row_idx)) for pos, (row_idx, (idx, url)) in enumerate(ids_urls.items())
+                         if idx != -1)
+
+        async for work in self._stream_requests(requests_cast, 'request movie composer'):
+            if work.error is None and work.result:
+                # Extract composer id from crew
+                list_composer_ids[work.key] = [person['id'] for person in work.result['crew']
+                                               if person and 'composer' in person['job'].lower()]
+
+        # request each composer only once from his id, even if he composed the music of many movies
+        unique_composer_ids = list(dict.fromkeys(person_id for person_ids in list_composer_ids
+                                                 for person_id in person_ids))
+        composers_by_id = await self._search_all_composers(unique_composer_ids)
+
+        if self._debug:
+            nb_occurrences = sum(map(len, list_composer_ids))
+            print(f'request person details - {len(unique_composer_ids)} unique composers for {nb_occurrences} '
+                  f'occurrences in credits')
+
+        # fan the composers back out to the movies (skipping the ones whose request failed), and map empty list to
+        # nan values
+        list_composers = map(
+            lambda person_ids: [composers_by_id[person_id] for person_id in person_ids if person_id in composers_by_id],
+            list_composer_ids)
+        composers_nan = map(lambda composers: composers if composers else np.nan, list_composers)
 
         return list(composers_nan)
 
-    async def _search_all_composers(self, person_ids, idx) -> list[Composer]:
+    async def _search_all_composers(self, person_ids: list[int]) -> dict[int, Composer]:
         """
-        Helper function to query all the composers that appears in a movie
+        Helper function to query all the composers from their ids. Concurrent requests for the same person are
+        coalesced into a single request
 
         Parameters
         ----------
-        person_urls The list of url for the composers of the movie
-        idx: The list index of the movie we are currently processing
+        person_ids: The list of unique ids of the composers
 
         Returns
         -------
-        The list of composers
+        A dict mapping each composer id to its composer
         """
 
         # search for the compositors basics infos
-        person_urls = map(lambda composer_id:
-                          f'{self._base_url}/person/{composer_id}?append_to_response=movie_credits&language=en-US',
-                          person_ids)
-
-        request_person = [self._perform_async_request(url, idx, 'request person details') for url in person_urls]
-        responses_person = await asyncio.gather(*request_person)
+        person_urls = ((composer_id,
+                        f'{self._base_url}/person/{composer_id}?append_to_response=movie_credits&language=en-US',
+                        idx)
+                       for idx, composer_id in enumerate(person_ids))
 
-        composers = map(
-            lambda r: Composer(r['id'], r['name'], r['birthday'], r['gender'], r['homepage'], r['place_of_birth'],
-                               self._find_oldest_date_credits(r['movie_credits'])),
-            responses_person)
+        composers = {}
+        async for work in self._stream_requests(person_urls, 'request person details'):
+            if work.error is not None:
+                continue
+            r = work.result
+            composers[work.key] = Composer(r['id'], r['name'], r['birthday'], r['gender'], r['homepage'],
+                                           r['place_of_birth'], self._find_oldest_date_credits(r['movie_credits']))
 
-        return list(composers)
+        return composers
 
     @staticmethod
     def _find_oldest_date_credits(credit) -> str:
@@ -275,18 +432,18 @@ class TMDBDataLoader:
                 ------
                 A list of corresponding revenue
                 """
-        # perform the async request
-        movies_requests = [self._perform_async_request(url, int(row_idx), 'request movie revenue')
-                           if idx != -1 else self._async_sync_result({"revenue": 0})
-                           for row_idx, (idx, url) in urls.items()]
+        results = [np.nan] * len(urls)
 
-        movies_responses = await asyncio.gather(*movies_requests)
+        # perform the async request
+        movies_requests = ((pos, url, int(row_idx)) for pos, (row_idx, (idx, url)) in enumerate(urls.items())
+                           if idx != -1)
 
-        results = map(
-            lambda response: np.nan if response['revenue'] is not None and response['revenue'] == 0 else
-            response['revenue'], movies_responses)
+        async for work in self._stream_requests(movies_requests, 'request movie revenue'):
+            if work.error is None:
+                revenue = work.result['revenue']
+                results[work.key] = np.nan if revenue is not None and revenue == 0 else revenue
 
-        return list(results)
+        return results
 
     @staticmethod
     def _filter_dataset(df: pandas.DataFrame) -> pandas.DataFrame:
@@ -309,10 +466,16 @@ class TMDBDataLoader:
 
         duplicated_tmdb_id = result[result.tmdb_id.duplicated(keep=False)][['tmdb_id', 'name', 'tmdb_title']]
 
-        # Extract unique id for the name of the movie that has the highest similarity with the one found on tmdb
-        best_unique_id = duplicated_tmdb_id.groupby('tmdb_id').apply(lambda grouped_df: grouped_df.apply(
-            lambda row: fuzz.ratio(row['name'].lower(), row['tmdb_title'].lower()), axis='columns'
-        ).idxmax())
+        # Score the similarity of all the duplicated movies with the title found on tmdb in a single batched call
+        similarity = process.cpdist(duplicated_tmdb_id['name'].str.lower().tolist(),
+                                    duplicated_tmdb_id['tmdb_title'].str.lower().tolist(),
+                                    scorer=fuzz.ratio, workers=-1, dtype=np.float64)
+
+        # Extract unique id for the name of the movie that has the highest similarity with the one found on tmdb. The
+        # stable sort keeps the first movie in case of tie
+        best_unique_id = duplicated_tmdb_id.assign(similarity=similarity) \
+            .sort_values('similarity', ascending=False, kind='stable') \
+            .drop_duplicates(subset='tmdb_id').index
 
         # Drop the best unique id, so that only the one we don't want remains, so that we can remove them from
         # full complete dataframe
@@ -428,31 +591,27 @@ class TMDBDataLoader:
         # https://stackoverflow.com/questions/37619314/does-loc-a-b-assignment-allow-to-change-the-dtype-of-the-columns
         res = res.astype({'tmdb_title': 'object'})
 
-        # chunked the dataframe querying to retry chunk upon failure
+        # chunked the dataframe querying. Failed requests are retried one by one, and the ones that still fail are
+        # recorded in the dead letters, so a chunk never has to be re-run
         for start, end, df_chunk in self._generate_df_chunk(df, chunk_size):
-            retry = True
-            while retry:
-                try:
-                    # Fetch and append tmdb_id to the df (not filter yet as we need to keep consistent index in df)
-                    df_chunk = await self.append_tmdb_movie_ids(df_chunk, False)
+            # Fetch and append tmdb_id to the df (not filter yet as we need to keep consistent index in df)
+            df_chunk = await self.append_tmdb_movie_ids(df_chunk, False)
 
-                    # add tmdb_id to res
-                    res.iloc[start:end].loc[:, ['tmdb_id', 'tmdb_title']] = df_chunk[['tmdb_id', 'tmdb_title']]
+            # add tmdb_id to res
+            res.iloc[start:end].loc[:, ['tmdb_id', 'tmdb_title']] = df_chunk[['tmdb_id', 'tmdb_title']]
 
-                    # Creates url to fetch all movies composers in credits
-                    movies_ids_urls = df_chunk.tmdb_id.apply(
-                        lambda idx: (idx, f'{self._base_url}/movie/{idx}?language=en-US'))
+            # Creates url to fetch all movies composers in credits
+            movies_ids_urls = df_chunk.tmdb_id.apply(
+                lambda idx: (idx, f'{self._base_url}/movie/{idx}?language=en-US'))
 
-                    # Performs requests
-                    results = await self._search_all_movie_revenue(movies_ids_urls)
+            # Performs requests
+            results = await self._search_all_movie_revenue(movies_ids_urls)
 
-                    # Append the revenue to the dataframe
-                    res.iloc[start:end].loc[:, 'tmdb_revenue'] = results
+            # Append the revenue to the dataframe
+            res.iloc[start:end].loc[:, 'tmdb_revenue'] = results
 
-                    # if everything ok, go out of while
-                    retry = False
-                except Exception as e:
-                    print(f'Received error: {e}, retry for block {start} - {end}')
+        if self.dead_letters:
+            print(f'{len(self.dead_letters)} requests failed permanently, see the dead letters')
 
         if filter_dataset:
             res = self._filter_dataset(res)